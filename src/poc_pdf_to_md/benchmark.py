@@ -0,0 +1,155 @@
+"""Small benchmarks for tuning Phase 1 / Phase 2 settings.
+
+Usage:
+    python -m poc_pdf_to_md.benchmark formats --input <pdf> [--pages 20] [--quality 85]
+    python -m poc_pdf_to_md.benchmark client-setup [--calls 20]
+"""
+
+import argparse
+import importlib.util
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from . import gemini_client
+from .pdf_parser import PAGE_IMAGE_FORMATS, encode_pixmap, open_pdf, render_page_pixmap
+
+
+def benchmark_page_formats(
+    pdf_path: str,
+    formats: Sequence[str],
+    quality: int = 85,
+    max_pages: Optional[int] = None,
+    zoom: float = 2.0,
+) -> List[Dict[str, Any]]:
+    """Encode the same rendered pages in each format and report size and encode time.
+
+    Each page is rendered once; only encoding is timed.
+
+    Returns:
+        One row per format: format, pages, bytes_per_page, encode_ms_per_page
+    """
+    totals: Dict[str, Dict[str, float]] = {fmt: {"bytes": 0.0, "sec": 0.0} for fmt in formats}
+    doc = open_pdf(pdf_path)
+    try:
+        page_count = len(doc) if max_pages is None else min(len(doc), max_pages)
+        for page_index in range(page_count):
+            pix = render_page_pixmap(doc[page_index], zoom)
+            for fmt in formats:
+                t0 = time.perf_counter()
+                image_bytes, _ = encode_pixmap(pix, zoom, image_format=fmt, quality=quality)
+                totals[fmt]["sec"] += time.perf_counter() - t0
+                totals[fmt]["bytes"] += len(image_bytes)
+    finally:
+        doc.close()
+
+    rows: List[Dict[str, Any]] = []
+    for fmt in formats:
+        pages = max(page_count, 1)
+        rows.append(
+            {
+                "format": fmt,
+                "pages": page_count,
+                "bytes_per_page": int(totals[fmt]["bytes"] / pages),
+                "encode_ms_per_page": round(totals[fmt]["sec"] * 1000 / pages, 2),
+            }
+        )
+    return rows
+
+
+def benchmark_client_setup(calls: int = 20) -> List[Dict[str, Any]]:
+    """Time the per-request Gemini client setup, per-page client vs pooled client.
+
+    Only local setup (.env parsing, client and HTTP pool construction) is
+    timed; no request is sent. The per-page row also pays a new TLS/HTTP
+    connection on every real request, which the pooled client reuses.
+
+    Returns:
+        One row per mode: mode, calls, setup_ms_per_call
+    """
+    # Setup does not contact the API; any key builds a client.
+    api_key = gemini_client._get_api_key() or "benchmark"  # pylint: disable=protected-access
+    limits = gemini_client._http_pool_limits()  # pylint: disable=protected-access
+    timings: Dict[str, float] = {}
+
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        # Previous behaviour: parse .env and build a new client for every page
+        gemini_client.load_dotenv()
+        gemini_client.create_client(api_key, *limits)
+    timings["per_page"] = time.perf_counter() - t0
+
+    gemini_client.reset_client()
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        gemini_client.get_client(api_key)
+    timings["pooled"] = time.perf_counter() - t0
+    gemini_client.reset_client()
+
+    return [
+        {"mode": mode, "calls": calls, "setup_ms_per_call": round(sec * 1000 / calls, 3)}
+        for mode, sec in timings.items()
+    ]
+
+
+def _default_formats() -> List[str]:
+    formats = ["png", "jpeg"]
+    if importlib.util.find_spec("PIL") is not None:
+        formats.append("webp")
+    return formats
+
+
+def _print_rows(rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        return
+    headers = list(rows[0].keys())
+    widths = [max(len(h), *(len(str(r[h])) for r in rows)) for h in headers]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(row[h]).ljust(w) for h, w in zip(headers, widths)))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Entry point for `python -m poc_pdf_to_md.benchmark`."""
+    parser = argparse.ArgumentParser(description="poc-pdf-to-md benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    formats_parser = sub.add_parser("formats", help="Page image bytes/encode time per format")
+    formats_parser.add_argument("--input", required=True, help="PDF file path")
+    formats_parser.add_argument("--pages", type=int, default=None, help="Only the first N pages")
+    formats_parser.add_argument("--quality", type=int, default=85, help="JPEG/WebP quality")
+    formats_parser.add_argument("--zoom", type=float, default=2.0, help="Render zoom")
+    formats_parser.add_argument(
+        "--formats",
+        default=None,
+        help=f"Comma-separated formats from {','.join(PAGE_IMAGE_FORMATS)} "
+        "(default: png,jpeg, plus webp when Pillow is installed)",
+    )
+
+    client_parser = sub.add_parser(
+        "client-setup", help="Gemini client setup time, per-page vs pooled"
+    )
+    client_parser.add_argument("--calls", type=int, default=20, help="Setups to time per mode")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "client-setup":
+        _print_rows(benchmark_client_setup(max(args.calls, 1)))
+
+    if args.command == "formats":
+        if args.formats:
+            formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+        else:
+            formats = _default_formats()
+        try:
+            rows = benchmark_page_formats(
+                args.input, formats, quality=args.quality, max_pages=args.pages, zoom=args.zoom
+            )
+        except (RuntimeError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        _print_rows(rows)
+
+
+if __name__ == "__main__":
+    main()
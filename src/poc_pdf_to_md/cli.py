@@ -7,7 +7,21 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
-from .engine import phase1_parse_pdf, convert_to_markdown
+from .engine import (
+    PHASE2_ENGINES,
+    PHASE2_ERROR_MODES,
+    convert_to_markdown,
+    merge_shards,
+    phase1_parse_pdf,
+)
+from .hedging import hedger_from_env
+from .image_handler import gc_image_store
+from .page_render import DEFAULT_BLANK_THRESHOLD, RenderOptions
+from .pdf_parser import PAGE_IMAGE_FORMATS, ImageFilter, PdfSource, require_pillow
+from .prompt_cache import prompt_cache_from_env
+from .prompt_compaction import DEFAULT_PROMPT_JSON_MODE, PROMPT_JSON_MODES
+from .response_cache import response_cache_from_env
+from .shard import parse_shard
 
 # Load environment variables from .env file
 load_dotenv()
@@ -23,7 +37,8 @@ def parse_args() -> argparse.Namespace:
         type=str,
         required=False,
         default=None,
-        help="PDF file path (required unless --from-parse is provided)",
+        help="PDF file path, or - to read the PDF from stdin "
+        "(required unless --from-parse is provided)",
     )
     parser.add_argument(
         "--output",
@@ -60,9 +75,222 @@ def parse_args() -> argparse.Namespace:
         default=False,
         help="Overwrite existing files in output directory (default: False, AI development should enable this)",
     )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=1,
+        help="Phase 1 page render processes (default: 1, 0 = one per CPU core)",
+    )
+    parser.add_argument(
+        "--target-pixels",
+        type=int,
+        default=None,
+        help="Per-page pixel budget for page images; zoom is chosen per page "
+        "(default: fixed zoom 2.0)",
+    )
+    parser.add_argument(
+        "--snap-tile",
+        type=int,
+        default=None,
+        help="Snap the longer page image side to a multiple of this tile size in px "
+        "(requires --target-pixels)",
+    )
+    parser.add_argument(
+        "--page-image-format",
+        choices=sorted(PAGE_IMAGE_FORMATS),
+        default="png",
+        help="Page image encoding for Phase 1 "
+        "(default: png; webp requires the images extra / Pillow)",
+    )
+    parser.add_argument(
+        "--page-image-quality",
+        type=int,
+        default=85,
+        help="JPEG/WebP page image quality 1-100 (default: 85)",
+    )
+    parser.add_argument(
+        "--color-mode",
+        choices=["rgb", "gray", "auto"],
+        default="rgb",
+        help="Page image colorspace; auto renders monochrome pages as gray/1-bit, "
+        "1-bit PNG requires Pillow (default: rgb)",
+    )
+    parser.add_argument(
+        "--image-filter",
+        action="store_true",
+        help="Skip tiny/decorative embedded images before extraction, per the --image-* thresholds",
+    )
+    parser.add_argument(
+        "--image-min-area",
+        type=float,
+        default=ImageFilter.min_area,
+        help="With --image-filter, skip embedded images placed smaller than this many pt^2; "
+        f"0 disables (default: {ImageFilter.min_area:g})",
+    )
+    parser.add_argument(
+        "--image-min-pixels",
+        type=int,
+        default=ImageFilter.min_pixel_side,
+        help="With --image-filter, skip embedded images narrower or shorter than this many "
+        f"pixels; 0 disables (default: {ImageFilter.min_pixel_side})",
+    )
+    parser.add_argument(
+        "--image-max-aspect",
+        type=float,
+        default=ImageFilter.max_aspect,
+        help="With --image-filter, skip embedded images whose placed long/short side ratio "
+        f"exceeds this; 0 disables (default: {ImageFilter.max_aspect:g})",
+    )
+    parser.add_argument(
+        "--image-max-repeat-pages",
+        type=int,
+        default=ImageFilter.max_repeat_pages,
+        help="With --image-filter, skip embedded images placed on more than this many pages; "
+        "0 disables (default: 0)",
+    )
+    parser.add_argument(
+        "--blank-threshold",
+        type=float,
+        nargs="?",
+        const=DEFAULT_BLANK_THRESHOLD,
+        default=0.0,
+        help="Mark pages without text whose ink coverage (share of dark pixels) is at most this, "
+        "and 'intentionally left blank' pages, as blank; Phase 2 skips them without a model call. "
+        f"Without a value uses {DEFAULT_BLANK_THRESHOLD:g} (default: 0, disabled)",
+    )
+    parser.add_argument(
+        "--image-store",
+        type=str,
+        default=None,
+        help="Cross-run content-addressed blob store for embedded images (images/ gets hard links)",
+    )
+    parser.add_argument(
+        "--gc-image-store",
+        type=str,
+        default=None,
+        help="Remove unreferenced blobs from an image store and exit",
+    )
+    parser.add_argument(
+        "--pages",
+        type=str,
+        default=None,
+        help="1-based page ranges to process in either phase, e.g. 1-10,15,20- "
+        "(default: all pages)",
+    )
+    parser.add_argument(
+        "--shard",
+        type=str,
+        default=None,
+        help=(
+            "Process only shard i of N (0-based, e.g. 0/4) of the selected pages of the "
+            "whole document, in either phase; the same i/N selects the same pages in both"
+        ),
+    )
+    parser.add_argument(
+        "--merge",
+        type=str,
+        nargs="+",
+        default=None,
+        metavar="SHARD_DIR",
+        help="Merge shard output directories (parse results, images, Phase 2 pages) into --output",
+    )
+    parser.add_argument(
+        "--text-fast-path",
+        action="store_true",
+        help="Analyze page text layers in Phase 1 and, in Phase 2, convert clean text-layer "
+        "pages locally instead of sending them to the model",
+    )
+    parser.add_argument(
+        "--batch-pages",
+        type=int,
+        default=1,
+        help="Phase 2: send up to this many consecutive model pages per Gemini request "
+        "(default: 1, no batching)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Phase 2: stream Gemini responses into phase2/pages/*.partial as they arrive, "
+        "showing tokens received and time to first token",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Phase 2: duplicate requests still in flight past a latency percentile of "
+        "completed requests and keep the first response "
+        "(GEMINI_HEDGE_PERCENTILE / GEMINI_HEDGE_BUDGET)",
+    )
+    parser.add_argument(
+        "--prompt-json",
+        choices=list(PROMPT_JSON_MODES),
+        default=DEFAULT_PROMPT_JSON_MODE,
+        help="Phase 2: serialization of the page JSON appended to prompts: "
+        "full (indented, as parsed), compact or dedup (duplicates removed, bboxes rounded) "
+        f"(default: {DEFAULT_PROMPT_JSON_MODE})",
+    )
+    parser.add_argument(
+        "--phase2-engine",
+        choices=list(PHASE2_ENGINES),
+        default="threads",
+        help="Phase 2 request engine: threads (default) or asyncio "
+        "(async SDK client on one event loop, for very high GEMINI_CONCURRENCY)",
+    )
+    parser.add_argument(
+        "--on-error",
+        choices=list(PHASE2_ERROR_MODES),
+        default="fail-fast",
+        help="Phase 2 page failures: fail-fast (default) cancels pending pages and stops; "
+        "continue converts the rest, records failed pages in phase2/state.json and writes "
+        "a partial output",
+    )
+    parser.add_argument(
+        "--no-prompt-cache",
+        action="store_true",
+        help="Inline the prompt template in every Phase 2 request instead of sending it once as "
+        "Gemini cached content (also: GEMINI_PROMPT_CACHE=0)",
+    )
+    parser.add_argument(
+        "--no-response-cache",
+        action="store_true",
+        help="Do not look up or store Gemini responses in the persistent response cache "
+        "shared across runs and output directories (also: GEMINI_RESPONSE_CACHE=0)",
+    )
+    parser.add_argument(
+        "--mmap",
+        action="store_true",
+        help="Memory-map the --input PDF and open it as a stream",
+    )
 
     args = parser.parse_args()
 
+    # Standalone maintenance action: no input required
+    if args.gc_image_store:
+        if not Path(args.gc_image_store).is_dir():
+            print(f"Error: Image store not found: {args.gc_image_store}", file=sys.stderr)
+            sys.exit(1)
+        return args
+
+    if args.shard:
+        try:
+            args.shard = parse_shard(args.shard)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    # Merge mode: combines existing shard outputs, no input required
+    if args.merge:
+        if args.parse_only or args.from_parse:
+            print(
+                "Error: --merge cannot be used with --parse-only or --from-parse",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        for shard_dir in args.merge:
+            if not Path(shard_dir).is_dir():
+                print(f"Error: Shard directory not found: {shard_dir}", file=sys.stderr)
+                sys.exit(1)
+        return args
+
     # Validate mutual exclusivity
     if args.parse_only and args.from_parse:
         print(
@@ -71,6 +299,35 @@ def parse_args() -> argparse.Namespace:
         )
         sys.exit(1)
 
+    if args.render_workers < 0:
+        print("Error: --render-workers must be >= 0", file=sys.stderr)
+        sys.exit(1)
+
+    if args.batch_pages < 1:
+        print("Error: --batch-pages must be >= 1", file=sys.stderr)
+        sys.exit(1)
+
+    if args.target_pixels is not None and args.target_pixels <= 0:
+        print("Error: --target-pixels must be > 0", file=sys.stderr)
+        sys.exit(1)
+    if args.snap_tile is not None and (args.snap_tile <= 0 or args.target_pixels is None):
+        print("Error: --snap-tile must be > 0 and requires --target-pixels", file=sys.stderr)
+        sys.exit(1)
+
+    if not 1 <= args.page_image_quality <= 100:
+        print("Error: --page-image-quality must be between 1 and 100", file=sys.stderr)
+        sys.exit(1)
+
+    if not args.from_parse:
+        try:
+            if args.page_image_format == "webp":
+                require_pillow("WebP page images (--page-image-format webp)")
+            if args.color_mode == "auto" and args.page_image_format == "png":
+                require_pillow("1-bit page images (--color-mode auto)")
+        except RuntimeError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+
     # Validate input is provided and exists (only if not using --from-parse)
     if not args.from_parse:
         if not args.input:
@@ -81,10 +338,14 @@ def parse_args() -> argparse.Namespace:
             sys.exit(1)
 
         input_path = Path(args.input)
-        if not input_path.exists():
+        if args.input == "-":
+            if args.mmap:
+                print("Error: --mmap cannot be used with --input -", file=sys.stderr)
+                sys.exit(1)
+        elif not input_path.exists():
             print(f"Error: PDF file not found: {args.input}", file=sys.stderr)
             sys.exit(1)
-        if not input_path.is_file():
+        elif not input_path.is_file():
             print(f"Error: Input path is not a file: {args.input}", file=sys.stderr)
             sys.exit(1)
 
@@ -117,6 +378,34 @@ def get_model_name(args: argparse.Namespace) -> str:
     return "gemini-3-pro-preview"
 
 
+def get_render_options(args: argparse.Namespace) -> RenderOptions:
+    """Build Phase 1 page render settings from CLI arguments."""
+    return RenderOptions(
+        target_pixels=args.target_pixels,
+        tile_size=args.snap_tile,
+        image_format=args.page_image_format,
+        quality=args.page_image_quality,
+        color_mode=args.color_mode,
+        image_filter=ImageFilter(
+            min_area=args.image_min_area,
+            min_pixel_side=args.image_min_pixels,
+            max_aspect=args.image_max_aspect,
+            max_repeat_pages=args.image_max_repeat_pages,
+        )
+        if args.image_filter
+        else None,
+        blank_threshold=args.blank_threshold,
+        text_layer=args.text_fast_path,
+    )
+
+
+def get_pdf_source(args: argparse.Namespace) -> PdfSource:
+    """Return the Phase 1 input: a path, or the PDF bytes read from stdin for `--input -`."""
+    if args.input == "-":
+        return sys.stdin.buffer.read()
+    return args.input
+
+
 def get_thinking_enabled() -> bool:
     """Get thinking mode status from GEMINI_ENABLE_THINKING env (default: False)."""
     val = os.getenv("GEMINI_ENABLE_THINKING", "False").lower()
@@ -143,6 +432,14 @@ def main() -> None:
     """Main entry point for PDF to Markdown converter."""
     args = parse_args()
 
+    if args.gc_image_store:
+        stats = gc_image_store(Path(args.gc_image_store))
+        print(
+            f"Image store GC: removed {stats['removed']}/{stats['scanned']} blobs "
+            f"({stats['bytes_freed']} bytes freed, {stats['kept']} kept)"
+        )
+        sys.exit(0)
+
     output_dir = Path(args.output)
     output_dir.mkdir(parents=True, exist_ok=True)
 
@@ -150,7 +447,7 @@ def main() -> None:
     if args.overwrite:
         # Clear existing output directories
         import shutil
-        for subdir in ["parsed", "images", "logs", "phase2"]:
+        for subdir in ["parsed", "images", "text", "logs", "phase2"]:
             subdir_path = output_dir / subdir
             if subdir_path.exists():
                 shutil.rmtree(subdir_path)
@@ -158,9 +455,38 @@ def main() -> None:
         for md_file in output_dir.glob("output_*.md"):
             md_file.unlink()
 
+    if args.merge:
+        try:
+            merged = merge_shards(
+                [Path(d) for d in args.merge], output_dir, overwrite=args.overwrite
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Merged parse result saved to: {merged['parse_result_path']}")
+        if merged["output_md_path"] is not None:
+            print(f"Markdown output: {merged['output_md_path']}")
+        elif merged["missing_pages"]:
+            print(
+                f"Phase 2 output missing for {len(merged['missing_pages'])} page(s); "
+                "final Markdown not written.",
+                file=sys.stderr,
+            )
+        sys.exit(0)
+
     if args.parse_only:
         # Phase 1 only: Parse PDF
-        parse_output_path = phase1_parse_pdf(args.input, output_dir, overwrite=args.overwrite)
+        parse_output_path = phase1_parse_pdf(
+            get_pdf_source(args),
+            output_dir,
+            overwrite=args.overwrite,
+            render_workers=args.render_workers,
+            render_options=get_render_options(args),
+            image_store_dir=Path(args.image_store) if args.image_store else None,
+            pages_spec=args.pages,
+            shard=args.shard,
+            use_mmap=args.mmap,
+        )
         print_parse_output_path(str(parse_output_path))
         sys.exit(0)
 
@@ -179,6 +505,17 @@ def main() -> None:
                 model,
                 args.prompt_file,
                 thinking_enabled=thinking_enabled,
+                pages_spec=args.pages,
+                shard=args.shard,
+                text_fast_path=args.text_fast_path,
+                batch_pages=args.batch_pages,
+                engine=args.phase2_engine,
+                on_error=args.on_error,
+                prompt_cache=None if args.no_prompt_cache else prompt_cache_from_env(),
+                response_cache=None if args.no_response_cache else response_cache_from_env(),
+                stream=args.stream,
+                hedger=hedger_from_env() if args.hedge else None,
+                prompt_json=args.prompt_json,
             )
             print_success_message(
                 str(output_md_path),
@@ -193,7 +530,17 @@ def main() -> None:
     else:
         # Both phases: Parse then convert
         # Phase 1
-        parse_output_path = phase1_parse_pdf(args.input, output_dir, overwrite=args.overwrite)
+        parse_output_path = phase1_parse_pdf(
+            get_pdf_source(args),
+            output_dir,
+            overwrite=args.overwrite,
+            render_workers=args.render_workers,
+            render_options=get_render_options(args),
+            image_store_dir=Path(args.image_store) if args.image_store else None,
+            pages_spec=args.pages,
+            shard=args.shard,
+            use_mmap=args.mmap,
+        )
         print_parse_output_path(str(parse_output_path))
 
         # Phase 2 (not yet implemented)
@@ -0,0 +1,253 @@
+"""Adaptive (AIMD) limit on concurrent Gemini requests for Phase 2.
+
+The limit grows additively (about +1 per limit's worth of successful
+requests) while latency is healthy and every slot is taken (a limit that is
+not used is not raised), and is multiplied down on throttling
+(429 / 503) or on a latency spike, always within [minimum, maximum].
+Requests that started before the last decrease do not decrease it again,
+so one burst of 429s counts as a single congestion signal.
+
+A latency spike is judged on a window, not on one request: the median of
+the last _RECENT_WINDOW latencies against the median of the older ones, so
+pages that are merely slower than average (long content, batches, streamed
+output) do not cut the limit. Time spent waiting for the shared RPM/TPM
+budget (see note_rate_limit_wait) is not counted as request latency.
+"""
+
+import asyncio
+import contextvars
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional
+
+# Latency samples compared for spikes: recent requests against older ones.
+_RECENT_WINDOW = 10
+_BASELINE_WINDOW = 50
+_BASELINE_MIN = 10
+
+# Without GEMINI_CONCURRENCY_MAX, the limit may grow to this multiple of the start.
+DEFAULT_MAX_FACTOR = 4
+
+# Rate-limit waits reported by the request running in the current slot (see note_rate_limit_wait).
+_SLOT_WAITS: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar(
+    "_SLOT_WAITS", default=None
+)
+
+_THROTTLE_CODES = (429, 503)
+_THROTTLE_MARKERS = ("429", "RESOURCE_EXHAUSTED", "503", "UNAVAILABLE")
+
+
+def note_rate_limit_wait(seconds: float) -> None:
+    """Report time the current request waited for the rate limiter (excluded from its latency)."""
+    waits = _SLOT_WAITS.get()
+    if waits is not None:
+        waits.append(seconds)
+
+
+def unslotted_context() -> contextvars.Context:
+    """A copy of the current context whose rate-limit waits are not charged to the current slot."""
+    context = contextvars.copy_context()
+    context.run(_SLOT_WAITS.set, None)
+    return context
+
+
+def is_throttle_error(err: BaseException) -> bool:
+    """Whether an API error means the service is overloaded (429 / 503)."""
+    if getattr(err, "code", None) in _THROTTLE_CODES:
+        return True
+    msg = str(err)
+    return any(marker in msg for marker in _THROTTLE_MARKERS)
+
+
+class AdaptiveLimit:
+    """AIMD concurrency limit shared by the Phase 2 workers (threads or asyncio tasks)."""
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 1,
+        maximum: Optional[int] = None,
+        *,
+        decrease_factor: float = 0.5,
+        latency_spike: float = 2.0,
+    ) -> None:
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum if maximum is not None else initial, self.minimum)
+        self._limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease_factor = decrease_factor
+        self.latency_spike = latency_spike
+
+        self._cond = threading.Condition()
+        self._async_cond: Optional[asyncio.Condition] = None
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._recent: Deque[float] = deque()
+        self._baseline: Deque[float] = deque(maxlen=_BASELINE_WINDOW)
+        self.peak = int(self._limit)
+        self.increases = 0
+        self.decreases = 0
+        self.throttled = 0
+
+    @property
+    def limit(self) -> int:
+        """Current limit on requests in flight."""
+        return int(self._limit)
+
+    def _try_acquire(self) -> bool:
+        if self._in_flight < int(self._limit):
+            self._in_flight += 1
+            return True
+        return False
+
+    def _on_done(self, started: float, latency: float, *, throttled: bool, failed: bool) -> None:
+        """Update the limit for one finished request (caller holds the lock)."""
+        # Only a full limit is evidence that more slots would be used; checked
+        # before this request's slot is given back.
+        saturated = self._in_flight >= int(self._limit)
+        self._in_flight -= 1
+        spike = False
+        if not throttled and not failed:
+            spike = self._observe(latency)
+        self.throttled += int(throttled)
+
+        if throttled or spike:
+            if started >= self._last_decrease:
+                new_limit = max(self._limit * self.decrease_factor, float(self.minimum))
+                if int(new_limit) < int(self._limit):
+                    self.decreases += 1
+                self._limit = new_limit
+                self._last_decrease = time.monotonic()
+                # The slow window becomes history: a lasting slowdown is the new
+                # normal, not a new spike
+                self._baseline.extend(self._recent)
+                self._recent.clear()
+        elif not failed and saturated and self._limit < self.maximum:
+            before = int(self._limit)
+            self._limit = min(self._limit + 1.0 / max(int(self._limit), 1), float(self.maximum))
+            if int(self._limit) > before:
+                self.increases += 1
+                self.peak = max(self.peak, int(self._limit))
+
+    def _observe(self, latency: float) -> bool:
+        """Record a successful request's latency; whether the recent window is a spike."""
+        self._recent.append(latency)
+        if len(self._recent) > _RECENT_WINDOW:
+            self._baseline.append(self._recent.popleft())
+        if len(self._recent) < _RECENT_WINDOW or len(self._baseline) < _BASELINE_MIN:
+            return False
+        baseline = statistics.median(self._baseline)
+        return statistics.median(self._recent) > self.latency_spike * baseline
+
+    def try_reserve(self) -> bool:
+        """Take a free slot without waiting, for a duplicate request (no latency is sampled for it).
+
+        Give it back with release_reserved / release_reserved_async.
+        """
+        with self._cond:
+            return self._try_acquire()
+
+    def release_reserved(self) -> None:
+        """Return a slot taken with try_reserve (thread engine)."""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    async def release_reserved_async(self) -> None:
+        """Return a slot taken with try_reserve (asyncio engine)."""
+        with self._cond:
+            self._in_flight -= 1
+        if self._async_cond is not None:
+            async with self._async_cond:
+                self._async_cond.notify_all()
+
+    @staticmethod
+    def _latency(started: float, waits: List[float]) -> float:
+        return max(time.monotonic() - started - sum(waits), 0.0)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one request slot (blocking; thread engine)."""
+        with self._cond:
+            while not self._try_acquire():
+                self._cond.wait()
+        started = time.monotonic()
+        throttled = failed = False
+        waits: List[float] = []
+        token = _SLOT_WAITS.set(waits)
+        try:
+            yield
+        except BaseException as e:
+            throttled, failed = is_throttle_error(e), True
+            raise
+        finally:
+            _SLOT_WAITS.reset(token)
+            with self._cond:
+                latency = self._latency(started, waits)
+                self._on_done(started, latency, throttled=throttled, failed=failed)
+                self._cond.notify_all()
+
+    @asynccontextmanager
+    async def slot_async(self) -> AsyncIterator[None]:
+        """Hold one request slot (asyncio engine; all callers on one event loop)."""
+        if self._async_cond is None:
+            self._async_cond = asyncio.Condition()
+        cond = self._async_cond
+        async with cond:
+            while True:
+                with self._cond:
+                    if self._try_acquire():
+                        break
+                await cond.wait()
+        started = time.monotonic()
+        throttled = failed = False
+        waits: List[float] = []
+        token = _SLOT_WAITS.set(waits)
+        try:
+            yield
+        except BaseException as e:
+            throttled, failed = is_throttle_error(e), True
+            raise
+        finally:
+            _SLOT_WAITS.reset(token)
+            with self._cond:
+                latency = self._latency(started, waits)
+                self._on_done(started, latency, throttled=throttled, failed=failed)
+            async with cond:
+                cond.notify_all()
+
+    def report(self) -> Dict[str, Any]:
+        """Snapshot for progress lines and phase2/state.json."""
+        return {
+            "limit": self.limit,
+            "min": self.minimum,
+            "max": self.maximum,
+            "peak": self.peak,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "throttled": self.throttled,
+        }
+
+    def summary(self) -> str:
+        """One-line summary for the Phase 2 run report."""
+        return (
+            f"concurrency={self.limit} (min={self.minimum}, max={self.maximum}, peak={self.peak}, "
+            f"+{self.increases}/-{self.decreases}, throttled={self.throttled})"
+        )
+
+
+def adaptive_limit_from_env() -> AdaptiveLimit:
+    """
+    Build the Phase 2 limit from the environment.
+
+    GEMINI_CONCURRENCY is the starting limit (default 10);
+    GEMINI_CONCURRENCY_MIN (default 1) and GEMINI_CONCURRENCY_MAX (default:
+    4x GEMINI_CONCURRENCY, so the limit can probe above the start) bound it.
+    """
+    initial = max(int(os.getenv("GEMINI_CONCURRENCY", "10")), 1)
+    minimum = max(int(os.getenv("GEMINI_CONCURRENCY_MIN", "1")), 1)
+    maximum = int(os.getenv("GEMINI_CONCURRENCY_MAX", str(initial * DEFAULT_MAX_FACTOR)))
+    return AdaptiveLimit(initial, minimum, max(maximum, minimum))
@@ -1,38 +1,113 @@
 """Conversion engine coordinating PDF parsing, image extraction, and conversion."""
 
+import asyncio
+import dataclasses
 import hashlib
 import json
 import os
+import re
+import shutil
 import sys
 import time
 import threading
+from collections import Counter
+from contextlib import nullcontext
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Iterable
-
-from .pdf_parser import (
-    open_pdf,
-    parse_pdf,
-    extract_image,
-    render_page_as_image,
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from .pdf_parser import PdfSource, compute_pdf_sha256, is_pdf_stream, open_pdf
+from .page_render import (
+    PipelineStats,
+    RenderOptions,
+    process_pages_parallel,
+    process_pages_pipelined,
+    resolve_render_workers,
 )
-from .image_handler import (
-    generate_image_filename,
-    generate_page_image_filename,
-    save_image,
+from .concurrency import AdaptiveLimit, adaptive_limit_from_env
+from .hedging import RequestHedger
+from .manifest import Phase1Manifest
+from .prompt_cache import PromptCache, is_cache_error
+from .prompt_compaction import (
+    DEFAULT_PROMPT_JSON_MODE,
+    PROMPT_JSON_MODES,
+    dumps_reference,
+    page_reference,
 )
+from .rate_limit import estimate_text_tokens
+from .response_cache import ResponseCache, response_key
+from .retry import RetryPolicy, retry_policy_from_env
 from .parse_result import (
     create_parse_result,
+    get_page_indices,
     save_parse_result,
     load_parse_result,
+    sort_and_index_blocks,
     validate_schema_version,
     validate_block_index_order,
 )
-from .gemini_client import generate_page_markdown
+from .shard import find_parse_result, select_pages
+from .text_layer import route_page
+from .gemini_client import (
+    generate_page_markdown,
+    generate_page_markdown_async,
+    generate_pages_markdown,
+    generate_pages_markdown_async,
+    mime_type_for_ext,
+)
 
 _PROGRESS_UPDATE_INTERVAL_SEC = 0.1
 
+# Phase 2 result for pages marked blank in Phase 1 (no model call is made).
+_BLANK_PAGE_MARKDOWN = ""
+
+PHASE2_ENGINES = ("threads", "asyncio")
+PHASE2_ERROR_MODES = ("fail-fast", "continue")
+
+
+class PartialConversionError(RuntimeError):
+    """Phase 2 finished with on_error="continue" but some pages failed.
+
+    The combined Markdown was still written (failed pages are left as an
+    HTML comment placeholder); rerunning converts only the failed pages.
+    """
+
+    def __init__(self, output_path: Path, failed_pages: Dict[int, str]) -> None:
+        self.output_path = output_path
+        self.failed_pages = failed_pages
+        pages = ", ".join(str(p) for p in sorted(failed_pages))
+        super().__init__(
+            f"{len(failed_pages)} page(s) failed (page_index: {pages}); "
+            f"partial output written to {output_path}. Rerun to retry the failed pages."
+        )
+
+
+class _Cancelled(BaseException):
+    """Raised in workers once a fail-fast run is cancelled (BaseException, like CancelledError)."""
+
+
+@dataclasses.dataclass
+class _RunControl:
+    """Retry policy, cancellation and caches shared by the Phase 2 workers of one run."""
+
+    policy: RetryPolicy = dataclasses.field(default_factory=lambda: RetryPolicy(max_attempts=1))
+    fail_fast: bool = True
+    cancel: threading.Event = dataclasses.field(default_factory=threading.Event)
+    prompt_cache: Optional[PromptCache] = None
+    response_cache: Optional[ResponseCache] = None
+    stream: bool = False
+    hedger: Optional[RequestHedger] = None
+    # Time to first token (seconds) of each streamed request that succeeded
+    ttfts: List[float] = dataclasses.field(default_factory=list)
+    prompt_json: str = "full"
+    # Estimated prompt tokens (template inlined) of each page or batch request built
+    prompt_tokens: List[int] = dataclasses.field(default_factory=list)
+
+# Page delimiter the model writes before each page's Markdown in a batch response.
+_BATCH_DELIMITER = "<!-- page_index: {page_index} -->"
+_BATCH_DELIMITER_RE = re.compile(r"^[ \t]*<!--\s*page_index:\s*(\d+)\s*-->[ \t]*$", re.MULTILINE)
+
 
 def _format_duration(seconds: float) -> str:
     """Format seconds as a short, human-readable duration."""
@@ -85,13 +160,48 @@ def parse_args(
 
 
 def phase1_parse_pdf(
-    pdf_path: str, output_dir: Path, overwrite: bool = False
+    pdf_path: PdfSource,
+    output_dir: Path,
+    overwrite: bool = False,
+    render_workers: int = 1,
+    render_options: Optional[RenderOptions] = None,
+    image_store_dir: Optional[Path] = None,
+    pages_spec: Optional[str] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    use_mmap: bool = False,
 ) -> Path:
     """
     Phase 1: Parse PDF and generate intermediate output.
     
-    - Extract embedded images from each page
-    - Render each page as a complete PNG image (using page number as filename suffix)
+    Every page is loaded once and, in the same pass:
+    - Rendered as a complete image (PNG by default, using page number as filename suffix)
+    - Scanned for embedded image placements, whose images are extracted and saved
+
+    Args:
+        pdf_path: PDF file path, or the PDF bytes (bytes/bytearray/memoryview,
+            e.g. read from stdin or map_pdf_file()); streams are opened with
+            fitz.open(stream=...) without a temp file
+        render_workers: Number of page processes (1 = in-process,
+            0 = one per CPU core). Each worker opens its own document and
+            processes contiguous page ranges; block order is unchanged.
+        render_options: Page render settings (fixed zoom or per-page pixel
+            budget); defaults to RenderOptions() (zoom=2.0).
+        image_store_dir: Optional cross-run blob store for embedded images;
+            files in images/ become hard links into the store.
+        pages_spec: Optional 1-based page ranges to process (e.g. "1-10,15")
+        shard: Optional (i, N) to process only the i-th of N contiguous shards
+            of the selected pages; use merge_shards() to combine the outputs.
+        use_mmap: Memory-map a path input instead of reading it through
+            MuPDF's file stream (each render worker maps it as well)
+
+    The parse result records the PDF content hash as "source_sha256"; for
+    stream input, "source_pdf" is "sha256:<hash>".
+
+    Finished pages are recorded in parsed/phase1_manifest.jsonl, keyed by the
+    PDF content hash and render settings. A re-run skips pages whose outputs
+    still exist (so a crashed run resumes where it stopped) and returns the
+    existing parse result unchanged when nothing needs rendering.
+    overwrite=True starts a fresh manifest and re-renders every page.
 
     Returns:
         Path to the generated parse_result.json file
@@ -100,123 +210,115 @@ def phase1_parse_pdf(
 
     # Open PDF
     t0 = time.monotonic()
-    doc = open_pdf(pdf_path)
+    doc = open_pdf(pdf_path, use_mmap=use_mmap)
     total_pages = len(doc)
-    progress.finish(f"[1/5] Open PDF: done ({total_pages} pages, {_format_duration(time.monotonic() - t0)})")
+    progress.finish(
+        f"[1/3] Open PDF: done ({total_pages} pages, {_format_duration(time.monotonic() - t0)})"
+    )
+
+    if render_options is None:
+        render_options = RenderOptions()
+    pdf_sha256 = compute_pdf_sha256(pdf_path)
+    source_pdf = f"sha256:{pdf_sha256}" if is_pdf_stream(pdf_path) else str(pdf_path)
+    manifest = Phase1Manifest(
+        output_dir, pdf_sha256, dataclasses.asdict(render_options), fresh=overwrite
+    )
 
     try:
-        # Render each page as PNG image
-        t_render = time.monotonic()
-        page_images = []
+        page_indices = select_pages(range(total_pages), pages_spec, shard, total_pages)
+        if not page_indices:
+            raise ValueError("No pages selected for this run (check --pages/--shard)")
+        selected_pages = len(page_indices)
+
+        # Pages finished by an earlier run (same PDF bytes and render settings)
+        reused = manifest.completed_pages(page_indices)
+        todo = [p for p in page_indices if p not in reused]
+        if not todo:
+            existing = manifest.find_parse_result(page_indices)
+            if existing is not None:
+                progress.finish(
+                    f"[2/3] Process pages: done ({selected_pages}/{selected_pages}, all reused)"
+                )
+                progress.finish(f"[3/3] Save parse result: done (unchanged, {existing.name})")
+                return existing
+
+        # Single pass per page: render + scan image placements + extract embedded images
+        t_pages = time.monotonic()
+        workers = resolve_render_workers(render_workers, len(todo))
+        page_stats = PipelineStats()
         last_update = 0.0
-        for page_index in range(total_pages):
+
+        def _pages_progress(cur: int, total: int) -> None:
+            nonlocal last_update
             now = time.monotonic()
-            if now - last_update >= _PROGRESS_UPDATE_INTERVAL_SEC or page_index + 1 == total_pages:
-                progress.update(f"[2/5] Render pages: {page_index + 1}/{total_pages}")
+            if now - last_update >= _PROGRESS_UPDATE_INTERVAL_SEC or cur == total:
+                progress.update(f"[2/3] Process pages: {len(reused) + cur}/{selected_pages}")
                 last_update = now
 
-            page = doc[page_index]
-            image_bytes, image_meta = render_page_as_image(page)
-            
-            # Generate filename with page number suffix
-            filename = generate_page_image_filename(page_index, "png")
-            image_path = save_image(image_bytes, output_dir, filename, overwrite=overwrite)
-            
-            page_images.append(
-                {
-                    "page_index": page_index,
-                    "type": "page_image",
-                    "imagePath": str(image_path),
-                    "ext": image_meta.get("ext"),
-                    "width": image_meta.get("width"),
-                    "height": image_meta.get("height"),
-                }
+        if not todo:
+            new_results: List[Dict[str, Any]] = []
+        elif workers > 1:
+            new_results = process_pages_parallel(
+                pdf_path,
+                output_dir,
+                todo,
+                workers,
+                overwrite=overwrite,
+                progress_cb=_pages_progress,
+                stats=page_stats,
+                options=render_options,
+                image_store_dir=image_store_dir,
+                page_done_cb=manifest.record_page,
+                use_mmap=use_mmap,
             )
+        else:
+            new_results = process_pages_pipelined(
+                doc,
+                todo,
+                output_dir,
+                overwrite=overwrite,
+                progress_cb=_pages_progress,
+                stats=page_stats,
+                options=render_options,
+                image_store_dir=image_store_dir,
+                page_done_cb=manifest.record_page,
+            )
+        results_by_page = dict(reused)
+        results_by_page.update(zip(todo, new_results))
+        page_results = [results_by_page[p] for p in page_indices]
+        page_images = [r["page_image"] for r in page_results]
+        blocks = [b for r in page_results for b in r["images"]]
+        skipped = [b for r in page_results for b in r.get("skipped", [])]
         progress.finish(
-            f"[2/5] Render pages: done ({total_pages}/{total_pages}, {_format_duration(time.monotonic() - t_render)})"
-        )
-
-        # Parse PDF to get embedded image blocks
-        t_scan = time.monotonic()
-        scan_last_update = 0.0
-
-        def _scan_progress(cur: int, total: int) -> None:
-            nonlocal scan_last_update
-            now = time.monotonic()
-            if now - scan_last_update >= _PROGRESS_UPDATE_INTERVAL_SEC or cur == total:
-                progress.update(f"[3/5] Scan embedded images: {cur}/{total}")
-                scan_last_update = now
-
-        blocks = parse_pdf(doc, progress_cb=_scan_progress)
-        progress.finish(
-            f"[3/5] Scan embedded images: done ({total_pages}/{total_pages}, {_format_duration(time.monotonic() - t_scan)})"
-        )
-
-        # Process embedded image blocks
-        t_extract = time.monotonic()
-        total_blocks = len(blocks)
-        extract_last_update = 0.0
-        for idx, block in enumerate(blocks):
-            now = time.monotonic()
-            if now - extract_last_update >= _PROGRESS_UPDATE_INTERVAL_SEC or idx + 1 == total_blocks:
-                progress.update(f"[4/5] Extract embedded images: {idx + 1}/{total_blocks}")
-                extract_last_update = now
-
-            if block.get("type") == "image":
-                # Extract embedded image
-                xref = block.get("xref")
-                if xref is not None:
-                    image_bytes, image_meta = extract_image(doc, int(xref))
-
-                    # Generate filename and save
-                    ext = image_meta.get("ext", "png")
-                    filename = generate_image_filename(ext)
-                    image_path = save_image(image_bytes, output_dir, filename, overwrite=overwrite)
-
-                    # Update block with image metadata
-                    block["imagePath"] = str(image_path)
-                    block["ext"] = image_meta.get("ext")
-                    block["width"] = image_meta.get("width")
-                    block["height"] = image_meta.get("height")
-        progress.finish(
-            f"[4/5] Extract embedded images: done ({total_blocks}/{total_blocks}, {_format_duration(time.monotonic() - t_extract)})"
+            f"[2/3] Process pages: done ({selected_pages}/{selected_pages}, reused={len(reused)}, "
+            f"workers={workers}, embedded={len(blocks)}, skipped={len(skipped)}, "
+            f"{_format_duration(time.monotonic() - t_pages)}; {page_stats.summary()})"
         )
 
-        # Combine page images and embedded images
-        all_blocks = page_images + blocks
-        
-        # Re-sort and re-index all blocks
-        def sort_key(block: Dict[str, Any]) -> tuple:
-            if block.get("type") == "page_image":
-                # Page images come first, sorted by page_index
-                return (0, block.get("page_index", 0))
-            else:
-                # Embedded images sorted by page_index -> bbox.y -> bbox.x
-                page_idx = block.get("page_index", 0)
-                bbox = block.get("bbox", [0, 0, 0, 0])
-                y = bbox[1] if len(bbox) > 1 else 0.0
-                x = bbox[0] if len(bbox) > 0 else 0.0
-                return (1, page_idx, y, x)
-        
-        all_blocks.sort(key=sort_key)
-        
-        # Add blockIndex
-        for index, block in enumerate(all_blocks):
-            block["blockIndex"] = index
+        # Combine page images, embedded and skipped images, then sort and add blockIndex
+        all_blocks = sort_and_index_blocks(page_images + blocks + skipped)
 
         # Create parse result structure
         t_save = time.monotonic()
         parse_result = create_parse_result(
-            source_pdf=pdf_path, total_pages=total_pages, blocks=all_blocks
+            source_pdf=source_pdf,
+            total_pages=total_pages,
+            blocks=all_blocks,
+            page_indices=page_indices,
+            source_sha256=pdf_sha256,
         )
 
         # Save parse result
         parse_output_path = save_parse_result(parse_result, output_dir, overwrite=overwrite)
-        progress.finish(f"[5/5] Save parse result: done ({_format_duration(time.monotonic() - t_save)})")
+        manifest.record_parse_result(parse_output_path, page_indices)
+        progress.finish(
+            f"[3/3] Save parse result: done ({_format_duration(time.monotonic() - t_save)})"
+        )
 
         return parse_output_path
 
     finally:
+        manifest.close()
         doc.close()
 
 
@@ -231,22 +333,26 @@ def _load_prompt_template(prompt_path: Path) -> str:
     return content
 
 
-def _iter_page_blocks(
-    parse_result: Dict[str, Any], page_index: int
-) -> Iterable[Dict[str, Any]]:
-    for block in parse_result.get("blocks", []):
-        if block.get("page_index") == page_index:
-            yield block
-
-
 def _build_pages_input(
-    *, parse_result: Dict[str, Any], output_dir: Path
+    *,
+    parse_result: Dict[str, Any],
+    output_dir: Path,
+    page_indices: Optional[Sequence[int]] = None,
 ) -> List[Dict[str, Any]]:
-    total_pages = int(parse_result.get("total_pages", 0))
+    if page_indices is None:
+        page_indices = get_page_indices(parse_result)
     pages: List[Dict[str, Any]] = []
 
-    for page_index in range(total_pages):
-        blocks = list(_iter_page_blocks(parse_result, page_index))
+    # Group blocks by page once instead of rescanning all blocks per page.
+    blocks_by_page: Dict[int, List[Dict[str, Any]]] = {}
+    for block in parse_result.get("blocks", []):
+        if block.get("type") == "skipped_image":
+            # Filtered in Phase 1 (tiny/decorative); kept in parse_result only
+            continue
+        blocks_by_page.setdefault(block.get("page_index"), []).append(block)
+
+    for page_index in page_indices:
+        blocks = blocks_by_page.get(page_index, [])
 
         page_image_blocks = [b for b in blocks if b.get("type") == "page_image"]
         if not page_image_blocks:
@@ -284,6 +390,12 @@ def _build_pages_input(
                 "page_index": page_index,
                 "page_image_rel": page_image_rel.as_posix(),
                 "page_image_abs": page_image_abs,
+                "page_image_mime_type": mime_type_for_ext(page_image.get("ext")),
+                "blank": bool(page_image.get("blank")),
+                "text_layer": page_image.get("text_layer"),
+                "text_path_abs": (
+                    output_dir / page_image["textPath"] if page_image.get("textPath") else None
+                ),
                 "embedded_images_meta": embedded_images_meta,
                 "page_parse_dict": page_parse_dict,
             }
@@ -292,30 +404,76 @@ def _build_pages_input(
     return pages
 
 
+def _template_head(prompt_template_md: str) -> str:
+    """The template and its separator; empty when the template is sent as cached content."""
+    if not prompt_template_md.strip():
+        return ""
+    return prompt_template_md.rstrip() + "\n\n---\n\n"
+
+
+def _page_reference(page: Dict[str, Any], prompt_json: str = "full") -> Dict[str, Any]:
+    return page_reference(
+        page_index=page["page_index"],
+        page_image_rel=page["page_image_rel"],
+        embedded_images_meta=page["embedded_images_meta"],
+        page_parse_dict=page["page_parse_dict"],
+        mode=prompt_json,
+    )
+
+
 def _build_page_prompt(
-    *,
-    prompt_template_md: str,
-    page_index: int,
-    page_image_rel: str,
-    embedded_images_meta: List[Dict[str, Any]],
-    page_parse_dict: Dict[str, Any],
+    *, prompt_template_md: str, reference: Dict[str, Any], prompt_json: str = "full"
 ) -> str:
-    appended = {
-        "page_index": page_index,
-        "page_image_path": page_image_rel,
-        "embedded_images_meta": embedded_images_meta,
-        "page_parse_dict": page_parse_dict,
-    }
     return (
-        prompt_template_md.rstrip()
-        + "\n\n---\n\n"
+        _template_head(prompt_template_md)
         + "## 參考資料（程式自動附加）\n\n"
         + "以下 JSON 是本頁的結構化參考資料。請用來輔助理解，但不要原樣貼回輸出。\n\n"
-        + json.dumps(appended, ensure_ascii=False, indent=2)
+        + dumps_reference(reference, prompt_json)
+        + "\n"
+    )
+
+
+def _build_batch_prompt(
+    *, prompt_template_md: str, references: Sequence[Dict[str, Any]], prompt_json: str = "full"
+) -> str:
+    delimiters = "\n".join(
+        _BATCH_DELIMITER.format(page_index=ref["page_index"]) for ref in references
+    )
+    return (
+        _template_head(prompt_template_md)
+        + "## 多頁批次（程式自動附加）\n\n"
+        + f"本次請求包含 {len(references)} 頁，每張頁面圖片前標示其 page_index。"
+        + "請依序逐頁轉換，每頁的 Markdown 之前單獨一行輸出該頁的分隔標記，"
+        + "分隔標記必須依下列順序各出現一次，且不可輸出其他分隔標記：\n\n"
+        + delimiters
+        + "\n\n"
+        + "## 參考資料（程式自動附加）\n\n"
+        + "以下 JSON 是各頁的結構化參考資料。請用來輔助理解，但不要原樣貼回輸出。\n\n"
+        + dumps_reference(list(references), prompt_json)
         + "\n"
     )
 
 
+def split_batch_markdown(text: str, page_indices: Sequence[int]) -> Optional[Dict[int, str]]:
+    """
+    Split a batch response into per-page Markdown.
+
+    Returns:
+        page_index -> Markdown, or None if the delimiters are missing,
+        duplicated, out of order, or preceded by other content
+    """
+    matches = list(_BATCH_DELIMITER_RE.finditer(text))
+    if [int(m.group(1)) for m in matches] != list(page_indices):
+        return None
+    if not matches or text[: matches[0].start()].strip():
+        return None
+    ends = [m.start() for m in matches[1:]] + [len(text)]
+    return {
+        int(m.group(1)): text[m.end() : end].strip()
+        for m, end in zip(matches, ends)
+    }
+
+
 def _build_recitation_safe_prompt(prompt_text: str) -> str:
     """Build a fallback prompt when the model blocks output with RECITATION."""
     return (
@@ -342,6 +500,15 @@ def _save_markdown(output_dir: Path, markdown: str) -> Path:
     return out_path
 
 
+def combine_page_markdown(output_dir: Path, page_mds: List[str]) -> Path:
+    """Join per-page Markdown (in page order) with page separators and save it.
+
+    Empty pages (e.g. blank pages) are left out so no separators are doubled.
+    """
+    combined_md = ("\n\n---\n\n".join(md for md in page_mds if md)).rstrip() + "\n"
+    return _save_markdown(output_dir, combined_md)
+
+
 def _phase2_dir(output_dir: Path) -> Path:
     d = output_dir / "phase2"
     d.mkdir(parents=True, exist_ok=True)
@@ -387,6 +554,11 @@ def _phase2_page_md_path(output_dir: Path, page_index: int) -> Path:
     return _phase2_pages_dir(output_dir) / f"page_{page_index:04d}.md"
 
 
+def _partial_path(path: Path) -> Path:
+    """Temp file beside a Phase 2 file; promoted over it with os.replace once complete."""
+    return path.with_name(path.name + ".partial")
+
+
 def _rebuild_completed_pages_from_disk(output_dir: Path) -> Dict[str, Any]:
     """Rebuild completed_pages map from existing per-page markdown files.
 
@@ -408,31 +580,59 @@ def _rebuild_completed_pages_from_disk(output_dir: Path) -> Dict[str, Any]:
     return completed
 
 
-def _process_single_page(
+def _record_page_result(
+    output_dir: Path,
+    state: Dict[str, Any],
+    state_lock: threading.Lock,
+    page: Dict[str, Any],
+    page_md: str,
+    **extra: Any,
+) -> None:
+    """Persist one page's Markdown and its completed_pages entry (for resume)."""
+    page_md_path = _phase2_page_md_path(output_dir, int(page["page_index"]))
+    # Written beside the page file and promoted atomically, so a page file is never half-written
+    partial_path = _partial_path(page_md_path)
+    partial_path.write_text(page_md + "\n" if page_md else "", encoding="utf-8")
+    os.replace(partial_path, page_md_path)
+    with state_lock:
+        state.setdefault("completed_pages", {})[str(page["page_index"])] = {
+            "path": str(page_md_path.relative_to(output_dir)),
+            "md_chars": len(page_md),
+            "bytes": int(page_md_path.stat().st_size),
+            "route": page["route"],
+            "route_reason": page["route_reason"],
+            **extra,
+        }
+        _save_phase2_state(output_dir, state)
+
+
+def _route_page(page: Dict[str, Any], text_fast_path: bool) -> Tuple[str, str]:
+    """Return (route, reason) for a page: "blank", "local" or "model"."""
+    if page["blank"]:
+        return "blank", "blank_page"
+    if not text_fast_path:
+        return "model", "fast_path_disabled"
+    route, reason = route_page(page["text_layer"])
+    if route == "local" and (page["text_path_abs"] is None or not page["text_path_abs"].exists()):
+        return "model", "no_local_markdown"
+    return route, reason
+
+
+def _page_without_model(
     page: Dict[str, Any],
     idx: int,
     total_pages: int,
     output_dir: Path,
     state: Dict[str, Any],
     state_lock: threading.Lock,
-    model: str,
-    prompt_template_md: str,
     progress: _ProgressPrinter,
-    thinking_enabled: bool = False,
-) -> str:
-    """Process a single page: cache check -> generate -> save."""
+) -> Optional[str]:
+    """The page's Markdown if no model call is needed (cache hit, blank, local), else None."""
     page_no = idx + 1
     page_index = int(page["page_index"])
-    t_page0 = time.monotonic()
-    embedded_count = len(page["embedded_images_meta"])
+    page_md_path = _phase2_page_md_path(output_dir, page_index)
 
     # If cached on disk, read and reuse immediately (disk is source of truth).
-    # We need to access state["completed_pages"] which is shared.
-    with state_lock:
-        completed_pages: Dict[str, Any] = state.get("completed_pages", {})
-    
-    page_md_path = _phase2_page_md_path(output_dir, page_index)
-    
     if page_md_path.exists():
         # Ensure state reflects reality (in case it was missing/corrupted).
         with state_lock:
@@ -440,146 +640,1193 @@ def _process_single_page(
                 "path": str(page_md_path.relative_to(output_dir)),
                 "bytes": int(page_md_path.stat().st_size),
             }
-        
+
         progress.finish(
             f"[Phase 2] Page {page_no}/{total_pages}: cache hit "
             f"(page_index={page_index}, path={page_md_path.relative_to(output_dir)})"
         )
         return page_md_path.read_text(encoding="utf-8")
 
+    if page["route"] == "blank":
+        # Blank in Phase 1 (ink coverage / "intentionally left blank"): no API call.
+        _record_page_result(output_dir, state, state_lock, page, _BLANK_PAGE_MARKDOWN, blank=True)
+        progress.finish(
+            f"[Phase 2] Page {page_no}/{total_pages}: skipped (blank page, page_index={page_index})"
+        )
+        return _BLANK_PAGE_MARKDOWN
+
+    if page["route"] == "local":
+        # Clean born-digital text layer: use the Markdown converted in Phase 1,
+        # with the page image reference the prompt asks the model for.
+        page_md = page["text_path_abs"].read_text(encoding="utf-8").strip()
+        page_md = f"{page_md}\n\nfrom {page['page_image_rel']}"
+        _record_page_result(output_dir, state, state_lock, page, page_md)
+        progress.finish(
+            f"[Phase 2] Page {page_no}/{total_pages}: converted locally "
+            f"(text layer, page_index={page_index}, md_chars={len(page_md)})"
+        )
+        return page_md
+
+    return None
+
+
+def _prompt_json(control: Optional[_RunControl]) -> str:
+    return control.prompt_json if control is not None else "full"
+
+
+def _prompt_request(
+    build: Callable[[str], str],
+    prompt_template_md: str,
+    model: str,
+    control: Optional[_RunControl],
+) -> Tuple[Callable[[], Dict[str, Any]], int]:
+    """
+    Prompt keyword arguments for each attempt of one request, and its estimated prompt tokens.
+
+    With a prompt cache, the template is sent as cached_content and the prompt
+    text holds only the page-specific part; without one (or once the cache
+    fails) the template is inlined. build(template) returns the prompt text.
+    The first prompt is built (and the cache entry resolved) right away; its
+    tokens, counted with the template inlined, are added to the run's total.
+    """
+    cache = control.prompt_cache if control is not None else None
+    built: Dict[Optional[str], Dict[str, Any]] = {}
+
+    def _request() -> Dict[str, Any]:
+        cached_content = cache.resolve(model, prompt_template_md) if cache is not None else None
+        if cached_content not in built:
+            prompt_text = build("" if cached_content else prompt_template_md)
+            built[cached_content] = {"prompt_text": prompt_text}
+            if cached_content:
+                built[cached_content]["cached_content"] = cached_content
+        return built[cached_content]
+
+    first = _request()
+    tokens = estimate_text_tokens(first["prompt_text"])
+    if "cached_content" in first:
+        tokens += estimate_text_tokens(_template_head(prompt_template_md))
+    if control is not None:
+        control.prompt_tokens.append(tokens)
+    return _request, tokens
+
+
+def _page_request(
+    page: Dict[str, Any],
+    prompt_template_md: str,
+    model: str,
+    thinking_enabled: bool,
+    control: Optional[_RunControl],
+    safe: bool = False,
+) -> Tuple[Callable[[], Dict[str, Any]], Optional[str], int]:
+    """
+    Prompt request, response-cache key and estimated prompt tokens of one page.
+
+    The page's reference JSON is built once for both the prompt and the key.
+    safe selects the recitation fallback prompt.
+    """
+    mode = _prompt_json(control)
+    reference = _page_reference(page, mode)
+
+    def _build(template: str) -> str:
+        prompt_text = _build_page_prompt(
+            prompt_template_md=template, reference=reference, prompt_json=mode
+        )
+        return _build_recitation_safe_prompt(prompt_text) if safe else prompt_text
+
+    request, tokens = _prompt_request(_build, prompt_template_md, model, control)
+    key = _response_key(
+        control,
+        model,
+        thinking_enabled,
+        prompt_template_md,
+        [reference],
+        [page["page_image_abs"]],
+        "safe" if safe else "page",
+    )
+    return request, key, tokens
+
+
+# Bump when the prompt wording built in this module changes, so responses to
+# the old prompts are not reused.
+_RESPONSE_KEY_VERSION = 2
+
+# Left out of response-cache keys: blockIndex is numbered across the whole
+# parse result and xref is the PDF object number, so both change when other
+# pages are edited or a different page subset is parsed.
+_POSITION_FIELDS = frozenset({"blockIndex", "xref"})
+
+
+def _without_position_fields(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            k: _without_position_fields(v) for k, v in value.items() if k not in _POSITION_FIELDS
+        }
+    if isinstance(value, list):
+        return [_without_position_fields(v) for v in value]
+    return value
+
+
+def _response_key(
+    control: Optional[_RunControl],
+    model: str,
+    thinking_enabled: bool,
+    prompt_template_md: str,
+    references: Sequence[Dict[str, Any]],
+    image_paths: Sequence[Path],
+    variant: str = "page",
+) -> Optional[str]:
+    """
+    Response-cache key of a request, or None without a cache.
+
+    Keyed on the template hash and each page's reference JSON without
+    document-position fields rather than the prompt text, so a page keeps its
+    key when other pages change. variant is "page", "safe" (recitation
+    fallback) or "batch".
+    """
+    if control is None or control.response_cache is None:
+        return None
+    return response_key(
+        model=model,
+        config={"thinking_enabled": thinking_enabled},
+        request={
+            "version": _RESPONSE_KEY_VERSION,
+            "variant": variant,
+            "template_sha256": _text_sha256(prompt_template_md),
+            "prompt_json": _prompt_json(control),
+            "pages": _without_position_fields(list(references)),
+        },
+        images=[path.read_bytes() for path in image_paths],
+    )
+
+
+def _cached_response(
+    control: Optional[_RunControl], key: Optional[str], model: str, call: Callable[[], str]
+) -> str:
+    """The cached response for key, else run call() (once for concurrent identical requests)."""
+    if key is None or control is None or control.response_cache is None:
+        return call()
+    return control.response_cache.get_or_compute(key, model, call)
+
+
+async def _cached_response_async(
+    control: Optional[_RunControl],
+    key: Optional[str],
+    model: str,
+    call: Callable[[], Awaitable[str]],
+) -> str:
+    """Async variant of _cached_response."""
+    if key is None or control is None or control.response_cache is None:
+        return await call()
+    return await control.response_cache.get_or_compute_async(key, model, call)
+
+
+def _request_slot(limiter: Optional[AdaptiveLimit]):
+    return limiter.slot() if limiter is not None else nullcontext()
+
+
+def _request_slot_async(limiter: Optional[AdaptiveLimit]):
+    return limiter.slot_async() if limiter is not None else nullcontext()
+
+
+def _stop_if_fail_fast(control: Optional[_RunControl]) -> None:
+    """On a page failure in a fail-fast run, stop the other workers before their next request.
+
+    Set by the failing worker itself: a free worker could otherwise start a
+    queued page before the main thread sees the failure.
+    """
+    if control is not None and control.fail_fast:
+        control.cancel.set()
+
+
+def _is_final_error(err: Exception, control: _RunControl, attempt: int) -> bool:
+    """Whether err fails the request for good (no retry, prompt-cache or recitation fallback)."""
+    if control.prompt_cache is not None and is_cache_error(err):
+        return False
+    return not (_is_recitation_error(err) or control.policy.should_retry(err, attempt))
+
+
+def _call_gemini(
+    call: Callable[[], Any],
+    limiter: Optional[AdaptiveLimit],
+    control: Optional[_RunControl],
+    progress: _ProgressPrinter,
+    label: str,
+    kind: str = "page",
+) -> Any:
+    """Run one Gemini call in a limiter slot, retrying transient errors per the run's policy.
+
+    kind ("page" or "batch") keys the hedging latency percentile.
+    """
+    control = control or _RunControl()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            with _request_slot(limiter):
+                # Checked after waiting for the slot, right before spending a request.
+                if control.cancel.is_set():
+                    raise _Cancelled()
+                try:
+                    if control.hedger is None:
+                        return call()
+                    return control.hedger.call(call, limiter, kind)
+                except Exception as e:
+                    # Cancel before the slot is released, so no queued page takes it first.
+                    if _is_final_error(e, control, attempt):
+                        _stop_if_fail_fast(control)
+                    raise
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if control.prompt_cache is not None and control.prompt_cache.discard_on_error(e):
+                # The cached template is gone (expired or deleted): retry with it inlined.
+                progress.finish(f"[Phase 2] {label}: prompt cache 無法使用，改為內嵌 prompt 重試（{e}）")
+                continue
+            if not control.policy.should_retry(e, attempt):
+                raise
+            delay = control.policy.delay(attempt, e)
+            progress.finish(
+                f"[Phase 2] {label}: 暫時性錯誤，{_format_duration(delay)} 後重試"
+                f"（attempt {attempt}/{control.policy.max_attempts}: {e}）"
+            )
+            # Backoff wakes up early when a fail-fast run is cancelled.
+            if control.cancel.wait(delay):
+                raise _Cancelled() from e
+
+
+async def _call_gemini_async(
+    call: Callable[[], Awaitable[Any]],
+    limiter: Optional[AdaptiveLimit],
+    control: Optional[_RunControl],
+    progress: _ProgressPrinter,
+    label: str,
+    kind: str = "page",
+) -> Any:
+    """Async variant of _call_gemini (a fail-fast run also cancels the tasks)."""
+    control = control or _RunControl()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            async with _request_slot_async(limiter):
+                if control.cancel.is_set():
+                    raise _Cancelled()
+                try:
+                    if control.hedger is None:
+                        return await call()
+                    return await control.hedger.call_async(call, limiter, kind)
+                except Exception as e:
+                    if _is_final_error(e, control, attempt):
+                        _stop_if_fail_fast(control)
+                    raise
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if control.prompt_cache is not None and control.prompt_cache.discard_on_error(e):
+                progress.finish(f"[Phase 2] {label}: prompt cache 無法使用，改為內嵌 prompt 重試（{e}）")
+                continue
+            if not control.policy.should_retry(e, attempt):
+                raise
+            delay = control.policy.delay(attempt, e)
+            progress.finish(
+                f"[Phase 2] {label}: 暫時性錯誤，{_format_duration(delay)} 後重試"
+                f"（attempt {attempt}/{control.policy.max_attempts}: {e}）"
+            )
+            await asyncio.sleep(delay)
+
+
+class _StreamWriter:
+    """Append the streamed chunks of one request to a .partial file and report tokens / TTFT."""
+
+    def __init__(self, path: Path, progress: _ProgressPrinter, label: str) -> None:
+        self.path = path
+        self._progress = progress
+        self._label = label
+        self._t0 = time.monotonic()
+        self.ttft: Optional[float] = None
+        self.tokens = 0
+
+    def begin(self) -> Callable[[str, Optional[int]], None]:
+        """Start an attempt (truncating the .partial file) and return its chunk callback."""
+        self.path.write_text("", encoding="utf-8")
+        self._t0 = time.monotonic()
+        self.ttft = None
+        self.tokens = 0
+        return self._on_chunk
+
+    def _on_chunk(self, text: str, tokens: Optional[int]) -> None:
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self._t0
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(text)
+        # Reported candidates tokens when the chunk has usage metadata, else an estimate
+        self.tokens = tokens if tokens is not None else self.tokens + estimate_text_tokens(text)
+        self._progress.update(
+            f"[Phase 2] {self._label}: 接收中…"
+            f"（tokens={self.tokens}, ttft={_format_duration(self.ttft)}）"
+        )
+
+    def discard(self) -> None:
+        """Remove the .partial file (its content was promoted or is no longer needed)."""
+        self.path.unlink(missing_ok=True)
+
+
+def _page_stream(
+    control: Optional[_RunControl], path: Path, progress: _ProgressPrinter, label: str
+) -> Optional[_StreamWriter]:
+    if control is None or not control.stream:
+        return None
+    return _StreamWriter(_partial_path(path), progress, label)
+
+
+def _stream_kwargs(stream: Optional[_StreamWriter]) -> Dict[str, Any]:
+    """on_chunk for the generate_* call of one attempt (none when not streaming)."""
+    return {"on_chunk": stream.begin()} if stream is not None else {}
+
+
+def _stream_done(
+    stream: Optional[_StreamWriter], control: Optional[_RunControl], timings: Dict[str, float]
+) -> None:
+    if stream is None or stream.ttft is None or control is None:
+        return
+    timings["ttft"] = stream.ttft
+    control.ttfts.append(stream.ttft)
+
+
+def _ttft_note(control: _RunControl) -> str:
+    if not control.ttfts:
+        return ""
+    ttfts = sorted(control.ttfts)
+    return (
+        f"ttft p50={_format_duration(ttfts[len(ttfts) // 2])}, "
+        f"p95={_format_duration(ttfts[min(int(len(ttfts) * 0.95), len(ttfts) - 1)])}, "
+    )
+
+
+def _prompt_tokens_note(prompt_tokens: Optional[int]) -> str:
+    return f"prompt_tokens≈{prompt_tokens}, " if prompt_tokens is not None else ""
+
+
+def _prompt_json_note(control: _RunControl) -> str:
+    if not control.prompt_tokens:
+        return ""
+    total = sum(control.prompt_tokens)
+    return (
+        f"prompt_json={control.prompt_json} (prompt_tokens≈{total}, "
+        f"avg≈{total // len(control.prompt_tokens)}/request), "
+    )
+
+
+def _limit_note(limiter: Optional[AdaptiveLimit]) -> str:
+    return f", limit={limiter.limit}" if limiter is not None else ""
+
+
+def _format_page_timings(timings: Dict[str, float]) -> str:
+    text = ", ".join(
+        f"{name}={_format_duration(timings.get(name, 0.0))}"
+        for name in ("prepare", "prompt", "gemini", "gemini_retry", "total")
+    )
+    if "ttft" in timings:
+        text += f", ttft={_format_duration(timings['ttft'])}"
+    return text
+
+
+def _page_failure(
+    err: Exception,
+    page: Dict[str, Any],
+    idx: int,
+    total_pages: int,
+    model: str,
+    timings: Dict[str, float],
+    progress: _ProgressPrinter,
+) -> RuntimeError:
+    """Print the page's ERROR line and build a context-rich error for the CLI."""
+    page_no = idx + 1
+    page_index = int(page["page_index"])
+    embedded_count = len(page["embedded_images_meta"])
+    progress.finish(
+        "[Phase 2] "
+        f"Page {page_no}/{total_pages}: ERROR "
+        f"(page_index={page_index}, "
+        f"image={page['page_image_rel']}, "
+        f"embedded={embedded_count}, "
+        f"{_format_page_timings(timings)})"
+    )
+    extra_hint = ""
+    msg = str(err)
+    if "FinishReason.RECITATION" in msg or "RECITATION" in msg:
+        extra_hint = (
+            " Hint: finish_reason=RECITATION 通常代表模型認為輸出會接近逐字轉錄/版權內容而拒絕；"
+            "可嘗試調整 prompt 讓輸出改為摘要/改寫而非逐字還原。"
+        )
+    return RuntimeError(
+        "Phase 2 failed while converting a page. "
+        f"page={page_no}/{total_pages} (page_index={page_index}), "
+        f"image={page['page_image_rel']}, "
+        f"embedded={embedded_count}, "
+        f"model={model}. "
+        f"Cause: {err}.{extra_hint}"
+    )
+
+
+def _page_done(
+    page_md: str,
+    page: Dict[str, Any],
+    idx: int,
+    total_pages: int,
+    output_dir: Path,
+    state: Dict[str, Any],
+    state_lock: threading.Lock,
+    timings: Dict[str, float],
+    progress: _ProgressPrinter,
+    limiter: Optional[AdaptiveLimit] = None,
+    prompt_tokens: Optional[int] = None,
+) -> str:
+    """Print the page's done line and persist its Markdown + state for resume."""
+    progress.finish(
+        "[Phase 2] "
+        f"Page {idx + 1}/{total_pages}: done "
+        f"({_format_page_timings(timings)}, "
+        f"{_prompt_tokens_note(prompt_tokens)}md_chars={len(page_md)}{_limit_note(limiter)})"
+    )
+    extra: Dict[str, Any] = {"ttft_sec": round(timings["ttft"], 3)} if "ttft" in timings else {}
+    if prompt_tokens is not None:
+        extra["prompt_tokens_est"] = prompt_tokens
+    _record_page_result(output_dir, state, state_lock, page, page_md.strip(), **extra)
+    return page_md.strip()
+
+
+def _process_single_page(
+    page: Dict[str, Any],
+    idx: int,
+    total_pages: int,
+    output_dir: Path,
+    state: Dict[str, Any],
+    state_lock: threading.Lock,
+    model: str,
+    prompt_template_md: str,
+    progress: _ProgressPrinter,
+    thinking_enabled: bool = False,
+    limiter: Optional[AdaptiveLimit] = None,
+    control: Optional[_RunControl] = None,
+) -> str:
+    """Process a single page: cache check -> generate -> save."""
+    page_md = _page_without_model(page, idx, total_pages, output_dir, state, state_lock, progress)
+    if page_md is not None:
+        return page_md
+
+    page_no = idx + 1
+    t_page0 = time.monotonic()
+    timings: Dict[str, float] = {}
     progress.update(
-        f"[Phase 2] Page {page_no}/{total_pages}: 準備本頁資料（embedded={embedded_count}, image={page['page_image_rel']}）"
+        f"[Phase 2] Page {page_no}/{total_pages}: 準備本頁資料"
+        f"（embedded={len(page['embedded_images_meta'])}, image={page['page_image_rel']}）"
     )
-    t_prepare = time.monotonic()
     # (目前 prepare 主要是組合資料與前置檢查；避免在進度停住時看不出在做什麼)
-    dt_prepare = time.monotonic() - t_prepare
+    timings["prepare"] = time.monotonic() - t_page0
 
-    page_md = ""
-    dt_prompt = 0.0
-    dt_gemini = 0.0
-    dt_gemini_retry = 0.0
-    t_gemini: float | None = None
     try:
-        progress.update(
-            f"[Phase 2] Page {page_no}/{total_pages}: 建立 prompt…"
-        )
+        progress.update(f"[Phase 2] Page {page_no}/{total_pages}: 建立 prompt…")
         t_prompt = time.monotonic()
-        prompt_text = _build_page_prompt(
-            prompt_template_md=prompt_template_md,
-            page_index=page["page_index"],
-            page_image_rel=page["page_image_rel"],
-            embedded_images_meta=page["embedded_images_meta"],
-            page_parse_dict=page["page_parse_dict"],
+        request, key, prompt_tokens = _page_request(
+            page, prompt_template_md, model, thinking_enabled, control
         )
-        dt_prompt = time.monotonic() - t_prompt
+        page_md_path = _phase2_page_md_path(output_dir, int(page["page_index"]))
+        stream = _page_stream(control, page_md_path, progress, f"Page {page_no}/{total_pages}")
+        timings["prompt"] = time.monotonic() - t_prompt
         progress.update(
-            f"[Phase 2] Page {page_no}/{total_pages}: 建立 prompt: done（{_format_duration(dt_prompt)}）"
+            f"[Phase 2] Page {page_no}/{total_pages}: "
+            f"建立 prompt: done（{_format_duration(timings['prompt'])}）"
         )
 
         progress.update(
-            f"[Phase 2] Page {page_no}/{total_pages}: 等待 Gemini 回應…（model={model}）"
+            f"[Phase 2] Page {page_no}/{total_pages}: "
+            f"等待 Gemini 回應…（model={model}{_limit_note(limiter)}）"
         )
         t_gemini = time.monotonic()
         try:
-            page_md = generate_page_markdown(
-                prompt_text=prompt_text,
-                page_image_path=page["page_image_abs"],
-                model=model,
-                thinking_enabled=thinking_enabled,
+            page_md = _cached_response(
+                control,
+                key,
+                model,
+                lambda: _call_gemini(
+                    lambda: generate_page_markdown(
+                        **request(),
+                        page_image_path=page["page_image_abs"],
+                        model=model,
+                        thinking_enabled=thinking_enabled,
+                        image_mime_type=page["page_image_mime_type"],
+                        **_stream_kwargs(stream),
+                    ),
+                    limiter,
+                    control,
+                    progress,
+                    f"Page {page_no}/{total_pages}",
+                ),
             )
-            dt_gemini = time.monotonic() - t_gemini
+            timings["gemini"] = time.monotonic() - t_gemini
         except Exception as e:  # pylint: disable=broad-exception-caught
             # Capture time spent waiting for Gemini even when it errors.
-            dt_gemini = time.monotonic() - t_gemini
+            timings["gemini"] = time.monotonic() - t_gemini
 
             # If the model blocks with RECITATION, retry once with a safer prompt.
-            if _is_recitation_error(e):
-                progress.finish(
-                    f"[Phase 2] Page {page_no}/{total_pages}: 觸發 RECITATION，改用安全模式重試一次"
-                )
-                safe_prompt_text = _build_recitation_safe_prompt(prompt_text)
-                progress.update(
-                    f"[Phase 2] Page {page_no}/{total_pages}: 等待 Gemini 回應（安全模式）…（model={model}）"
-                )
-                t_retry = time.monotonic()
-                page_md = generate_page_markdown(
-                    prompt_text=safe_prompt_text,
-                    page_image_path=page["page_image_abs"],
-                    model=model,
-                    thinking_enabled=thinking_enabled,
-                )
-                dt_gemini_retry = time.monotonic() - t_retry
-            else:
+            if not _is_recitation_error(e):
                 raise
+            progress.finish(
+                f"[Phase 2] Page {page_no}/{total_pages}: 觸發 RECITATION，改用安全模式重試一次"
+            )
+            progress.update(
+                f"[Phase 2] Page {page_no}/{total_pages}: "
+                f"等待 Gemini 回應（安全模式）…（model={model}{_limit_note(limiter)}）"
+            )
+            t_retry = time.monotonic()
+            safe_request, safe_key, safe_tokens = _page_request(
+                page, prompt_template_md, model, thinking_enabled, control, safe=True
+            )
+            prompt_tokens += safe_tokens
+            page_md = _cached_response(
+                control,
+                safe_key,
+                model,
+                lambda: _call_gemini(
+                    lambda: generate_page_markdown(
+                        **safe_request(),
+                        page_image_path=page["page_image_abs"],
+                        model=model,
+                        thinking_enabled=thinking_enabled,
+                        image_mime_type=page["page_image_mime_type"],
+                        **_stream_kwargs(stream),
+                    ),
+                    limiter,
+                    control,
+                    progress,
+                    f"Page {page_no}/{total_pages}",
+                ),
+            )
+            timings["gemini_retry"] = time.monotonic() - t_retry
+        _stream_done(stream, control, timings)
     except Exception as e:  # pylint: disable=broad-exception-caught
-        dt_total = time.monotonic() - t_page0
-        progress.finish(
-            "[Phase 2] "
-            f"Page {page_no}/{total_pages}: ERROR "
-            f"(page_index={page_index}, "
-            f"image={page['page_image_rel']}, "
-            f"embedded={embedded_count}, "
-            f"prepare={_format_duration(dt_prepare)}, "
-            f"prompt={_format_duration(dt_prompt)}, "
-            f"gemini={_format_duration(dt_gemini)}, "
-            f"gemini_retry={_format_duration(dt_gemini_retry)}, "
-            f"total={_format_duration(dt_total)})"
-        )
+        timings["total"] = time.monotonic() - t_page0
+        _stop_if_fail_fast(control)
         # Raise a context-rich error so CLI prints something actionable.
-        extra_hint = ""
-        msg = str(e)
-        if "FinishReason.RECITATION" in msg or "RECITATION" in msg:
-            extra_hint = (
-                " Hint: finish_reason=RECITATION 通常代表模型認為輸出會接近逐字轉錄/版權內容而拒絕；"
-                "可嘗試調整 prompt 讓輸出改為摘要/改寫而非逐字還原。"
+        raise _page_failure(e, page, idx, total_pages, model, timings, progress) from e
+
+    timings["total"] = time.monotonic() - t_page0
+    return _page_done(
+        page_md,
+        page,
+        idx,
+        total_pages,
+        output_dir,
+        state,
+        state_lock,
+        timings,
+        progress,
+        limiter,
+        prompt_tokens,
+    )
+
+
+async def _process_single_page_async(
+    page: Dict[str, Any],
+    idx: int,
+    total_pages: int,
+    output_dir: Path,
+    state: Dict[str, Any],
+    state_lock: threading.Lock,
+    model: str,
+    prompt_template_md: str,
+    progress: _ProgressPrinter,
+    thinking_enabled: bool = False,
+    limiter: Optional[AdaptiveLimit] = None,
+    control: Optional[_RunControl] = None,
+) -> str:
+    """Async variant of _process_single_page (same cache, state and progress output)."""
+    page_md = _page_without_model(page, idx, total_pages, output_dir, state, state_lock, progress)
+    if page_md is not None:
+        return page_md
+
+    page_no = idx + 1
+    t_page0 = time.monotonic()
+    timings: Dict[str, float] = {"prepare": 0.0}
+    try:
+        t_prompt = time.monotonic()
+        # In a thread: creating or extending the cache entry is a blocking API call.
+        request, key, prompt_tokens = await asyncio.to_thread(
+            _page_request, page, prompt_template_md, model, thinking_enabled, control
+        )
+        page_md_path = _phase2_page_md_path(output_dir, int(page["page_index"]))
+        stream = _page_stream(control, page_md_path, progress, f"Page {page_no}/{total_pages}")
+        timings["prompt"] = time.monotonic() - t_prompt
+
+        progress.update(
+            f"[Phase 2] Page {page_no}/{total_pages}: "
+            f"等待 Gemini 回應…（model={model}{_limit_note(limiter)}）"
+        )
+        t_gemini = time.monotonic()
+        try:
+            page_md = await _cached_response_async(
+                control,
+                key,
+                model,
+                lambda: _call_gemini_async(
+                    lambda: generate_page_markdown_async(
+                        **request(),
+                        page_image_path=page["page_image_abs"],
+                        model=model,
+                        thinking_enabled=thinking_enabled,
+                        image_mime_type=page["page_image_mime_type"],
+                        **_stream_kwargs(stream),
+                    ),
+                    limiter,
+                    control,
+                    progress,
+                    f"Page {page_no}/{total_pages}",
+                ),
+            )
+            timings["gemini"] = time.monotonic() - t_gemini
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            timings["gemini"] = time.monotonic() - t_gemini
+            if not _is_recitation_error(e):
+                raise
+            progress.finish(
+                f"[Phase 2] Page {page_no}/{total_pages}: 觸發 RECITATION，改用安全模式重試一次"
             )
-        raise RuntimeError(
-            "Phase 2 failed while converting a page. "
-            f"page={page_no}/{total_pages} (page_index={page_index}), "
-            f"image={page['page_image_rel']}, "
-            f"embedded={embedded_count}, "
-            f"model={model}. "
-            f"Cause: {e}.{extra_hint}"
-        ) from e
-
-    dt_total = time.monotonic() - t_page0
+            t_retry = time.monotonic()
+            safe_request, safe_key, safe_tokens = await asyncio.to_thread(
+                _page_request, page, prompt_template_md, model, thinking_enabled, control, True
+            )
+            prompt_tokens += safe_tokens
+            page_md = await _cached_response_async(
+                control,
+                safe_key,
+                model,
+                lambda: _call_gemini_async(
+                    lambda: generate_page_markdown_async(
+                        **safe_request(),
+                        page_image_path=page["page_image_abs"],
+                        model=model,
+                        thinking_enabled=thinking_enabled,
+                        image_mime_type=page["page_image_mime_type"],
+                        **_stream_kwargs(stream),
+                    ),
+                    limiter,
+                    control,
+                    progress,
+                    f"Page {page_no}/{total_pages}",
+                ),
+            )
+            timings["gemini_retry"] = time.monotonic() - t_retry
+        _stream_done(stream, control, timings)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        timings["total"] = time.monotonic() - t_page0
+        _stop_if_fail_fast(control)
+        raise _page_failure(e, page, idx, total_pages, model, timings, progress) from e
+
+    timings["total"] = time.monotonic() - t_page0
+    return _page_done(
+        page_md,
+        page,
+        idx,
+        total_pages,
+        output_dir,
+        state,
+        state_lock,
+        timings,
+        progress,
+        limiter,
+        prompt_tokens,
+    )
+
+
+def _batch_label(batch: Sequence[Tuple[int, Dict[str, Any]]], total_pages: int) -> str:
+    return f"Pages {batch[0][0] + 1}-{batch[-1][0] + 1}/{total_pages}"
+
+
+def _batch_request(
+    batch: Sequence[Tuple[int, Dict[str, Any]]],
+    prompt_template_md: str,
+    model: str,
+    thinking_enabled: bool,
+    control: Optional[_RunControl],
+) -> Tuple[Callable[[], Dict[str, Any]], Optional[str], int]:
+    """
+    Keyword arguments for generate_pages_markdown(_async) per attempt (minus
+    model settings), the response-cache key and the estimated prompt tokens.
+    """
+    pages = [page for _, page in batch]
+    mode = _prompt_json(control)
+    references = [_page_reference(page, mode) for page in pages]
+    page_images = [
+        (int(page["page_index"]), page["page_image_abs"], page["page_image_mime_type"])
+        for page in pages
+    ]
+    prompt, tokens = _prompt_request(
+        lambda t: _build_batch_prompt(
+            prompt_template_md=t, references=references, prompt_json=mode
+        ),
+        prompt_template_md,
+        model,
+        control,
+    )
+    key = _response_key(
+        control,
+        model,
+        thinking_enabled,
+        prompt_template_md,
+        references,
+        [page["page_image_abs"] for page in pages],
+        "batch",
+    )
+    return lambda: {**prompt(), "page_images": page_images}, key, tokens
+
+
+def _batch_stream(
+    control: Optional[_RunControl],
+    batch: Sequence[Tuple[int, Dict[str, Any]]],
+    output_dir: Path,
+    progress: _ProgressPrinter,
+    label: str,
+) -> Optional[_StreamWriter]:
+    first, last = int(batch[0][1]["page_index"]), int(batch[-1][1]["page_index"])
+    path = _phase2_pages_dir(output_dir) / f"batch_{first:04d}_{last:04d}.md"
+    return _page_stream(control, path, progress, label)
+
+
+def _batch_failure(
+    err: Exception,
+    batch: Sequence[Tuple[int, Dict[str, Any]]],
+    total_pages: int,
+    model: str,
+    elapsed: float,
+    progress: _ProgressPrinter,
+) -> RuntimeError:
+    """Print the batch's ERROR line and build a context-rich error (recorded for each page)."""
+    page_indices = [int(page["page_index"]) for _, page in batch]
+    label = _batch_label(batch, total_pages)
     progress.finish(
-        "[Phase 2] "
-        f"Page {page_no}/{total_pages}: done "
-        f"(prepare={_format_duration(dt_prepare)}, "
-        f"prompt={_format_duration(dt_prompt)}, "
-        f"gemini={_format_duration(dt_gemini)}, "
-        f"gemini_retry={_format_duration(dt_gemini_retry)}, "
-        f"total={_format_duration(dt_total)}, "
-        f"md_chars={len(page_md)})"
+        f"[Phase 2] {label}: ERROR "
+        f"(batch page_indices={page_indices}, gemini={_format_duration(elapsed)})"
     )
-    
-    # Persist per-page output + state for resume
-    page_md_path.write_text(page_md.strip() + "\n", encoding="utf-8")
-    
-    with state_lock:
-        state.setdefault("completed_pages", {})[str(page_index)] = {
-            "path": str(page_md_path.relative_to(output_dir)),
-            "md_chars": len(page_md),
-            "bytes": int(page_md_path.stat().st_size),
+    return RuntimeError(
+        "Phase 2 failed while converting a batch of pages. "
+        f"pages={label} (page_indices={page_indices}), "
+        f"model={model}. "
+        f"Cause: {err}."
+    )
+
+
+def _batch_done(
+    page_mds: Dict[int, str],
+    batch: Sequence[Tuple[int, Dict[str, Any]]],
+    total_pages: int,
+    output_dir: Path,
+    state: Dict[str, Any],
+    state_lock: threading.Lock,
+    progress: _ProgressPrinter,
+    elapsed: float,
+    limiter: Optional[AdaptiveLimit] = None,
+    prompt_tokens: Optional[int] = None,
+) -> Dict[int, str]:
+    page_indices = [int(page["page_index"]) for _, page in batch]
+    # Each page records its share of the batch prompt, so per-page totals stay comparable
+    extra: Dict[str, Any] = {}
+    if prompt_tokens is not None:
+        extra["prompt_tokens_est"] = round(prompt_tokens / len(batch))
+    for _, page in batch:
+        _record_page_result(
+            output_dir,
+            state,
+            state_lock,
+            page,
+            page_mds[int(page["page_index"])],
+            batch=page_indices,
+            **extra,
+        )
+    progress.finish(
+        f"[Phase 2] {_batch_label(batch, total_pages)}: done (batch page_indices={page_indices}, "
+        f"gemini={_format_duration(elapsed)}, {_prompt_tokens_note(prompt_tokens)}"
+        f"md_chars={sum(len(md) for md in page_mds.values())}{_limit_note(limiter)})"
+    )
+    return {idx: page_mds[int(page["page_index"])] for idx, page in batch}
+
+
+def _process_page_batch(
+    batch: Sequence[Tuple[int, Dict[str, Any]]],
+    total_pages: int,
+    output_dir: Path,
+    state: Dict[str, Any],
+    state_lock: threading.Lock,
+    model: str,
+    prompt_template_md: str,
+    progress: _ProgressPrinter,
+    thinking_enabled: bool = False,
+    limiter: Optional[AdaptiveLimit] = None,
+    control: Optional[_RunControl] = None,
+) -> Dict[int, Union[str, Exception]]:
+    """
+    Convert several model-routed pages in one request.
+
+    A response whose page delimiters cannot be parsed (or a RECITATION
+    block) falls back to per-page requests; any other error fails the
+    batch, and the runner records it for each of its pages.
+
+    Returns:
+        idx -> Markdown, or the exception of a page that failed in the
+        per-page fallback (with fail-fast, pages after it are not attempted)
+    """
+    label = _batch_label(batch, total_pages)
+    t0 = time.monotonic()
+
+    progress.update(
+        f"[Phase 2] {label}: 等待 Gemini 回應（批次 {len(batch)} 頁）…"
+        f"（model={model}{_limit_note(limiter)}）"
+    )
+    page_mds: Optional[Dict[int, str]] = None
+    prompt_tokens: Optional[int] = None
+    stream: Optional[_StreamWriter] = None
+    reason = "unparsable page delimiters"
+    try:
+        request, key, prompt_tokens = _batch_request(
+            batch, prompt_template_md, model, thinking_enabled, control
+        )
+        stream = _batch_stream(control, batch, output_dir, progress, label)
+        response = _cached_response(
+            control,
+            key,
+            model,
+            lambda: _call_gemini(
+                lambda: generate_pages_markdown(
+                    **request(),
+                    model=model,
+                    thinking_enabled=thinking_enabled,
+                    **_stream_kwargs(stream),
+                ),
+                limiter,
+                control,
+                progress,
+                label,
+                kind="batch",
+            ),
+        )
+        page_mds = split_batch_markdown(response, [int(page["page_index"]) for _, page in batch])
+        _stream_done(stream, control, {})
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        # Only a problem with this content is worth per-page requests; a quota, outage or
+        # other error after retries would fail the same way once per page.
+        if not _is_recitation_error(e):
+            _stop_if_fail_fast(control)
+            elapsed = time.monotonic() - t0
+            raise _batch_failure(e, batch, total_pages, model, elapsed, progress) from e
+        reason = str(e)
+    finally:
+        if stream is not None:
+            # Pages are written individually; the batch's .partial file is not promoted
+            stream.discard()
+
+    if page_mds is not None:
+        return dict(
+            _batch_done(
+                page_mds,
+                batch,
+                total_pages,
+                output_dir,
+                state,
+                state_lock,
+                progress,
+                time.monotonic() - t0,
+                limiter,
+                prompt_tokens,
+            )
+        )
+
+    progress.finish(f"[Phase 2] {label}: 批次失敗，改為逐頁請求（{reason}）")
+    results: Dict[int, Union[str, Exception]] = {}
+    for idx, page in batch:
+        try:
+            results[idx] = _process_single_page(
+                page=page,
+                idx=idx,
+                total_pages=total_pages,
+                output_dir=output_dir,
+                state=state,
+                state_lock=state_lock,
+                model=model,
+                prompt_template_md=prompt_template_md,
+                progress=progress,
+                thinking_enabled=thinking_enabled,
+                limiter=limiter,
+                control=control,
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            results[idx] = e
+            if control is None or control.fail_fast:
+                break
+    return results
+
+
+async def _process_page_batch_async(
+    batch: Sequence[Tuple[int, Dict[str, Any]]],
+    total_pages: int,
+    output_dir: Path,
+    state: Dict[str, Any],
+    state_lock: threading.Lock,
+    model: str,
+    prompt_template_md: str,
+    progress: _ProgressPrinter,
+    thinking_enabled: bool = False,
+    limiter: Optional[AdaptiveLimit] = None,
+    control: Optional[_RunControl] = None,
+) -> Dict[int, Union[str, Exception]]:
+    """Async variant of _process_page_batch."""
+    label = _batch_label(batch, total_pages)
+    t0 = time.monotonic()
+
+    progress.update(
+        f"[Phase 2] {label}: 等待 Gemini 回應（批次 {len(batch)} 頁）…"
+        f"（model={model}{_limit_note(limiter)}）"
+    )
+    page_mds: Optional[Dict[int, str]] = None
+    prompt_tokens: Optional[int] = None
+    stream: Optional[_StreamWriter] = None
+    reason = "unparsable page delimiters"
+    try:
+        request, key, prompt_tokens = await asyncio.to_thread(
+            _batch_request, batch, prompt_template_md, model, thinking_enabled, control
+        )
+        stream = _batch_stream(control, batch, output_dir, progress, label)
+        response = await _cached_response_async(
+            control,
+            key,
+            model,
+            lambda: _call_gemini_async(
+                lambda: generate_pages_markdown_async(
+                    **request(),
+                    model=model,
+                    thinking_enabled=thinking_enabled,
+                    **_stream_kwargs(stream),
+                ),
+                limiter,
+                control,
+                progress,
+                label,
+                kind="batch",
+            ),
+        )
+        page_mds = split_batch_markdown(response, [int(page["page_index"]) for _, page in batch])
+        _stream_done(stream, control, {})
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        # Only a problem with this content is worth per-page requests; a quota, outage or
+        # other error after retries would fail the same way once per page.
+        if not _is_recitation_error(e):
+            _stop_if_fail_fast(control)
+            elapsed = time.monotonic() - t0
+            raise _batch_failure(e, batch, total_pages, model, elapsed, progress) from e
+        reason = str(e)
+    finally:
+        if stream is not None:
+            # Pages are written individually; the batch's .partial file is not promoted
+            stream.discard()
+
+    if page_mds is not None:
+        return dict(
+            _batch_done(
+                page_mds,
+                batch,
+                total_pages,
+                output_dir,
+                state,
+                state_lock,
+                progress,
+                time.monotonic() - t0,
+                limiter,
+                prompt_tokens,
+            )
+        )
+
+    progress.finish(f"[Phase 2] {label}: 批次失敗，改為逐頁請求（{reason}）")
+    results: Dict[int, Union[str, Exception]] = {}
+    for idx, page in batch:
+        try:
+            results[idx] = await _process_single_page_async(
+                page=page,
+                idx=idx,
+                total_pages=total_pages,
+                output_dir=output_dir,
+                state=state,
+                state_lock=state_lock,
+                model=model,
+                prompt_template_md=prompt_template_md,
+                progress=progress,
+                thinking_enabled=thinking_enabled,
+                limiter=limiter,
+                control=control,
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            results[idx] = e
+            if control is None or control.fail_fast:
+                break
+    return results
+
+
+def _run_units_threads(
+    units: Sequence[Sequence[Tuple[int, Dict[str, Any]]]],
+    common: Dict[str, Any],
+    max_workers: int,
+    on_outcome: Callable[[int, Union[str, Exception]], None],
+) -> None:
+    """Run the work units on a thread pool; on_outcome raises to stop a fail-fast run."""
+    control: _RunControl = common["control"]
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        future_to_unit = {
+            (
+                executor.submit(_process_page_batch, batch=unit, **common)
+                if len(unit) > 1
+                else executor.submit(
+                    _process_single_page, page=unit[0][1], idx=unit[0][0], **common
+                )
+            ): unit
+            for unit in units
         }
-        _save_phase2_state(output_dir, state)
+        for future in as_completed(future_to_unit):
+            unit = future_to_unit[future]
+            try:
+                outcome = future.result() if len(unit) > 1 else {unit[0][0]: future.result()}
+            except _Cancelled:
+                continue
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                outcome = {idx: e for idx, _ in unit}
+            for idx, value in outcome.items():
+                on_outcome(idx, value)
+    except BaseException:
+        # Fail fast: drop queued pages and stop running ones before their next request.
+        control.cancel.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+
+
+async def _run_units_async(
+    units: Sequence[Sequence[Tuple[int, Dict[str, Any]]]],
+    common: Dict[str, Any],
+    on_outcome: Callable[[int, Union[str, Exception]], None],
+) -> None:
+    """Run every work unit as a task on one event loop (common["limiter"] bounds requests)."""
+
+    async def _run(unit: Sequence[Tuple[int, Dict[str, Any]]]) -> Dict[int, Union[str, Exception]]:
+        try:
+            if len(unit) > 1:
+                return await _process_page_batch_async(batch=unit, **common)
+            idx, page = unit[0]
+            return {idx: await _process_single_page_async(page=page, idx=idx, **common)}
+        except _Cancelled:
+            return {}
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            return {idx: e for idx, _ in unit}
 
-    return page_md.strip()
+    tasks = [asyncio.create_task(_run(unit)) for unit in units]
+    try:
+        for task in asyncio.as_completed(tasks):
+            for idx, value in (await task).items():
+                on_outcome(idx, value)
+    finally:
+        # Fail fast (on_outcome raised): cancel every pending and in-flight request.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 def convert_to_markdown(
-    parse_input_path: str, output_dir: Path, model: str, prompt_file: str, thinking_enabled: bool = False
+    parse_input_path: str,
+    output_dir: Path,
+    model: str,
+    prompt_file: str,
+    thinking_enabled: bool = False,
+    pages_spec: Optional[str] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    text_fast_path: bool = False,
+    batch_pages: int = 1,
+    engine: str = "threads",
+    on_error: str = "fail-fast",
+    prompt_cache: Optional[PromptCache] = None,
+    response_cache: Optional[ResponseCache] = None,
+    stream: bool = False,
+    hedger: Optional[RequestHedger] = None,
+    prompt_json: str = DEFAULT_PROMPT_JSON_MODE,
 ) -> Path:
     """
     Phase 2: Convert parse result to Markdown.
 
+    Each page is routed before conversion: blank pages get an empty result,
+    pages with a clean text layer (see text_layer.route_page) use the
+    Markdown converted locally in Phase 1, and the rest go to the model.
+    The route and its reason are stored per page in phase2/state.json.
+
+    With batch_pages > 1, consecutive model-routed pages that are not yet
+    converted are sent batch_pages at a time in one request; the response is
+    split on per-page delimiters, and a batch whose delimiters cannot be
+    parsed is retried page by page; a batch that fails otherwise (after
+    retries) fails all of its pages.
+
     Args:
         parse_input_path: Path to parse result JSON file
         output_dir: Output directory containing images/
         model: AI model name
         prompt_file: Prompt template markdown file path
+        pages_spec: Optional 1-based page ranges to convert (e.g. "1-10,15")
+        shard: Optional (i, N) to convert only the i-th of N contiguous shards
+            of the selected pages of the whole document (the same pages as
+            Phase 1 with the same shard), limited to the parse result's pages
+        text_fast_path: Convert clean text-layer pages locally instead of
+            sending them to the model (off by default)
+        batch_pages: Model pages per request (1 disables batching)
+        engine: "threads" (one blocking request per worker thread) or
+            "asyncio" (every request on one event loop via the async SDK
+            client; suited to hundreds or thousands of requests in flight)
+        on_error: "fail-fast" cancels queued and in-flight pages at the first
+            page failure and re-raises it; "continue" records failed pages in
+            phase2/state.json, converts the rest, writes the combined output
+            and then raises PartialConversionError
+        prompt_cache: Optional context cache for the prompt template (see
+            prompt_cache.prompt_cache_from_env); requests then send only the
+            page-specific prompt, and fall back to the inlined template when
+            caching is unavailable
+        response_cache: Optional persistent response cache (see
+            response_cache.response_cache_from_env) shared across runs and
+            output directories; pages not yet in this output directory are
+            looked up by image, prompt, model and settings before a request
+        stream: Stream responses (generate_content_stream): chunks are
+            appended to a .partial file beside each phase2/pages/page_XXXX.md,
+            which is promoted atomically once the page completes; progress
+            shows tokens received and each page records its time to first
+            token (ttft_sec)
+        hedger: Optional request hedging (see hedging.hedger_from_env): a
+            request still in flight past a latency percentile of completed
+            requests is duplicated and the first response wins, within a
+            budget of the total requests; not combined with stream
+        prompt_json: How the page JSON appended to each prompt is serialized
+            (see prompt_compaction.PROMPT_JSON_MODES): "full" (default;
+            indented, as parsed), "compact" or "dedup" (duplicated blocks
+            and fields removed, bboxes rounded). Each request's estimated
+            prompt tokens (a recitation retry included) are shown per page,
+            stored as prompt_tokens_est per page in phase2/state.json and
+            totalled in the run summary
+
+    Transient errors (429, 5xx, timeouts) are retried per request with
+    exponential backoff and jitter, honoring Retry-After (see retry.py).
     """
+    if engine not in PHASE2_ENGINES:
+        raise ValueError(
+            f"Unknown Phase 2 engine: {engine!r} (expected one of {', '.join(PHASE2_ENGINES)})"
+        )
+    if on_error not in PHASE2_ERROR_MODES:
+        raise ValueError(
+            f"Unknown on_error mode: {on_error!r} "
+            f"(expected one of {', '.join(PHASE2_ERROR_MODES)})"
+        )
+    if prompt_json not in PROMPT_JSON_MODES:
+        raise ValueError(
+            f"Unknown prompt JSON mode: {prompt_json!r} "
+            f"(expected one of {', '.join(PROMPT_JSON_MODES)})"
+        )
+
     # Load parse result
     parse_result = load_parse_result(Path(parse_input_path))
 
@@ -595,7 +1842,21 @@ def convert_to_markdown(
 
     prompt_template_md = _load_prompt_template(Path(prompt_file))
 
-    pages = _build_pages_input(parse_result=parse_result, output_dir=output_dir)
+    # Shard against the whole document, as Phase 1 does, so the same i/N
+    # selects the same pages in both phases; a partial parse result (e.g. the
+    # output of `--parse-only --shard i/N`) then only limits what is available.
+    doc_pages = int(parse_result.get("total_pages", 0))
+    available = set(get_page_indices(parse_result))
+    page_indices = [
+        p for p in select_pages(range(doc_pages), pages_spec, shard, doc_pages) if p in available
+    ]
+    if not page_indices:
+        raise ValueError("No pages selected for this run (check --pages/--shard)")
+    pages = _build_pages_input(
+        parse_result=parse_result, output_dir=output_dir, page_indices=page_indices
+    )
+    for page in pages:
+        page["route"], page["route_reason"] = _route_page(page, text_fast_path)
 
     # Resume support: save each page as it completes, and skip already-done pages
     parse_path = Path(parse_input_path).resolve()
@@ -610,6 +1871,7 @@ def convert_to_markdown(
         "model": model,
         "total_pages": len(pages),
         "schema_version": parse_result.get("schema_version"),
+        "prompt_json": prompt_json,
     }
 
     # If the existing state does not match current inputs, start a fresh identity
@@ -625,53 +1887,211 @@ def convert_to_markdown(
     progress = _ProgressPrinter(sys.stderr)
     t0 = time.monotonic()
     
-    # Configuration for concurrency
-    concurrency = int(os.getenv("GEMINI_CONCURRENCY", "10"))
-    if concurrency < 1:
-        concurrency = 1
-    
+    # Requests in flight adapt between GEMINI_CONCURRENCY_MIN and _MAX (AIMD)
+    limiter = adaptive_limit_from_env()
+    control = _RunControl(
+        policy=retry_policy_from_env(),
+        fail_fast=on_error == "fail-fast",
+        prompt_cache=prompt_cache,
+        response_cache=response_cache,
+        stream=stream,
+        # Two attempts streaming into one .partial file would interleave
+        hedger=None if stream else hedger,
+        prompt_json=prompt_json,
+    )
+    state["failed_pages"] = {}
+
     total_pages = len(pages)
-    progress.finish(f"[Phase 2] Starting conversion with concurrency={concurrency}")
+    progress.finish(
+        f"[Phase 2] Starting conversion with concurrency={limiter.limit} "
+        f"(min={limiter.minimum}, max={limiter.maximum}), engine={engine}"
+    )
+    if hedger is not None and stream:
+        progress.finish("[Phase 2] 串流模式下不使用 request hedging")
     
     # Store results by page_index to sort later
     results: Dict[int, str] = {}
     state_lock = threading.Lock()
     
-    with ThreadPoolExecutor(max_workers=concurrency) as executor:
-        future_to_page = {
-            executor.submit(
-                _process_single_page,
-                page=page,
-                idx=idx,
-                total_pages=total_pages,
-                output_dir=output_dir,
-                state=state,
-                state_lock=state_lock,
-                model=model,
-                prompt_template_md=prompt_template_md,
-                progress=progress,
-                thinking_enabled=thinking_enabled,
-            ): idx
-            for idx, page in enumerate(pages)
+    # Work units: pending model pages grouped into batches, everything else alone.
+    units: List[List[Tuple[int, Dict[str, Any]]]] = []
+    pending: List[Tuple[int, Dict[str, Any]]] = []
+    for idx, page in enumerate(pages):
+        if (
+            batch_pages > 1
+            and page["route"] == "model"
+            and not _phase2_page_md_path(output_dir, int(page["page_index"])).exists()
+        ):
+            pending.append((idx, page))
+        else:
+            units.append([(idx, page)])
+    units.extend(pending[i : i + batch_pages] for i in range(0, len(pending), batch_pages))
+    batches = sum(1 for unit in units if len(unit) > 1)
+
+    common = {
+        "total_pages": total_pages,
+        "output_dir": output_dir,
+        "state": state,
+        "state_lock": state_lock,
+        "model": model,
+        "prompt_template_md": prompt_template_md,
+        "progress": progress,
+        "thinking_enabled": thinking_enabled,
+        "limiter": limiter,
+        "control": control,
+    }
+    failures: Dict[int, str] = {}
+
+    def _on_outcome(idx: int, value: Union[str, Exception]) -> None:
+        if not isinstance(value, Exception):
+            results[idx] = value
+            return
+        if control.fail_fast:
+            raise value
+        # Continue: record the failure (no page file, so a rerun retries it)
+        failures[idx] = str(value)
+        with state_lock:
+            state.setdefault("failed_pages", {})[str(pages[idx]["page_index"])] = {
+                "error": str(value),
+                "failed_at": datetime.now().isoformat(),
+            }
+            _save_phase2_state(output_dir, state)
+
+    if engine == "asyncio":
+        asyncio.run(_run_units_async(units, common, _on_outcome))
+    else:
+        _run_units_threads(units, common, limiter.maximum, _on_outcome)
+
+    with state_lock:
+        state["concurrency"] = limiter.report()
+        if prompt_cache is not None:
+            state["prompt_cache"] = prompt_cache.report()
+        if response_cache is not None:
+            state["response_cache"] = response_cache.report()
+        if control.hedger is not None:
+            state["hedging"] = control.hedger.report()
+        state["prompt_tokens"] = {
+            "prompt_json": prompt_json,
+            "requests": len(control.prompt_tokens),
+            "total_est": sum(control.prompt_tokens),
         }
-        
-        for future in as_completed(future_to_page):
-            idx = future_to_page[future]
-            try:
-                page_md = future.result()
-                results[idx] = page_md
-            except Exception as e:
-                # If any page fails, we should probably stop or at least log it.
-                # For now, we let the exception bubble up, which stops the main thread 
-                # (but other threads might continue briefly).
-                # raise RuntimeError(f"Failed to process page index {idx}") from e
-                raise
+        _save_phase2_state(output_dir, state)
 
+    routes = Counter(page["route"] for page in pages)
+    cache_note = "".join(
+        f"{part.summary()}, "
+        for part in (prompt_cache, response_cache, control.hedger)
+        if part is not None
+    )
     progress.finish(
-        f"[Phase 2] Convert pages: done ({total_pages}/{total_pages}, {_format_duration(time.monotonic() - t0)})"
+        f"[Phase 2] Convert pages: done ({total_pages - len(failures)}/{total_pages}, "
+        f"pages skipped={routes['blank']} blank, local={routes['local']}, model={routes['model']}, "
+        f"failed={len(failures)}, batches={batches}, {limiter.summary()}, {cache_note}"
+        f"{_prompt_json_note(control)}{_ttft_note(control)}"
+        f"{_format_duration(time.monotonic() - t0)})"
     )
 
     # Sort results by index to ensure correct order
-    sorted_mds = [results[i] for i in range(total_pages)]
-    combined_md = ("\n\n---\n\n".join(sorted_mds)).rstrip() + "\n"
-    return _save_markdown(output_dir, combined_md)
+    sorted_mds = [
+        results[i]
+        if i in results
+        else f"<!-- page_index: {pages[i]['page_index']} conversion failed -->"
+        for i in range(total_pages)
+    ]
+    output_md_path = combine_page_markdown(output_dir, sorted_mds)
+    if failures:
+        raise PartialConversionError(
+            output_md_path, {int(pages[idx]["page_index"]): err for idx, err in failures.items()}
+        )
+    return output_md_path
+
+
+def _copy_into(src_root: Path, rel: str, dst_root: Path) -> None:
+    src = src_root / rel
+    dst = dst_root / rel
+    if src.resolve() == dst.resolve() or dst.exists():
+        return
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(src, dst)
+
+
+def merge_shards(
+    shard_dirs: Sequence[Path], output_dir: Path, overwrite: bool = False
+) -> Dict[str, Any]:
+    """
+    Merge shard output directories into one output directory.
+
+    - parse_result: blocks from every shard, sorted and renumbered (blockIndex)
+    - images/, text/: referenced images and local page Markdown copied into output_dir
+    - phase2/pages/: per-page Markdown copied; if every page is present, the
+      final output_<timestamp>.md is written
+
+    Returns:
+        {"parse_result_path", "output_md_path" (or None), "missing_pages"}
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    blocks: List[Dict[str, Any]] = []
+    page_owner: Dict[int, Path] = {}
+    source_pdf: Optional[str] = None
+    source_sha256: Optional[str] = None
+    total_pages: Optional[int] = None
+
+    for shard_dir in shard_dirs:
+        parse_result = load_parse_result(find_parse_result(shard_dir))
+        if total_pages is None:
+            source_pdf = parse_result.get("source_pdf")
+            source_sha256 = parse_result.get("source_sha256")
+            total_pages = int(parse_result.get("total_pages", 0))
+        elif int(parse_result.get("total_pages", 0)) != total_pages:
+            raise ValueError(
+                f"Shard {shard_dir} is from a different document (total_pages mismatch)"
+            )
+        elif source_sha256 and parse_result.get("source_sha256") not in (None, source_sha256):
+            raise ValueError(
+                f"Shard {shard_dir} is from a different document (source_sha256 mismatch)"
+            )
+
+        for page_index in get_page_indices(parse_result):
+            if page_index in page_owner:
+                raise ValueError(
+                    f"Page index {page_index} appears in both "
+                    f"{page_owner[page_index]} and {shard_dir}"
+                )
+            page_owner[page_index] = shard_dir
+
+        for block in parse_result.get("blocks", []):
+            for key in ("imagePath", "textPath"):
+                if block.get(key):
+                    _copy_into(shard_dir, str(block[key]), output_dir)
+            blocks.append(block)
+
+    merged_pages = sorted(page_owner)
+    merged = create_parse_result(
+        source_pdf=source_pdf or "",
+        total_pages=total_pages or 0,
+        blocks=sort_and_index_blocks(blocks),
+        page_indices=merged_pages,
+        source_sha256=source_sha256,
+    )
+    parse_result_path = save_parse_result(merged, output_dir, overwrite=overwrite)
+
+    page_mds: List[str] = []
+    missing_pages: List[int] = []
+    for page_index in merged_pages:
+        rel = f"phase2/pages/page_{page_index:04d}.md"
+        src = page_owner[page_index] / rel
+        if not src.exists():
+            missing_pages.append(page_index)
+            continue
+        _copy_into(page_owner[page_index], rel, output_dir)
+        page_mds.append(src.read_text(encoding="utf-8").strip())
+
+    output_md_path = None
+    if merged_pages and not missing_pages:
+        output_md_path = combine_page_markdown(output_dir, page_mds)
+
+    return {
+        "parse_result_path": parse_result_path,
+        "output_md_path": output_md_path,
+        "missing_pages": missing_pages,
+    }
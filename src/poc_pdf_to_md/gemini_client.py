@@ -5,21 +5,154 @@ This module is intentionally thin so it can be easily mocked in tests.
 
 from __future__ import annotations
 
+import asyncio
+import dataclasses
 import os
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
+import httpx
 from dotenv import load_dotenv
 from google import genai  # type: ignore[import-not-found]
 from google.genai import types  # type: ignore[import-not-found]
 
+from .concurrency import DEFAULT_MAX_FACTOR, note_rate_limit_wait
+from .rate_limit import estimate_tokens, rate_limiter_from_env
+
+# Process-wide client shared by the Phase 2 worker threads (see get_client).
+_CLIENT_LOCK = threading.Lock()
+_CLIENT: genai.Client | None = None
+_CLIENT_KEY: Tuple[str, int, int] | None = None
+_DOTENV_LOADED = False
+
 
 def _get_api_key() -> str:
-    # Load .env if present (safe no-op if not).
-    load_dotenv()
+    global _DOTENV_LOADED  # pylint: disable=global-statement
+    if not _DOTENV_LOADED:
+        # Load .env if present (safe no-op if not); once per process.
+        load_dotenv()
+        _DOTENV_LOADED = True
     return os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY") or ""
 
 
+def _http_pool_limits() -> Tuple[int, int]:
+    """(max_connections, max_keepalive_connections) from the environment.
+
+    Defaults to the Phase 2 concurrency upper bound (GEMINI_CONCURRENCY_MAX,
+    else 4x GEMINI_CONCURRENCY as in concurrency.adaptive_limit_from_env) so
+    every request in flight can keep its connection open between pages.
+    """
+    concurrency = max(int(os.getenv("GEMINI_CONCURRENCY", "10")), 1)
+    maximum = int(os.getenv("GEMINI_CONCURRENCY_MAX", str(concurrency * DEFAULT_MAX_FACTOR)))
+    default = max(maximum, concurrency)
+    max_connections = max(int(os.getenv("GEMINI_HTTP_MAX_CONNECTIONS", str(default))), 1)
+    keepalive = int(os.getenv("GEMINI_HTTP_MAX_KEEPALIVE", str(max_connections)))
+    return max_connections, min(max(keepalive, 0), max_connections)
+
+
+def create_client(api_key: str, max_connections: int, max_keepalive: int) -> genai.Client:
+    """Build a Gemini client whose HTTP connection pool has the given limits."""
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(
+            client_args={"limits": limits}, async_client_args={"limits": limits}
+        ),
+    )
+
+
+def get_client(api_key: Optional[str] = None) -> genai.Client:
+    """Return the process-wide Gemini client, creating it on first use.
+
+    The client (and its HTTP connection pool) is reused by every request;
+    it is rebuilt only when the API key or pool limits change.
+
+    Args:
+        api_key: Key to use instead of GEMINI_API_KEY / GOOGLE_API_KEY
+    """
+    global _CLIENT, _CLIENT_KEY  # pylint: disable=global-statement
+    api_key = api_key or _get_api_key()
+    if not api_key:
+        raise RuntimeError(
+            "Missing API key. Set GEMINI_API_KEY (preferred) or GOOGLE_API_KEY."
+        )
+    key = (api_key, *_http_pool_limits())
+    with _CLIENT_LOCK:
+        if _CLIENT is None or _CLIENT_KEY != key:
+            _CLIENT = create_client(*key)
+            _CLIENT_KEY = key
+        return _CLIENT
+
+
+def reset_client() -> None:
+    """Drop the pooled client (the next request builds a new one)."""
+    global _CLIENT, _CLIENT_KEY  # pylint: disable=global-statement
+    with _CLIENT_LOCK:
+        _CLIENT = None
+        _CLIENT_KEY = None
+
+
+def _cache_entry(cache: Any, ttl_sec: float) -> Tuple[str, float]:
+    expire_time = getattr(cache, "expire_time", None)
+    expires_at = expire_time.timestamp() if expire_time is not None else time.time() + ttl_sec
+    return cache.name, expires_at
+
+
+def create_cached_prompt(
+    *, model: str, prompt_text: str, ttl_sec: float, display_name: str
+) -> Tuple[str, float]:
+    """Create a context-cache entry holding a prompt that every request starts with.
+
+    Returns:
+        (cache name for the cached_content request option, expiry as a Unix timestamp)
+    """
+    cache = get_client().caches.create(
+        model=model,
+        config=types.CreateCachedContentConfig(
+            contents=[prompt_text], display_name=display_name, ttl=f"{int(ttl_sec)}s"
+        ),
+    )
+    return _cache_entry(cache, ttl_sec)
+
+
+def find_cached_prompt(*, model: str, display_name: str) -> Optional[Tuple[str, float]]:
+    """(name, expiry) of an existing, unexpired cache entry for this model and display name."""
+    model_id = model.rsplit("/", 1)[-1]
+    for cache in get_client().caches.list():
+        expire_time = getattr(cache, "expire_time", None)
+        if (
+            cache.display_name == display_name
+            and str(cache.model).rsplit("/", 1)[-1] == model_id
+            and expire_time is not None
+            and expire_time.timestamp() > time.time()
+        ):
+            return cache.name, expire_time.timestamp()
+    return None
+
+
+def extend_cached_prompt(*, name: str, ttl_sec: float) -> Tuple[str, float]:
+    """Reset a cache entry's TTL; returns its (name, new expiry)."""
+    cache = get_client().caches.update(
+        name=name, config=types.UpdateCachedContentConfig(ttl=f"{int(ttl_sec)}s")
+    )
+    return _cache_entry(cache, ttl_sec)
+
+
+_MIME_TYPES_BY_EXT = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+
+def mime_type_for_ext(ext: str | None) -> str:
+    """Map a parse_result `ext` value to the MIME type sent to Gemini (default PNG)."""
+    return _MIME_TYPES_BY_EXT.get((ext or "png").lower(), "image/png")
+
+
 def _summarize_genai_response(resp: Any) -> str:
     """Return a short, safe diagnostic summary for debugging."""
     parts: list[str] = [f"response_type={type(resp).__name__}"]
@@ -58,40 +191,12 @@ def _summarize_genai_response(resp: Any) -> str:
     return ", ".join(parts)
 
 
-def generate_page_markdown(
-    *,
-    prompt_text: str,
-    page_image_path: Path,
-    model: str,
-    generation_config: Dict[str, Any] | None = None,
-    thinking_enabled: bool = False,
-) -> str:
-    """Generate Markdown for a single page using Gemini (multimodal).
-
-    Args:
-        prompt_text: Final prompt text (already includes page context).
-        page_image_path: Absolute path to the page PNG.
-        model: Gemini model name.
-        generation_config: Optional model generation config.
-        thinking_enabled: Whether to enable thinking mode (include_thoughts).
-    """
-    api_key = _get_api_key()
-    if not api_key:
-        raise RuntimeError(
-            "Missing API key. Set GEMINI_API_KEY (preferred) or GOOGLE_API_KEY."
-        )
-
-    # Use the new SDK: google-genai (import path: google.genai).
-    client = genai.Client(api_key=api_key)
-
-    image_bytes = page_image_path.read_bytes()
-    image_part = types.Part.from_bytes(data=image_bytes, mime_type="image/png")
-
-    kwargs: Dict[str, Any] = {}
-    
+def _build_config(
+    generation_config: Dict[str, Any] | None, thinking_enabled: bool
+) -> Dict[str, Any]:
     # Prepare config
     final_config = generation_config.copy() if generation_config else {}
-    
+
     # Configure thinking mode
     if "thinking_config" not in final_config:
         if thinking_enabled:
@@ -103,15 +208,29 @@ def generate_page_markdown(
             # According to docs, thinking_budget=0 disables thinking.
             final_config["thinking_config"] = {"thinking_budget": 0}
 
+    # Per-request timeout (GEMINI_REQUEST_TIMEOUT seconds, 0 = SDK default / none)
+    timeout_sec = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "300") or 0)
+    if timeout_sec > 0 and "http_options" not in final_config:
+        final_config["http_options"] = {"timeout": int(timeout_sec * 1000)}
+    return final_config
+
+
+def _request_kwargs(
+    generation_config: Dict[str, Any] | None,
+    thinking_enabled: bool,
+    cached_content: str | None = None,
+) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {}
+    final_config = _build_config(generation_config, thinking_enabled)
+    if cached_content:
+        # Context-cache entry holding the static prompt template (see prompt_cache.py)
+        final_config["cached_content"] = cached_content
     if final_config:
         kwargs["config"] = final_config
+    return kwargs
 
-    resp = client.models.generate_content(
-        model=model,
-        contents=[prompt_text, image_part],
-        **kwargs,
-    )
 
+def _response_text(resp: Any) -> str:
     # Best-effort extraction across SDK versions.
     text = getattr(resp, "text", None)
     if isinstance(text, str) and text.strip():
@@ -122,3 +241,246 @@ def generate_page_markdown(
         "Gemini returned an empty response (missing response.text). "
         f"Diagnostics: {summary}"
     )
+
+
+# Streaming callback: (chunk text, candidates tokens received so far if reported)
+ChunkCallback = Callable[[str, Optional[int]], None]
+
+
+@dataclasses.dataclass
+class _StreamedResponse:
+    """A streamed response reassembled for _response_text / _prompt_tokens.
+
+    Metadata (usage, candidates, prompt feedback) comes from the last chunk.
+    """
+
+    text: str
+    usage_metadata: Any = None
+    candidates: Any = None
+    prompt_feedback: Any = None
+
+
+def _stream_chunk(chunk: Any, parts: List[str], on_chunk: ChunkCallback) -> None:
+    text = getattr(chunk, "text", None)
+    if not isinstance(text, str) or not text:
+        return
+    parts.append(text)
+    usage = getattr(chunk, "usage_metadata", None)
+    on_chunk(text, getattr(usage, "candidates_token_count", None) if usage is not None else None)
+
+
+def _streamed_response(parts: List[str], last: Any) -> _StreamedResponse:
+    return _StreamedResponse(
+        text="".join(parts),
+        usage_metadata=getattr(last, "usage_metadata", None),
+        candidates=getattr(last, "candidates", None),
+        prompt_feedback=getattr(last, "prompt_feedback", None),
+    )
+
+
+def _estimate_request_tokens(contents: List[Any]) -> int:
+    texts = [c for c in contents if isinstance(c, str)]
+    images = [c.inline_data.data for c in contents if getattr(c, "inline_data", None) is not None]
+    return estimate_tokens(texts, images)
+
+
+def _prompt_tokens(resp: Any) -> int | None:
+    usage = getattr(resp, "usage_metadata", None)
+    return getattr(usage, "prompt_token_count", None) if usage is not None else None
+
+
+def _generate_content(
+    contents: List[Any],
+    model: str,
+    generation_config: Dict[str, Any] | None,
+    thinking_enabled: bool,
+    cached_content: str | None = None,
+    on_chunk: ChunkCallback | None = None,
+) -> str:
+    # Use the new SDK: google-genai (import path: google.genai).
+    client = get_client()
+    # Host-wide RPM/TPM budget (GEMINI_RPM / GEMINI_TPM), if configured
+    rate_limiter = rate_limiter_from_env()
+    estimated_tokens = _estimate_request_tokens(contents)
+    reservation = rate_limiter.acquire(model, estimated_tokens) if rate_limiter else None
+    if reservation is not None:
+        note_rate_limit_wait(reservation.waited_sec)
+    kwargs = _request_kwargs(generation_config, thinking_enabled, cached_content)
+    resp = None
+    try:
+        if on_chunk is None:
+            resp = client.models.generate_content(model=model, contents=contents, **kwargs)
+        else:
+            # Streaming: hand each chunk to the caller as it arrives
+            parts: List[str] = []
+            last = None
+            stream = client.models.generate_content_stream(model=model, contents=contents, **kwargs)
+            for last in stream:
+                _stream_chunk(last, parts, on_chunk)
+            resp = _streamed_response(parts, last)
+    finally:
+        if rate_limiter and reservation:
+            # A failed request (retried or not) is not charged its tokens
+            rate_limiter.settle(reservation, _prompt_tokens(resp) if resp is not None else 0)
+    return _response_text(resp)
+
+
+async def _generate_content_async(
+    contents: List[Any],
+    model: str,
+    generation_config: Dict[str, Any] | None,
+    thinking_enabled: bool,
+    cached_content: str | None = None,
+    on_chunk: ChunkCallback | None = None,
+) -> str:
+    # Same pooled client; client.aio shares its settings and HTTP pool limits.
+    client = get_client()
+    rate_limiter = rate_limiter_from_env()
+    estimated_tokens = _estimate_request_tokens(contents)
+    reservation = (
+        await rate_limiter.acquire_async(model, estimated_tokens) if rate_limiter else None
+    )
+    if reservation is not None:
+        note_rate_limit_wait(reservation.waited_sec)
+    kwargs = _request_kwargs(generation_config, thinking_enabled, cached_content)
+    resp = None
+    try:
+        if on_chunk is None:
+            resp = await client.aio.models.generate_content(
+                model=model, contents=contents, **kwargs
+            )
+        else:
+            parts: List[str] = []
+            last = None
+            async for last in await client.aio.models.generate_content_stream(
+                model=model, contents=contents, **kwargs
+            ):
+                _stream_chunk(last, parts, on_chunk)
+            resp = _streamed_response(parts, last)
+    finally:
+        if rate_limiter and reservation:
+            await asyncio.to_thread(
+                rate_limiter.settle, reservation, _prompt_tokens(resp) if resp is not None else 0
+            )
+    return _response_text(resp)
+
+
+def _image_part(image_path: Path, mime_type: str) -> Any:
+    return types.Part.from_bytes(data=image_path.read_bytes(), mime_type=mime_type)
+
+
+def _pages_contents(prompt_text: str, page_images: Sequence[Tuple[int, Path, str]]) -> List[Any]:
+    contents: List[Any] = [prompt_text]
+    for page_index, image_path, mime_type in page_images:
+        contents.append(f"page_index={page_index}:")
+        contents.append(_image_part(image_path, mime_type))
+    return contents
+
+
+def generate_page_markdown(
+    *,
+    prompt_text: str,
+    page_image_path: Path,
+    model: str,
+    generation_config: Dict[str, Any] | None = None,
+    thinking_enabled: bool = False,
+    image_mime_type: str = "image/png",
+    cached_content: str | None = None,
+    on_chunk: ChunkCallback | None = None,
+) -> str:
+    """Generate Markdown for a single page using Gemini (multimodal).
+
+    Args:
+        prompt_text: Final prompt text (already includes page context).
+        page_image_path: Absolute path to the page image.
+        model: Gemini model name.
+        generation_config: Optional model generation config.
+        thinking_enabled: Whether to enable thinking mode (include_thoughts).
+        image_mime_type: MIME type of the page image (see mime_type_for_ext).
+        cached_content: Optional context-cache entry (see create_cached_prompt)
+            holding the static prompt template; prompt_text then carries only
+            the page-specific part.
+        on_chunk: Optional callback; when given, the response is streamed
+            (generate_content_stream) and each text chunk is passed to it as
+            (text, candidates tokens so far or None) before the full text
+            is returned.
+    """
+    image_part = _image_part(page_image_path, image_mime_type)
+    return _generate_content(
+        [prompt_text, image_part],
+        model,
+        generation_config,
+        thinking_enabled,
+        cached_content,
+        on_chunk,
+    )
+
+
+def generate_pages_markdown(
+    *,
+    prompt_text: str,
+    page_images: Sequence[Tuple[int, Path, str]],
+    model: str,
+    generation_config: Dict[str, Any] | None = None,
+    thinking_enabled: bool = False,
+    cached_content: str | None = None,
+    on_chunk: ChunkCallback | None = None,
+) -> str:
+    """Generate Markdown for several pages in one request (one image part per page).
+
+    Each image is preceded by a short text part naming its page_index so the
+    model can match images to the per-page data in the prompt.
+
+    Args:
+        prompt_text: Final batch prompt text (includes every page's context).
+        page_images: (page_index, absolute image path, MIME type) per page, in order.
+        model: Gemini model name.
+        generation_config: Optional model generation config.
+        thinking_enabled: Whether to enable thinking mode (include_thoughts).
+        cached_content: Optional context-cache entry holding the prompt template.
+        on_chunk: Optional streaming callback (see generate_page_markdown).
+    """
+    contents = _pages_contents(prompt_text, page_images)
+    return _generate_content(
+        contents, model, generation_config, thinking_enabled, cached_content, on_chunk
+    )
+
+
+async def generate_page_markdown_async(
+    *,
+    prompt_text: str,
+    page_image_path: Path,
+    model: str,
+    generation_config: Dict[str, Any] | None = None,
+    thinking_enabled: bool = False,
+    image_mime_type: str = "image/png",
+    cached_content: str | None = None,
+    on_chunk: ChunkCallback | None = None,
+) -> str:
+    """Async variant of generate_page_markdown (uses the SDK's client.aio)."""
+    image_part = await asyncio.to_thread(_image_part, page_image_path, image_mime_type)
+    return await _generate_content_async(
+        [prompt_text, image_part],
+        model,
+        generation_config,
+        thinking_enabled,
+        cached_content,
+        on_chunk,
+    )
+
+
+async def generate_pages_markdown_async(
+    *,
+    prompt_text: str,
+    page_images: Sequence[Tuple[int, Path, str]],
+    model: str,
+    generation_config: Dict[str, Any] | None = None,
+    thinking_enabled: bool = False,
+    cached_content: str | None = None,
+    on_chunk: ChunkCallback | None = None,
+) -> str:
+    """Async variant of generate_pages_markdown (uses the SDK's client.aio)."""
+    contents = await asyncio.to_thread(_pages_contents, prompt_text, page_images)
+    return await _generate_content_async(
+        contents, model, generation_config, thinking_enabled, cached_content, on_chunk
+    )
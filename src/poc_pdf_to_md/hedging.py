@@ -0,0 +1,258 @@
+"""Hedged Gemini requests for Phase 2 tail latency.
+
+When a request is still in flight after a running percentile (default p95)
+of recent latencies of the same kind of request (single pages and batches
+are tracked apart), a duplicate is sent; whichever finishes first wins and
+the other is cancelled (asyncio engine) or abandoned with its result
+discarded (thread engine, where a blocking HTTP call cannot be
+interrupted). Hedges are capped at a fraction of all requests so far.
+
+A duplicate is only sent when the concurrency limit has a free slot; it
+holds that slot until both requests are done, so an abandoned request
+still counts as in flight. It also goes through the shared rate limiter
+like any other request. The thread engine runs requests on a bounded pool
+of GEMINI_HEDGE_MAX_THREADS threads and skips hedging when it is busy.
+"""
+
+import asyncio
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import wait
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from .concurrency import AdaptiveLimit, unslotted_context
+
+# Latency samples kept per request kind for the percentile (most recent requests)
+_WINDOW = 200
+
+
+class RequestHedger:
+    """Send a duplicate of requests that run past a latency percentile, within a budget."""
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        budget: float = 0.05,
+        min_samples: int = 10,
+        max_threads: int = 32,
+    ) -> None:
+        self.percentile = min(max(percentile, 1.0), 100.0)
+        self.budget = max(budget, 0.0)
+        self.min_samples = max(min_samples, 1)
+        self.max_threads = max(max_threads, 2)
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._threads_busy = 0
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def observe(self, latency: float, kind: str = "page") -> None:
+        """Add the latency of a completed request of the given kind ("page" or "batch")."""
+        with self._lock:
+            self._latencies.setdefault(kind, deque(maxlen=_WINDOW)).append(latency)
+
+    def threshold(self, kind: str = "page") -> Optional[float]:
+        """In-flight time after which a request is hedged, or None until enough samples exist."""
+        with self._lock:
+            latencies = self._latencies.get(kind, ())
+            if len(latencies) < self.min_samples:
+                return None
+            ordered = sorted(latencies)
+        return ordered[max(math.ceil(self.percentile / 100 * len(ordered)) - 1, 0)]
+
+    def _start(self, kind: str) -> Optional[float]:
+        with self._lock:
+            self.requests += 1
+        return self.threshold(kind)
+
+    def _take_hedge(self, limiter: Optional[AdaptiveLimit]) -> bool:
+        """Take one hedge from the budget (a fraction of the requests so far) and a free slot."""
+        with self._lock:
+            if self.hedged + 1 > self.budget * self.requests:
+                return False
+            self.hedged += 1
+        if limiter is None or limiter.try_reserve():
+            return True
+        with self._lock:
+            self.hedged -= 1
+        return False
+
+    def _refund_hedge(self, limiter: Optional[AdaptiveLimit]) -> None:
+        with self._lock:
+            self.hedged -= 1
+        if limiter is not None:
+            limiter.release_reserved()
+
+    def _won(self, latency: float, hedge: bool, kind: str) -> None:
+        self.observe(latency, kind)
+        if hedge:
+            with self._lock:
+                self.hedge_wins += 1
+
+    def _submit(self, fn: Callable[[], Any], context: contextvars.Context) -> Optional[Future]:
+        """Run fn on the pool in context, or return None when every pool thread is busy."""
+        with self._lock:
+            if self._threads_busy >= self.max_threads:
+                return None
+            self._threads_busy += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_threads, thread_name_prefix="gemini-hedge"
+                )
+            executor = self._executor
+        fut = executor.submit(context.run, fn)
+        fut.add_done_callback(self._thread_done)
+        return fut
+
+    def _thread_done(self, _fut: Future) -> None:
+        with self._lock:
+            self._threads_busy -= 1
+
+    def call(
+        self, fn: Callable[[], Any], limiter: Optional[AdaptiveLimit] = None, kind: str = "page"
+    ) -> Any:
+        """Run fn (thread engine), hedging it once it runs past the threshold for kind."""
+        threshold = self._start(kind)
+        t0 = time.monotonic()
+        primary = self._submit(fn, contextvars.copy_context()) if threshold is not None else None
+        if primary is None:
+            result = fn()
+            self.observe(time.monotonic() - t0, kind)
+            return result
+
+        try:
+            result = primary.result(timeout=threshold)
+            self.observe(time.monotonic() - t0, kind)
+            return result
+        except FutureTimeoutError:
+            pass
+        hedge = None
+        if self._take_hedge(limiter):
+            hedge = self._submit(fn, unslotted_context())
+            if hedge is None:
+                self._refund_hedge(limiter)
+        if hedge is None:
+            result = primary.result()
+            self.observe(time.monotonic() - t0, kind)
+            return result
+        t_hedge = time.monotonic()
+        if limiter is not None:
+            _release_after_both(primary, hedge, limiter)
+
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    started = t_hedge if fut is hedge else t0
+                    self._won(time.monotonic() - started, fut is hedge, kind)
+                    # The loser keeps running on the pool; its result is discarded.
+                    return fut.result()
+        return primary.result()  # Both failed: raise the primary's error
+
+    async def call_async(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        limiter: Optional[AdaptiveLimit] = None,
+        kind: str = "page",
+    ) -> Any:
+        """Run fn (asyncio engine), hedged past the threshold for kind; the loser is cancelled."""
+        threshold = self._start(kind)
+        t0 = time.monotonic()
+        if threshold is None:
+            result = await fn()
+            self.observe(time.monotonic() - t0, kind)
+            return result
+
+        primary = asyncio.ensure_future(fn())
+        hedge: Optional[asyncio.Task] = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=threshold)
+            if primary in done or not self._take_hedge(limiter):
+                result = await primary
+                self.observe(time.monotonic() - t0, kind)
+                return result
+
+            t_hedge = time.monotonic()
+            hedge = asyncio.get_running_loop().create_task(fn(), context=unslotted_context())
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        started = t_hedge if task is hedge else t0
+                        self._won(time.monotonic() - started, task is hedge, kind)
+                        return task.result()
+            return primary.result()  # Both failed: raise the primary's error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+            if hedge is not None and limiter is not None:
+                await limiter.release_reserved_async()
+
+    def report(self) -> Dict[str, Any]:
+        """Snapshot for phase2/state.json."""
+        thresholds = {}
+        with self._lock:
+            kinds = sorted(self._latencies)
+        for kind in kinds:
+            threshold = self.threshold(kind)
+            thresholds[kind] = round(threshold, 3) if threshold is not None else None
+        return {
+            "percentile": self.percentile,
+            "budget": self.budget,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "threshold_sec": thresholds,
+        }
+
+    def summary(self) -> str:
+        """One-line summary for the Phase 2 run report."""
+        return (
+            f"hedged={self.hedged}/{self.requests} (wins={self.hedge_wins}, "
+            f"budget={self.budget:.0%}, p{self.percentile:g})"
+        )
+
+
+def _release_after_both(primary: Future, hedge: Future, limiter: AdaptiveLimit) -> None:
+    """Give back the hedge's reserved slot once neither request is running any more."""
+    lock = threading.Lock()
+    remaining = [2]
+
+    def _done(_fut: Future) -> None:
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            limiter.release_reserved()
+
+    primary.add_done_callback(_done)
+    hedge.add_done_callback(_done)
+
+
+def hedger_from_env() -> RequestHedger:
+    """
+    Build the Phase 2 hedger from the environment.
+
+    GEMINI_HEDGE_PERCENTILE (default 95), GEMINI_HEDGE_BUDGET (fraction of
+    requests that may be duplicated, default 0.05),
+    GEMINI_HEDGE_MIN_SAMPLES (completed requests of a kind before hedging
+    starts, default 10) and GEMINI_HEDGE_MAX_THREADS (thread engine pool
+    size, default 32).
+    """
+    return RequestHedger(
+        percentile=float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95")),
+        budget=float(os.getenv("GEMINI_HEDGE_BUDGET", "0.05")),
+        min_samples=int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "10")),
+        max_threads=int(os.getenv("GEMINI_HEDGE_MAX_THREADS", "32")),
+    )
@@ -1,8 +1,12 @@
 """Image handling and storage."""
 
+import hashlib
+import os
+import shutil
+import time
 import uuid
 from pathlib import Path
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Optional, Tuple
 
 
 def generate_image_filename(ext: str) -> str:
@@ -10,13 +14,26 @@ def generate_image_filename(ext: str) -> str:
     return f"{uuid.uuid4()}.{ext}"
 
 
+def generate_content_image_filename(image_bytes: bytes, ext: str) -> str:
+    """Generate image filename from the SHA-256 of its content.
+
+    Byte-identical images get the same name, so each is stored only once.
+    """
+    return f"{hashlib.sha256(image_bytes).hexdigest()}.{ext}"
+
+
 def generate_page_image_filename(page_number: int, ext: str = "png") -> str:
     """Generate page image filename using page number as suffix."""
     return f"page_{page_number:04d}.{ext}"
 
 
 def save_image(
-    image_bytes: bytes, output_dir: Path, filename: str, overwrite: bool = False
+    image_bytes: bytes,
+    output_dir: Path,
+    filename: str,
+    overwrite: bool = False,
+    content_addressed: bool = False,
+    store_dir: Optional[Path] = None,
 ) -> Path:
     """
     Save image to file and return path relative to output_dir.
@@ -26,6 +43,12 @@ def save_image(
         output_dir: Output directory
         filename: Filename for the image
         overwrite: Whether to overwrite existing file (default: False)
+        content_addressed: Filename is derived from the content (see
+            generate_content_image_filename); an existing file is reused as-is
+            and new files are written atomically so concurrent writers are safe.
+        store_dir: Optional cross-run blob store (content-addressed saves
+            only). The blob is written into the store once and hard-linked
+            into images/ (copied when hard links are not possible).
     
     Returns:
         Path relative to output_dir
@@ -33,12 +56,23 @@ def save_image(
     images_dir = output_dir / "images"
     images_dir.mkdir(parents=True, exist_ok=True)
     image_path = images_dir / filename
+
+    if content_addressed:
+        if not image_path.exists():
+            if store_dir is not None:
+                try:
+                    _link_or_copy(_store_blob(image_bytes, store_dir, filename), image_path)
+                except FileNotFoundError:
+                    # Blob was garbage-collected between the check and the link.
+                    _link_or_copy(_store_blob(image_bytes, store_dir, filename), image_path)
+            else:
+                _atomic_write(image_bytes, image_path)
+        return image_path.relative_to(output_dir)
     
     if image_path.exists() and not overwrite:
         # If file exists and overwrite is False, generate new UUID filename
         # This only applies to UUID-based filenames, not page_*.png
         if not filename.startswith("page_"):
-            import uuid
             ext = image_path.suffix
             filename = f"{uuid.uuid4()}{ext}"
             image_path = images_dir / filename
@@ -47,6 +81,69 @@ def save_image(
     return image_path.relative_to(output_dir)
 
 
+def _atomic_write(data: bytes, path: Path) -> None:
+    tmp_path = path.parent / f".{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _blob_path(store_dir: Path, filename: str) -> Path:
+    # Fan out by the first two hex digits to keep directories small.
+    return store_dir / filename[:2] / filename
+
+
+def _store_blob(image_bytes: bytes, store_dir: Path, filename: str) -> Path:
+    """Write a content-addressed blob into the store once and return its path."""
+    blob_path = _blob_path(store_dir, filename)
+    if not blob_path.exists():
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write(image_bytes, blob_path)
+    return blob_path
+
+
+def _link_or_copy(blob_path: Path, image_path: Path) -> None:
+    """Hard-link a store blob into a run's images/ dir, copying as a fallback."""
+    tmp_path = image_path.parent / f".{image_path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(blob_path, tmp_path)
+    except OSError:
+        # Cross-device store or filesystem without hard links.
+        shutil.copyfile(blob_path, tmp_path)
+    os.replace(tmp_path, image_path)
+
+
+def gc_image_store(store_dir: Path, min_age_sec: float = 3600.0) -> Dict[str, int]:
+    """
+    Remove store blobs that are no longer referenced by any run.
+
+    A blob's reference count is its hard-link count: every run's images/
+    entry is a hard link, so a blob with st_nlink == 1 is referenced only by
+    the store itself. Runs that fell back to copies hold independent files
+    and are unaffected. Blobs younger than `min_age_sec` are kept so that a
+    run which just wrote a blob but has not linked it yet is not raced.
+
+    Returns:
+        Counts: {"scanned", "removed", "bytes_freed", "kept"}
+    """
+    stats = {"scanned": 0, "removed": 0, "bytes_freed": 0, "kept": 0}
+    if not store_dir.exists():
+        return stats
+
+    now = time.time()
+    for blob_path in store_dir.glob("*/*"):
+        if not blob_path.is_file() or blob_path.name.startswith("."):
+            continue
+        stats["scanned"] += 1
+        st = blob_path.stat()
+        if st.st_nlink <= 1 and now - st.st_mtime >= min_age_sec:
+            blob_path.unlink()
+            stats["removed"] += 1
+            stats["bytes_freed"] += int(st.st_size)
+        else:
+            stats["kept"] += 1
+    return stats
+
+
 def update_parse_result_image_path(
     parse_result: Dict[str, Any], block_index: int, image_path: Path
 ) -> None:
@@ -0,0 +1,138 @@
+"""Phase 1 manifest for incremental and resumable runs.
+
+The manifest is an append-only JSON Lines file in parsed/:
+
+    {"manifest_version": 2, "pdf_sha256": ..., "settings": {...}}   (header)
+    {"page": {"page_index": 0, "page_image": {...}, "images": [...], "files": {...}}}
+    {"parse_result": "parse_result_....json", "page_indices": [...]}
+
+A page line is appended as soon as the page's files are written, so a run
+that crashes keeps every finished page. Entries are only valid for the PDF
+content hash and render settings in the header; a header mismatch starts a
+fresh manifest.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+MANIFEST_FILENAME = "phase1_manifest.jsonl"
+_MANIFEST_VERSION = 2
+
+
+def _page_files(output_dir: Path, page_result: Dict[str, Any]) -> Dict[str, int]:
+    page_image = page_result["page_image"]
+    paths = [b["imagePath"] for b in (page_image, *page_result["images"])]
+    if page_image.get("textPath"):
+        paths.append(page_image["textPath"])
+    return {rel: (output_dir / rel).stat().st_size for rel in paths}
+
+
+class Phase1Manifest:
+    """Per-page record of completed Phase 1 work for one output directory."""
+
+    def __init__(
+        self, output_dir: Path, pdf_sha256: str, settings: Dict[str, Any], fresh: bool = False
+    ) -> None:
+        self.output_dir = output_dir
+        self.path = output_dir / "parsed" / MANIFEST_FILENAME
+        self._header = {
+            "manifest_version": _MANIFEST_VERSION,
+            "pdf_sha256": pdf_sha256,
+            "settings": settings,
+        }
+        self._pages: Dict[int, Dict[str, Any]] = {}
+        self._parse_results: List[Dict[str, Any]] = []
+
+        if not fresh and self._load():
+            self._file = open(self.path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "w", encoding="utf-8")  # pylint: disable=consider-using-with
+            self._append(self._header)
+
+    def _load(self) -> bool:
+        """Load entries if the manifest exists and matches this PDF and settings."""
+        if not self.path.exists():
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        try:
+            if not lines or json.loads(lines[0]) != self._header:
+                return False
+        except json.JSONDecodeError:
+            return False
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn last line from a crashed run
+                continue
+            if "page" in entry:
+                self._pages[int(entry["page"]["page_index"])] = entry["page"]
+            elif "parse_result" in entry:
+                self._parse_results.append(entry)
+        return True
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        """Close the manifest file."""
+        self._file.close()
+
+    def __enter__(self) -> "Phase1Manifest":
+        return self
+
+    def __exit__(self, *_exc: Any) -> None:
+        self.close()
+
+    def completed_pages(self, page_indices: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Return stored page results whose output files still exist unchanged.
+
+        Returns:
+            page_index -> {"page_image": block, "images": [blocks], "skipped": [blocks]}
+        """
+        done: Dict[int, Dict[str, Any]] = {}
+        for page_index in page_indices:
+            entry = self._pages.get(page_index)
+            if entry is None:
+                continue
+            if all(
+                (self.output_dir / rel).is_file() and (self.output_dir / rel).stat().st_size == size
+                for rel, size in entry["files"].items()
+            ):
+                done[page_index] = {
+                    "page_image": entry["page_image"],
+                    "images": entry["images"],
+                    "skipped": entry.get("skipped", []),
+                }
+        return done
+
+    def record_page(self, page_result: Dict[str, Any]) -> None:
+        """Append one finished page (call right after its files are written)."""
+        entry = {
+            "page_index": page_result["page_image"]["page_index"],
+            "page_image": page_result["page_image"],
+            "images": page_result["images"],
+            "skipped": page_result.get("skipped", []),
+            "files": _page_files(self.output_dir, page_result),
+        }
+        self._pages[int(entry["page_index"])] = entry
+        self._append({"page": entry})
+
+    def find_parse_result(self, page_indices: Iterable[int]) -> Optional[Path]:
+        """Return an existing parse result written for exactly these pages, if any."""
+        wanted = sorted(page_indices)
+        for entry in reversed(self._parse_results):
+            path = self.output_dir / "parsed" / entry["parse_result"]
+            if entry["page_indices"] == wanted and path.is_file():
+                return path
+        return None
+
+    def record_parse_result(self, path: Path, page_indices: Iterable[int]) -> None:
+        """Append the parse result written from the manifest's pages."""
+        entry = {"parse_result": path.name, "page_indices": sorted(page_indices)}
+        self._parse_results.append(entry)
+        self._append(entry)
@@ -0,0 +1,550 @@
+"""Per-page Phase 1 processing (pipelined and multi-process).
+
+Each page is loaded once and goes through three stages connected by
+bounded queues:
+
+    load + rasterize + scan/extract embedded images (caller thread)
+        -> encode (thread) -> write-behind (thread)
+
+so disk writes overlap with processing of the following pages. Only the
+caller thread touches the document; the encoder gets a copy of each page
+pixmap.
+"""
+
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import fitz  # PyMuPDF
+
+from .pdf_parser import (
+    ImageFilter,
+    PdfSource,
+    count_image_pages,
+    is_blank_page,
+    measure_ink_coverage,
+    open_pdf,
+    classify_page_color,
+    compute_page_zoom,
+    render_page_pixmap,
+    encode_pixmap,
+    extract_image,
+    require_pillow,
+    scan_page_images,
+)
+from .text_layer import analyze_text_layer, save_page_text
+from .image_handler import (
+    generate_content_image_filename,
+    generate_page_image_filename,
+    save_image,
+)
+
+# Per-process document handle, opened once by the pool initializer.
+_WORKER_DOC: Optional[fitz.Document] = None
+# Per-process xref -> page count for the image repeat filter (computed lazily).
+_WORKER_IMAGE_PAGES: Optional[Dict[int, int]] = None
+
+# Each worker gets several contiguous chunks so progress and load balancing
+# stay smooth on documents whose pages differ a lot in rendering cost.
+_CHUNKS_PER_WORKER = 4
+
+# Bound on items waiting between two stages (limits pixmaps/PNGs held in memory).
+_PIPELINE_QUEUE_SIZE = 8
+
+_PIPELINE_STAGES = ("render", "encode", "write")
+
+# Ink coverage below which a page without text is blank, when blank detection is enabled.
+DEFAULT_BLANK_THRESHOLD = 0.0005
+
+
+@dataclass(frozen=True)
+class RenderOptions:
+    """Page render settings shared by the pipeline and the render workers.
+
+    Attributes:
+        zoom: Fixed zoom factor used when no pixel budget is set
+        target_pixels: Per-page pixel budget; when set, zoom is chosen per page
+            from page.rect so every page renders to about this many pixels
+        tile_size: Snap the longer rendered side to a multiple of this size
+            (only used together with target_pixels)
+        image_format: Page image encoding ("png", "jpeg" or "webp")
+        quality: JPEG/WebP quality (1-100)
+        color_mode: "rgb" (always color), "gray" (always DeviceGray) or
+            "auto" (classify each page from a low-res probe and render
+            monochrome pages as gray, or 1-bit for pure text; with PNG output
+            this requires Pillow)
+        image_filter: Rules for skipping tiny/decorative embedded images
+            before extraction (None, the default, extracts every placement)
+        blank_threshold: Max ink coverage (share of dark pixels) for a page
+            without text to be marked blank; 0 (the default) disables blank
+            detection (DEFAULT_BLANK_THRESHOLD is a sensible value) and the
+            ink coverage measurement it needs
+        text_layer: Analyze each page's text layer and save its locally
+            converted Markdown under text/ (what the Phase 2 text fast path
+            uses); off by default
+    """
+
+    zoom: float = 2.0
+    target_pixels: Optional[int] = None
+    tile_size: Optional[int] = None
+    image_format: str = "png"
+    quality: int = 85
+    color_mode: str = "rgb"
+    image_filter: Optional[ImageFilter] = None
+    blank_threshold: float = 0.0
+    text_layer: bool = False
+
+    def __post_init__(self) -> None:
+        if self.image_format == "webp":
+            require_pillow("WebP page images")
+        if self.color_mode == "auto" and self.image_format == "png":
+            require_pillow("1-bit page images (color mode auto)")
+
+    def colorspace_for_page(self, page: fitz.Page) -> str:
+        """Return the colorspace ("rgb", "gray" or "bitonal") to render `page` with."""
+        if self.color_mode == "auto":
+            return classify_page_color(page)
+        return self.color_mode
+
+    def zoom_for_page(self, page: fitz.Page) -> float:
+        """Return the zoom to render `page` with."""
+        if self.target_pixels:
+            return compute_page_zoom(page.rect, self.target_pixels, self.tile_size)
+        return self.zoom
+
+
+class PipelineStats:
+    """Per-stage item counts, busy time and queue depth for the render pipeline."""
+
+    def __init__(self, queue_size: int = _PIPELINE_QUEUE_SIZE) -> None:
+        self.queue_size = queue_size
+        self.items: Dict[str, int] = {stage: 0 for stage in _PIPELINE_STAGES}
+        self.busy_sec: Dict[str, float] = {stage: 0.0 for stage in _PIPELINE_STAGES}
+        self.max_queue_depth: Dict[str, int] = {"encode": 0, "write": 0}
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, nbytes: int = 0) -> None:
+        """Record one item processed by `stage`."""
+        with self._lock:
+            self.items[stage] += 1
+            self.busy_sec[stage] += seconds
+            self.bytes_written += nbytes
+
+    def observe_queue(self, name: str, depth: int) -> None:
+        """Record the depth of the queue feeding stage `name`."""
+        with self._lock:
+            if depth > self.max_queue_depth[name]:
+                self.max_queue_depth[name] = depth
+
+    def merge(self, other: "PipelineStats") -> None:
+        """Accumulate stats from another pipeline (e.g. a worker process)."""
+        with self._lock:
+            for stage in _PIPELINE_STAGES:
+                self.items[stage] += other.items[stage]
+                self.busy_sec[stage] += other.busy_sec[stage]
+            for name, depth in other.max_queue_depth.items():
+                self.max_queue_depth[name] = max(self.max_queue_depth[name], depth)
+            self.bytes_written += other.bytes_written
+
+    def throughput(self, stage: str) -> float:
+        """Items per busy-second for one stage (0.0 when idle)."""
+        busy = self.busy_sec[stage]
+        return self.items[stage] / busy if busy > 0 else 0.0
+
+    def summary(self) -> str:
+        """Short one-line readout for progress output."""
+        rates = ", ".join(f"{stage}={self.throughput(stage):.1f}p/s" for stage in _PIPELINE_STAGES)
+        depths = ", ".join(
+            f"{name}={depth}/{self.queue_size}" for name, depth in self.max_queue_depth.items()
+        )
+        return f"{rates}; max_queue({depths}); written={self.bytes_written / 1_000_000:.1f}MB"
+
+
+def _page_image_block(
+    page_index: int,
+    image_path: Path,
+    image_meta: Dict[str, Any],
+    *,
+    ink_coverage: Optional[float],
+    blank: bool,
+    text_layer: Optional[Dict[str, Any]],
+    text_path: Optional[Path],
+) -> Dict[str, Any]:
+    return {
+        "page_index": page_index,
+        "type": "page_image",
+        "imagePath": str(image_path),
+        "ext": image_meta.get("ext"),
+        "width": image_meta.get("width"),
+        "height": image_meta.get("height"),
+        "zoom": image_meta.get("zoom"),
+        "colorspace": image_meta.get("colorspace"),
+        "ink_coverage": round(ink_coverage, 6) if ink_coverage is not None else None,
+        "blank": blank,
+        "text_layer": text_layer,
+        "textPath": str(text_path) if text_path is not None else None,
+    }
+
+
+def process_pages_pipelined(
+    doc: fitz.Document,
+    page_indices: Iterable[int],
+    output_dir: Path,
+    overwrite: bool = False,
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    stats: Optional[PipelineStats] = None,
+    queue_size: int = _PIPELINE_QUEUE_SIZE,
+    options: Optional[RenderOptions] = None,
+    image_store_dir: Optional[Path] = None,
+    page_done_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    image_pages: Optional[Dict[int, int]] = None,
+) -> List[Dict[str, Any]]:
+    """Process pages in a single pass through a bounded 3-stage pipeline.
+
+    Each page is loaded once on the calling thread (MuPDF objects stay on the
+    thread that owns the document), which renders it (measuring its ink
+    coverage to mark blank pages, when blank detection is enabled), scans its
+    image placements, extracts the embedded images and, with
+    `options.text_layer`, analyzes its text layer (features plus a locally
+    converted Markdown file under text/, see text_layer). Page image
+    encoding and the write-behind writer run on their own threads.
+
+    Embedded images are extracted once per xref and saved under content-hash
+    filenames, so an image repeated across pages (or byte-identical images
+    under different xrefs) is decoded and stored once; every block still gets
+    its own imagePath pointing at the shared file. With `image_store_dir`,
+    embedded images are kept in that cross-run blob store and hard-linked
+    into images/.
+
+    Placements rejected by `options.image_filter` are never extracted; they
+    are returned as "skipped_image" blocks. The repeat rule counts pages
+    over the whole document (`image_pages`, computed here when not given).
+
+    `page_done_cb` is called on the writer thread with each page's result as
+    soon as all of that page's files are written.
+
+    Returns:
+        One {"page_image": block, "images": [blocks], "skipped": [blocks]}
+        dict per page, in `page_indices` order (image blocks are unsorted and
+        have no blockIndex yet).
+    """
+    indices = list(page_indices)
+    total = len(indices)
+    if options is None:
+        options = RenderOptions()
+    if stats is None:
+        stats = PipelineStats(queue_size)
+    image_filter = options.image_filter
+    if image_filter is not None and image_filter.max_repeat_pages and image_pages is None:
+        image_pages = count_image_pages(doc)
+    encode_q: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+    write_q: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+    results: Dict[int, Dict[str, Any]] = {}
+    # xref -> (imagePath, image_meta) of embedded images already saved in this run
+    saved_xrefs: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+    errors: List[BaseException] = []
+    failed = threading.Event()
+
+    # Consumers always drain their queue until the sentinel (even after a
+    # failure), so blocking puts upstream can never deadlock.
+    def _encode_stage() -> None:
+        while True:
+            work = encode_q.get()
+            if work is None:
+                write_q.put(None)
+                return
+            if failed.is_set():
+                continue
+            try:
+                t0 = time.monotonic()
+                work["page_bytes"], work["page_meta"] = encode_pixmap(
+                    work.pop("pix"),
+                    work["zoom"],
+                    image_format=options.image_format,
+                    quality=options.quality,
+                    colorspace=work["colorspace"],
+                )
+                stats.record("encode", time.monotonic() - t0)
+            except BaseException as e:  # pylint: disable=broad-exception-caught
+                errors.append(e)
+                failed.set()
+                continue
+            write_q.put(work)
+            stats.observe_queue("write", write_q.qsize())
+
+    def _write_stage() -> None:
+        while True:
+            work = write_q.get()
+            if work is None:
+                return
+            if failed.is_set():
+                continue
+            page_index = work["page_index"]
+            try:
+                t0 = time.monotonic()
+                page_meta = work["page_meta"]
+                nbytes = len(work["page_bytes"])
+                filename = generate_page_image_filename(page_index, page_meta["ext"])
+                page_path = save_image(
+                    work["page_bytes"], output_dir, filename, overwrite=overwrite
+                )
+                text_path = None
+                if work["text_markdown"]:
+                    text_path = save_page_text(work["text_markdown"], output_dir, page_index)
+
+                image_blocks: List[Dict[str, Any]] = []
+                for block, image_bytes, image_meta in work["images"]:
+                    xref = int(block["xref"])
+                    if image_bytes is None:
+                        # Already extracted earlier in this run: point at the shared file
+                        image_path, image_meta = saved_xrefs[xref]
+                    else:
+                        ext = image_meta.get("ext", "png")
+                        image_path = str(
+                            save_image(
+                                image_bytes,
+                                output_dir,
+                                generate_content_image_filename(image_bytes, ext),
+                                content_addressed=True,
+                                store_dir=image_store_dir,
+                            )
+                        )
+                        saved_xrefs[xref] = (image_path, image_meta)
+                        nbytes += len(image_bytes)
+
+                    # Update block with image metadata
+                    block["imagePath"] = image_path
+                    block["ext"] = image_meta.get("ext")
+                    block["width"] = image_meta.get("width")
+                    block["height"] = image_meta.get("height")
+                    image_blocks.append(block)
+                stats.record("write", time.monotonic() - t0, nbytes)
+            except BaseException as e:  # pylint: disable=broad-exception-caught
+                errors.append(e)
+                failed.set()
+                continue
+            results[page_index] = {
+                "page_image": _page_image_block(
+                    page_index,
+                    page_path,
+                    page_meta,
+                    ink_coverage=work["ink_coverage"],
+                    blank=work["blank"],
+                    text_layer=work["text_layer"],
+                    text_path=text_path,
+                ),
+                "images": image_blocks,
+                "skipped": work["skipped"],
+            }
+            if page_done_cb is not None:
+                try:
+                    page_done_cb(results[page_index])
+                except BaseException as e:  # pylint: disable=broad-exception-caught
+                    errors.append(e)
+                    failed.set()
+                    continue
+            if progress_cb is not None:
+                progress_cb(len(results), total)
+
+    encoder = threading.Thread(target=_encode_stage, name="phase1-encode", daemon=True)
+    writer = threading.Thread(target=_write_stage, name="phase1-write", daemon=True)
+    encoder.start()
+    writer.start()
+    extracted_xrefs: set[int] = set()
+    try:
+        for page_index in indices:
+            if failed.is_set():
+                break
+            t0 = time.monotonic()
+            page = doc[page_index]
+            zoom = options.zoom_for_page(page)
+            colorspace = options.colorspace_for_page(page)
+            pix = render_page_pixmap(page, zoom, colorspace)
+            ink_coverage: Optional[float] = None
+            blank = False
+            if options.blank_threshold > 0:
+                ink_coverage = measure_ink_coverage(pix)
+                blank = is_blank_page(page, ink_coverage, options.blank_threshold)
+
+            images: List[Tuple[Dict[str, Any], Optional[bytes], Optional[Dict[str, Any]]]] = []
+            skipped: List[Dict[str, Any]] = []
+            for block in scan_page_images(page, page_index, image_filter, image_pages):
+                if block["type"] == "skipped_image":
+                    skipped.append(block)
+                    continue
+                xref = int(block["xref"])
+                if xref in extracted_xrefs:
+                    # Memoized per xref: the writer reuses the first saved file
+                    images.append((block, None, None))
+                    continue
+                image_bytes, image_meta = extract_image(doc, xref)
+                extracted_xrefs.add(xref)
+                images.append((block, image_bytes, image_meta))
+            text_layer: Optional[Dict[str, Any]] = None
+            text_markdown = ""
+            if options.text_layer:
+                text_layer, text_markdown = analyze_text_layer(page, len(images))
+            stats.record("render", time.monotonic() - t0)
+
+            # Hand the encoder a private copy made here: the rendered pixmap
+            # belongs to this thread's document, and PyMuPDF objects are not
+            # safe to share across threads. The copy keeps the alpha setting
+            # (fitz.Pixmap(pix) alone would add an alpha channel).
+            encode_q.put(
+                {
+                    "page_index": page_index,
+                    "pix": fitz.Pixmap(pix, pix.alpha),
+                    "zoom": zoom,
+                    "colorspace": colorspace,
+                    "ink_coverage": ink_coverage,
+                    "blank": blank,
+                    "text_layer": text_layer,
+                    "text_markdown": text_markdown,
+                    "images": images,
+                    "skipped": skipped,
+                }
+            )
+            stats.observe_queue("encode", encode_q.qsize())
+    except BaseException:
+        failed.set()
+        raise
+    finally:
+        encode_q.put(None)
+        encoder.join()
+        writer.join()
+
+    if errors:
+        raise errors[0]
+    return [results[page_index] for page_index in indices]
+
+
+def split_page_ranges(total_pages: int, chunks: int) -> List[Tuple[int, int]]:
+    """Split [0, total_pages) into at most `chunks` contiguous (start, end) ranges."""
+    if total_pages <= 0:
+        return []
+    chunks = max(1, min(chunks, total_pages))
+    base, extra = divmod(total_pages, chunks)
+    ranges: List[Tuple[int, int]] = []
+    start = 0
+    for i in range(chunks):
+        end = start + base + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def resolve_render_workers(render_workers: int, total_pages: int) -> int:
+    """Clamp the requested worker count to [1, total_pages]; 0 means os.cpu_count()."""
+    if render_workers == 0:
+        render_workers = os.cpu_count() or 1
+    return max(1, min(render_workers, max(total_pages, 1)))
+
+
+def _init_render_worker(pdf_source: PdfSource, use_mmap: bool = False) -> None:
+    global _WORKER_DOC  # pylint: disable=global-statement
+    _WORKER_DOC = open_pdf(pdf_source, use_mmap=use_mmap)
+
+
+def _render_page_range(
+    page_indices: List[int],
+    output_dir: str,
+    overwrite: bool,
+    options: RenderOptions,
+    image_store_dir: Optional[str],
+) -> Tuple[List[Dict[str, Any]], PipelineStats]:
+    global _WORKER_IMAGE_PAGES  # pylint: disable=global-statement
+    if _WORKER_DOC is None:
+        raise RuntimeError("Render worker was not initialized with a PDF document")
+    image_filter = options.image_filter
+    if image_filter is not None and image_filter.max_repeat_pages and _WORKER_IMAGE_PAGES is None:
+        _WORKER_IMAGE_PAGES = count_image_pages(_WORKER_DOC)
+    stats = PipelineStats()
+    page_results = process_pages_pipelined(
+        _WORKER_DOC,
+        page_indices,
+        Path(output_dir),
+        overwrite=overwrite,
+        stats=stats,
+        options=options,
+        image_store_dir=Path(image_store_dir) if image_store_dir else None,
+        image_pages=_WORKER_IMAGE_PAGES,
+    )
+    return page_results, stats
+
+
+def process_pages_parallel(
+    pdf_source: PdfSource,
+    output_dir: Path,
+    page_indices: Sequence[int],
+    render_workers: int,
+    overwrite: bool = False,
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    stats: Optional[PipelineStats] = None,
+    options: Optional[RenderOptions] = None,
+    image_store_dir: Optional[Path] = None,
+    page_done_cb: Optional[Callable[[Dict[str, Any]], None]] = None,
+    use_mmap: bool = False,
+) -> List[Dict[str, Any]]:
+    """Process all pages with a process pool and return per-page results in page order.
+
+    Each worker process opens its own document via open_pdf() (memory-mapping
+    a path itself with `use_mmap`; in-memory bytes are sent to each worker
+    once) and runs the
+    page pipeline over contiguous page ranges; images are written by the
+    workers so that only block dicts and stats travel back to the parent.
+    `page_done_cb` is called in the parent for each page of a finished range.
+    """
+    indices = list(page_indices)
+    total_pages = len(indices)
+    worker_source = bytes(pdf_source) if isinstance(pdf_source, memoryview) else pdf_source
+    ranges = split_page_ranges(total_pages, render_workers * _CHUNKS_PER_WORKER)
+    by_start: Dict[int, List[Dict[str, Any]]] = {}
+    done_pages = 0
+
+    with ProcessPoolExecutor(
+        max_workers=render_workers,
+        initializer=_init_render_worker,
+        initargs=(worker_source, use_mmap),
+    ) as executor:
+        future_to_start = {
+            executor.submit(
+                _render_page_range,
+                indices[start:end],
+                str(output_dir),
+                overwrite,
+                options or RenderOptions(),
+                str(image_store_dir) if image_store_dir else None,
+            ): start
+            for start, end in ranges
+        }
+        for future in as_completed(future_to_start):
+            page_results, chunk_stats = future.result()
+            if stats is not None:
+                stats.merge(chunk_stats)
+            by_start[future_to_start[future]] = page_results
+            if page_done_cb is not None:
+                for page_result in page_results:
+                    page_done_cb(page_result)
+            done_pages += len(page_results)
+            if progress_cb is not None:
+                progress_cb(done_pages, total_pages)
+
+    results: List[Dict[str, Any]] = []
+    for start, _ in ranges:
+        results.extend(by_start[start])
+    return results
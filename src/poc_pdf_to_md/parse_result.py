@@ -3,20 +3,67 @@
 import json
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Sequence
 
 
 def create_parse_result(
-    source_pdf: str, total_pages: int, blocks: List[Dict[str, Any]]
+    source_pdf: str,
+    total_pages: int,
+    blocks: List[Dict[str, Any]],
+    page_indices: Optional[Sequence[int]] = None,
+    source_sha256: Optional[str] = None,
 ) -> Dict[str, Any]:
-    """Create parse result structure with run-level and block-level metadata."""
-    return {
+    """Create parse result structure with run-level and block-level metadata.
+
+    `page_indices` is recorded only for partial results (page ranges/shards);
+    when omitted, the result covers every page in range(total_pages).
+    `source_sha256` is the PDF content hash, a stable identity that does not
+    depend on where the PDF was read from.
+    """
+    parse_result: Dict[str, Any] = {
         "schema_version": "1.0",
         "created_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
         "source_pdf": str(source_pdf),
-        "total_pages": total_pages,
-        "blocks": blocks,
     }
+    if source_sha256 is not None:
+        parse_result["source_sha256"] = source_sha256
+    parse_result["total_pages"] = total_pages
+    if page_indices is not None and list(page_indices) != list(range(total_pages)):
+        parse_result["page_indices"] = sorted(page_indices)
+    parse_result["blocks"] = blocks
+    return parse_result
+
+
+def get_page_indices(parse_result: Dict[str, Any]) -> List[int]:
+    """Return the page indices covered by a parse result (all pages if not partial)."""
+    if "page_indices" in parse_result:
+        return [int(i) for i in parse_result["page_indices"]]
+    return list(range(int(parse_result.get("total_pages", 0))))
+
+
+def sort_and_index_blocks(blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Sort blocks into parse_result order and (re)assign sequential blockIndex.
+
+    Page images come first (by page_index), then embedded images by
+    page_index -> bbox.y -> bbox.x.
+    """
+    def sort_key(block: Dict[str, Any]) -> tuple:
+        if block.get("type") == "page_image":
+            # Page images come first, sorted by page_index
+            return (0, block.get("page_index", 0))
+        # Embedded images sorted by page_index -> bbox.y -> bbox.x
+        page_idx = block.get("page_index", 0)
+        bbox = block.get("bbox", [0, 0, 0, 0])
+        y = bbox[1] if len(bbox) > 1 else 0.0
+        x = bbox[0] if len(bbox) > 0 else 0.0
+        return (1, page_idx, y, x)
+
+    blocks.sort(key=sort_key)
+
+    # Add blockIndex
+    for index, block in enumerate(blocks):
+        block["blockIndex"] = index
+    return blocks
 
 
 def save_parse_result(
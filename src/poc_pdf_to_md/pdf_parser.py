@@ -1,16 +1,77 @@
 """PDF parser using PyMuPDF."""
 
+import hashlib
+import importlib.util
+import io
+import math
+import mmap
+import os
+import re
+
 import fitz  # PyMuPDF
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+# A PDF file path, or the PDF's bytes (bytes, bytearray or a memoryview such
+# as the one returned by map_pdf_file()).
+PdfSource = Union[str, os.PathLike, bytes, bytearray, memoryview]
+
+_HASH_CHUNK_SIZE = 1 << 20
+
 
+def is_pdf_stream(pdf_source: PdfSource) -> bool:
+    """Return True when `pdf_source` holds the PDF bytes rather than a path."""
+    return isinstance(pdf_source, (bytes, bytearray, memoryview))
 
-def open_pdf(pdf_path: str) -> fitz.Document:
-    """Open PDF file and return document object."""
+
+def map_pdf_file(pdf_path: Union[str, os.PathLike]) -> memoryview:
+    """Memory-map a PDF file read-only and return a view usable as a stream.
+
+    The mapping stays open for as long as the view (or a document opened
+    from it) is referenced.
+    """
     try:
-        doc = fitz.open(pdf_path)
-        return doc
+        with open(pdf_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"Failed to memory-map PDF file: {pdf_path}") from e
+    return memoryview(mapped)
+
+
+def open_pdf(pdf_source: PdfSource, use_mmap: bool = False) -> fitz.Document:
+    """Open PDF from a path or in-memory bytes and return document object.
+
+    Bytes-like sources are opened with fitz.open(stream=...) without writing a
+    temp file. With use_mmap=True, a path is memory-mapped and opened as a
+    stream as well.
+    """
+    try:
+        if not is_pdf_stream(pdf_source) and use_mmap:
+            pdf_source = map_pdf_file(pdf_source)
+        if is_pdf_stream(pdf_source):
+            return fitz.open(stream=pdf_source, filetype="pdf")
+        return fitz.open(pdf_source)
     except Exception as e:
-        raise RuntimeError(f"Failed to open PDF file: {pdf_path}") from e
+        raise RuntimeError(f"Failed to open PDF file: {describe_pdf_source(pdf_source)}") from e
+
+
+def describe_pdf_source(pdf_source: PdfSource) -> str:
+    """Short label for messages: the path, or the stream size."""
+    if is_pdf_stream(pdf_source):
+        return f"<stream, {memoryview(pdf_source).nbytes} bytes>"
+    return str(pdf_source)
+
+
+def compute_pdf_sha256(pdf_source: PdfSource) -> str:
+    """Return the SHA-256 hex digest of the PDF content (path or bytes)."""
+    if is_pdf_stream(pdf_source):
+        return hashlib.sha256(pdf_source).hexdigest()
+    digest = hashlib.sha256()
+    with open(pdf_source, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
 def extract_image(doc: fitz.Document, xref: int) -> Tuple[bytes, Dict[str, Any]]:
@@ -29,6 +90,239 @@ def extract_image(doc: fitz.Document, xref: int) -> Tuple[bytes, Dict[str, Any]]
         raise RuntimeError(f"Failed to extract image with xref {xref}") from e
 
 
+def compute_page_zoom(
+    page_rect: fitz.Rect,
+    target_pixels: int,
+    tile_size: Optional[int] = None,
+    min_zoom: float = 0.25,
+    max_zoom: float = 8.0,
+) -> float:
+    """
+    Pick a zoom factor so the rendered page has about `target_pixels` pixels.
+
+    Args:
+        page_rect: Page rectangle in points (page.rect)
+        target_pixels: Pixel budget for the rendered page (width * height)
+        tile_size: If set, snap the longer rendered side down to a multiple of
+            this many pixels (at least one tile), e.g. the model's image tile size
+        min_zoom: Lower bound for the returned zoom
+        max_zoom: Upper bound for the returned zoom
+
+    Returns:
+        Zoom factor rounded to 4 decimals
+    """
+    width = max(float(page_rect.width), 1.0)
+    height = max(float(page_rect.height), 1.0)
+    zoom = math.sqrt(target_pixels / (width * height))
+
+    if tile_size:
+        long_side = max(width, height)
+        tiles = max(1, math.floor(long_side * zoom / tile_size))
+        zoom = tiles * tile_size / long_side
+
+    zoom = min(max(zoom, min_zoom), max_zoom)
+    return round(zoom, 4)
+
+
+# Low-resolution probe used to classify page color (about 150x200 px for A4).
+_COLOR_PROBE_ZOOM = 0.25
+# Max channel spread (0-255) for a pixel to count as neutral gray.
+_GRAY_CHANNEL_TOLERANCE = 16
+# Share of colored pixels tolerated on a "monochrome" page (noise, specks).
+_MAX_COLORED_FRACTION = 0.002
+# Share of mid-tone pixels tolerated on a "pure text" (bitonal) page; larger
+# values indicate gray fills, shading or photos that must keep their tones.
+_MAX_MIDTONE_FRACTION = 0.05
+# Gray level used to threshold bitonal output.
+_BITONAL_THRESHOLD = 160
+
+PAGE_COLORSPACES = ("rgb", "gray", "bitonal")
+
+
+def classify_page_color(page: fitz.Page) -> str:
+    """
+    Classify a page as "rgb", "gray" or "bitonal" from a cheap low-res render.
+
+    - gray: (almost) every pixel is neutral (R == G == B within tolerance)
+    - bitonal: gray, no raster images and (almost) no mid-tone pixels (pure text)
+    - rgb: anything else
+    """
+    pix = page.get_pixmap(matrix=fitz.Matrix(_COLOR_PROBE_ZOOM, _COLOR_PROBE_ZOOM), alpha=False)
+    samples = pix.samples
+    total = max(pix.width * pix.height, 1)
+    reds, greens, blues = samples[0::3], samples[1::3], samples[2::3]
+
+    if reds == greens == blues:
+        grays = reds
+    else:
+        colored = 0
+        for r, g, b in zip(reds, greens, blues):
+            if max(r, g, b) - min(r, g, b) > _GRAY_CHANNEL_TOLERANCE:
+                colored += 1
+        if colored / total > _MAX_COLORED_FRACTION:
+            return "rgb"
+        grays = greens
+
+    if page.get_images():
+        return "gray"
+    midtones = sum(1 for v in grays if 64 <= v <= 192)
+    return "bitonal" if midtones / total <= _MAX_MIDTONE_FRACTION else "gray"
+
+
+# Page text (lowercased, letters only) of pages that are deliberately empty.
+_BLANK_PAGE_PHRASES = frozenset(
+    {
+        "intentionallyleftblank",
+        "thispageintentionallyleftblank",
+        "thispageisintentionallyleftblank",
+        "thispagehasbeenintentionallyleftblank",
+        "pageintentionallyleftblank",
+        "thispageleftblankintentionally",
+        "thispageintentionallyblank",
+        "blankpage",
+        "本頁空白",
+        "此頁空白",
+        "本頁刻意留白",
+        "此頁刻意留白",
+        "空白頁",
+    }
+)
+# Pages above this ink coverage are never blank.
+_BLANK_MAX_COVERAGE = 0.01
+# Sample value (0-255) below which a pixel channel counts as ink; paper white
+# and light scanner noise stay above it.
+_INK_LEVEL = 200
+_INK_TABLE = bytes(1 if v < _INK_LEVEL else 0 for v in range(256))
+# Measure every 7th sample (coprime with 1/3/4 channels, so all channels are hit).
+_INK_SAMPLE_STRIDE = 7
+
+
+def measure_ink_coverage(pix: fitz.Pixmap) -> float:
+    """Return the share of dark samples in a pixmap (about the share of inked pixels)."""
+    # Stride over the pixmap's own buffer: only the sampled bytes are copied, not the whole image.
+    samples = bytes(pix.samples_mv[::_INK_SAMPLE_STRIDE])
+    if not samples:
+        return 0.0
+    return samples.translate(_INK_TABLE).count(1) / len(samples)
+
+
+def is_blank_page(page: fitz.Page, ink_coverage: float, threshold: float) -> bool:
+    """
+    Decide whether a page is blank.
+
+    A nearly empty page is blank when its only text is an "intentionally
+    left blank" notice (digits such as page numbers are ignored), or when it
+    has no text at all and its ink coverage is at most `threshold` (specks
+    on scanned pages). Any other text keeps the page.
+    """
+    if ink_coverage > _BLANK_MAX_COVERAGE:
+        return False
+    text = re.sub(r"[\W\d_]+", "", page.get_text()).lower()
+    if text:
+        return text in _BLANK_PAGE_PHRASES
+    return ink_coverage <= threshold
+
+
+def render_page_pixmap(
+    page: fitz.Page, zoom: float = 2.0, colorspace: str = "rgb"
+) -> fitz.Pixmap:
+    """Rasterize an entire PDF page into a pixmap (no encoding).
+
+    "gray" and "bitonal" render a single-channel DeviceGray pixmap; bitonal
+    thresholding happens at encode time.
+    """
+    try:
+        mat = fitz.Matrix(zoom, zoom)
+        if colorspace in ("gray", "bitonal"):
+            return page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY)
+        return page.get_pixmap(matrix=mat)
+    except Exception as e:
+        raise RuntimeError("Failed to render page as image") from e
+
+
+def _encode_bitonal_png(pix: fitz.Pixmap) -> bytes:
+    """Threshold a gray pixmap into a 1-bit PNG (requires Pillow)."""
+    from PIL import Image  # type: ignore[import-not-found]  # pylint: disable=import-outside-toplevel
+
+    img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    bitonal = img.point(lambda v: 255 if v >= _BITONAL_THRESHOLD else 0, mode="1")
+    buf = io.BytesIO()
+    bitonal.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+def require_pillow(feature: str) -> None:
+    """Raise RuntimeError naming `feature` when Pillow is not installed."""
+    if importlib.util.find_spec("PIL") is None:
+        raise RuntimeError(f"{feature} require Pillow (pip install 'poc-pdf-to-md[images]')")
+
+
+# Page image formats: name -> (file extension, MIME type)
+PAGE_IMAGE_FORMATS: Dict[str, Tuple[str, str]] = {
+    "png": ("png", "image/png"),
+    "jpeg": ("jpg", "image/jpeg"),
+    "webp": ("webp", "image/webp"),
+}
+
+
+def encode_pixmap(
+    pix: fitz.Pixmap,
+    zoom: float = 2.0,
+    image_format: str = "png",
+    quality: int = 85,
+    colorspace: str = "rgb",
+) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Encode a rendered page pixmap and return (image_bytes, image_meta).
+
+    Args:
+        pix: Rendered page pixmap
+        zoom: Zoom the pixmap was rendered with (recorded in image_meta)
+        image_format: "png", "jpeg" or "webp" (webp requires Pillow)
+        quality: JPEG/WebP quality (1-100); ignored for PNG
+        colorspace: Colorspace the pixmap was rendered for. "bitonal" is
+            written as a 1-bit PNG (requires Pillow) when PNG output is
+            requested; other formats keep it as gray (recorded in image_meta).
+    """
+    if image_format not in PAGE_IMAGE_FORMATS:
+        raise ValueError(f"Unsupported page image format: {image_format}")
+    ext = PAGE_IMAGE_FORMATS[image_format][0]
+
+    if colorspace == "bitonal" and image_format == "png":
+        require_pillow("1-bit page images")
+        image_bytes = _encode_bitonal_png(pix)
+        return image_bytes, {
+            "ext": ext,
+            "width": pix.width,
+            "height": pix.height,
+            "zoom": zoom,
+            "colorspace": "bitonal",
+        }
+    if colorspace == "bitonal":
+        colorspace = "gray"
+
+    if image_format == "webp":
+        require_pillow("WebP page images")
+    try:
+        if image_format == "jpeg":
+            image_bytes = pix.tobytes("jpeg", jpg_quality=quality)
+        elif image_format == "webp":
+            image_bytes = pix.pil_tobytes(format="WEBP", quality=quality)
+        else:
+            image_bytes = pix.tobytes("png")
+    except Exception as e:
+        raise RuntimeError("Failed to encode page image") from e
+
+    image_meta = {
+        "ext": ext,
+        "width": pix.width,
+        "height": pix.height,
+        "zoom": zoom,
+        "colorspace": colorspace,
+    }
+    return image_bytes, image_meta
+
+
 def render_page_as_image(
     page: fitz.Page, zoom: float = 2.0
 ) -> Tuple[bytes, Dict[str, Any]]:
@@ -42,28 +336,98 @@ def render_page_as_image(
     Returns:
         Tuple of (image_bytes, image_meta)
     """
-    try:
-        # Render the entire page as pixmap
-        mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat)
-        
-        # Convert to PNG bytes
-        image_bytes = pix.tobytes("png")
-        
-        # Get page dimensions
-        width = pix.width
-        height = pix.height
-        
-        image_meta = {
-            "ext": "png",
-            "width": width,
-            "height": height,
-            "zoom": zoom,
+    pix = render_page_pixmap(page, zoom)
+    return encode_pixmap(pix, zoom)
+
+
+@dataclass(frozen=True)
+class ImageFilter:
+    """Rules for skipping tiny and decorative embedded images before extraction.
+
+    A value of 0 disables that rule.
+
+    Attributes:
+        min_area: Minimum placed area on the page, in pt^2 (bullets, icons)
+        min_pixel_side: Minimum intrinsic width and height in pixels (spacers)
+        max_aspect: Maximum placed long/short side ratio (hairline rules)
+        max_repeat_pages: Skip images placed on more than this many pages
+            of the document (running headers, footers, backgrounds)
+    """
+
+    min_area: float = 36.0
+    min_pixel_side: int = 4
+    max_aspect: float = 30.0
+    max_repeat_pages: int = 0
+
+    def skip_reason(
+        self,
+        img: Tuple[Any, ...],
+        bbox: fitz.Rect,
+        image_pages: Optional[Dict[int, int]] = None,
+    ) -> Optional[str]:
+        """Return why a placement should be skipped, or None to keep it.
+
+        Args:
+            img: Entry from page.get_images(full=True) (xref, smask, width, height, ...)
+            bbox: Placement rectangle from page.get_image_bbox()
+            image_pages: xref -> number of pages it is placed on (see count_image_pages)
+        """
+        if self.min_pixel_side and min(int(img[2]), int(img[3])) < self.min_pixel_side:
+            return "tiny_pixels"
+        if bbox.is_infinite:
+            return "not_placed"
+        width, height = abs(bbox.width), abs(bbox.height)
+        if self.min_area and width * height < self.min_area:
+            return "small_area"
+        if self.max_aspect and max(width, height) > self.max_aspect * max(min(width, height), 1e-6):
+            return "extreme_aspect"
+        if (
+            self.max_repeat_pages
+            and image_pages
+            and image_pages.get(int(img[0]), 0) > self.max_repeat_pages
+        ):
+            return "repeated"
+        return None
+
+
+def count_image_pages(doc: fitz.Document) -> Dict[int, int]:
+    """Return xref -> number of pages the image is placed on (no decoding)."""
+    counts: Counter = Counter()
+    for page in doc:
+        counts.update({int(img[0]) for img in page.get_images(full=True)})
+    return dict(counts)
+
+
+def scan_page_images(
+    page: fitz.Page,
+    page_index: int,
+    image_filter: Optional[ImageFilter] = None,
+    image_pages: Optional[Dict[int, int]] = None,
+) -> List[Dict[str, Any]]:
+    """Return unsorted embedded image placement blocks (no blockIndex) for one page.
+
+    With `image_filter`, placements it rejects are returned as
+    "skipped_image" blocks with a "skip_reason" (and the image's intrinsic
+    width/height) so they are recorded but never extracted.
+    """
+    blocks: List[Dict[str, Any]] = []
+    image_list = page.get_images(full=True)
+    for img in image_list:
+        xref = img[0]
+        bbox_list = page.get_image_bbox(img)
+        bbox = [bbox_list.x0, bbox_list.y0, bbox_list.x1, bbox_list.y1]
+        block: Dict[str, Any] = {
+            "page_index": page_index,
+            "bbox": bbox,
+            "type": "image",
+            "xref": xref,
         }
-        
-        return image_bytes, image_meta
-    except Exception as e:
-        raise RuntimeError("Failed to render page as image") from e
+        if image_filter is not None:
+            reason = image_filter.skip_reason(img, bbox_list, image_pages)
+            if reason is not None:
+                block.update(type="skipped_image", skip_reason=reason, width=img[2], height=img[3])
+        blocks.append(block)
+    return blocks
 
 
 def parse_pdf(
@@ -84,19 +448,7 @@ def parse_pdf(
             progress_cb(page_index + 1, total_pages)
 
         # Extract embedded images only (no text blocks)
-        image_list = page.get_images(full=True)
-        for img in image_list:
-            xref = img[0]
-            bbox_list = page.get_image_bbox(img)
-            bbox = [bbox_list.x0, bbox_list.y0, bbox_list.x1, bbox_list.y1]
-            blocks.append(
-                {
-                    "page_index": page_index,
-                    "bbox": bbox,
-                    "type": "image",
-                    "xref": xref,
-                }
-            )
+        blocks.extend(scan_page_images(page, page_index))
 
     # Sort blocks: page_index -> bbox.y -> bbox.x
     def sort_key(block: Dict[str, Any]) -> Tuple[int, float, float]:
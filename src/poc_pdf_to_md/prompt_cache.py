@@ -0,0 +1,279 @@
+"""Gemini context caching for the static Phase 2 prompt template.
+
+The prompt template is stored once per (model, template SHA-256) as a
+cached-content entry. Page requests reference it by name and send only their
+page-specific JSON and image. Entries are extended shortly before they
+expire, and found again by display name in later runs and other shards.
+When caching is unavailable (unsupported model, template below the model's
+minimum cacheable size, API error), requests fall back to inlining the
+template as before. Templates estimated below the minimum are never sent
+to the caching API; the shipped template (about 560 tokens) is below every
+model's minimum, so caching only takes effect with a larger custom
+template or a lower GEMINI_PROMPT_CACHE_MIN_TOKENS.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .gemini_client import create_cached_prompt, extend_cached_prompt, find_cached_prompt
+from .rate_limit import estimate_text_tokens
+
+DEFAULT_TTL_SEC = 3600.0
+# Entries closer than this to expiry are extended before use (capped at a quarter of the TTL).
+_REFRESH_MARGIN_SEC = 300.0
+
+_DISPLAY_NAME_PREFIX = "poc_pdf_to_md-prompt-"
+
+# Minimum cacheable tokens by model family (first match in the model name);
+# other models get the largest documented minimum.
+_MIN_CACHE_TOKENS = (("flash", 1024), ("pro", 4096))
+DEFAULT_MIN_CACHE_TOKENS = 4096
+
+# (cache name, expiry as a Unix timestamp)
+CacheEntry = Tuple[str, float]
+
+
+def min_cache_tokens(model: str) -> int:
+    """Gemini's minimum size, in tokens, of cached content for model."""
+    name = model.lower()
+    for family, tokens in _MIN_CACHE_TOKENS:
+        if family in name:
+            return tokens
+    return DEFAULT_MIN_CACHE_TOKENS
+
+
+def is_cache_error(err: BaseException) -> bool:
+    """Whether a request failed because its cached content is missing, expired or unusable."""
+    return "cachedcontent" in str(err).lower().replace(" ", "").replace("_", "")
+
+
+class GeminiPromptCacheBackend:
+    """Cache entries on the Gemini API (client.caches)."""
+
+    def create(self, model: str, text: str, ttl_sec: float, display_name: str) -> CacheEntry:
+        """Create an entry holding text."""
+        return create_cached_prompt(
+            model=model, prompt_text=text, ttl_sec=ttl_sec, display_name=display_name
+        )
+
+    def find(self, model: str, display_name: str) -> Optional[CacheEntry]:
+        """An existing, unexpired entry with this display name, or None."""
+        return find_cached_prompt(model=model, display_name=display_name)
+
+    def extend(self, name: str, ttl_sec: float) -> CacheEntry:
+        """Reset an entry's TTL."""
+        return extend_cached_prompt(name=name, ttl_sec=ttl_sec)
+
+
+class LocalPromptCacheBackend:
+    """In-process stand-in for Gemini context caching (tests and offline runs)."""
+
+    def __init__(self, clock: Callable[[], float] = time.time) -> None:
+        self._clock = clock
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.calls: Dict[str, int] = {"create": 0, "find": 0, "extend": 0}
+
+    def create(self, model: str, text: str, ttl_sec: float, display_name: str) -> CacheEntry:
+        """Create an entry holding text."""
+        self.calls["create"] += 1
+        name = f"cachedContents/local-{len(self.entries) + 1}"
+        self.entries[name] = {
+            "model": model,
+            "display_name": display_name,
+            "text": text,
+            "expires_at": self._clock() + ttl_sec,
+        }
+        return name, self.entries[name]["expires_at"]
+
+    def find(self, model: str, display_name: str) -> Optional[CacheEntry]:
+        """An existing, unexpired entry with this display name, or None."""
+        self.calls["find"] += 1
+        for name, entry in self.entries.items():
+            if (
+                entry["model"] == model
+                and entry["display_name"] == display_name
+                and entry["expires_at"] > self._clock()
+            ):
+                return name, entry["expires_at"]
+        return None
+
+    def extend(self, name: str, ttl_sec: float) -> CacheEntry:
+        """Reset an entry's TTL (fails like the API once it has expired)."""
+        self.calls["extend"] += 1
+        entry = self.entries.get(name)
+        if entry is None or entry["expires_at"] <= self._clock():
+            raise RuntimeError(f"404 NOT_FOUND. CachedContent not found: {name}")
+        entry["expires_at"] = self._clock() + ttl_sec
+        return name, entry["expires_at"]
+
+    def text(self, name: str) -> str:
+        """The text stored in an entry (what the model would see for cached_content=name)."""
+        entry = self.entries.get(name)
+        if entry is None or entry["expires_at"] <= self._clock():
+            raise RuntimeError(f"404 NOT_FOUND. CachedContent not found: {name}")
+        return entry["text"]
+
+
+class PromptCache:
+    """Cached-content entries for prompt templates, shared by the Phase 2 workers of a run."""
+
+    def __init__(
+        self,
+        backend: Any,
+        ttl_sec: float = DEFAULT_TTL_SEC,
+        clock: Callable[[], float] = time.time,
+        min_tokens: Optional[int] = None,
+    ) -> None:
+        self.backend = backend
+        self.ttl_sec = max(ttl_sec, 60.0)
+        # None: the model's minimum (see min_cache_tokens)
+        self.min_tokens = min_tokens
+        self._clock = clock
+        # Guards the bookkeeping below; never held during a backend (network) call.
+        self._lock = threading.Lock()
+        # One per template: a single worker refreshes an entry while the others wait.
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._entries: Dict[Tuple[str, str], CacheEntry] = {}
+        self._unavailable: Dict[Tuple[str, str], str] = {}
+        self.created = 0
+        self.reused = 0
+        self.extended = 0
+
+    @staticmethod
+    def display_name(text: str) -> str:
+        """Display name identifying an entry by its template hash (shared across runs)."""
+        return _DISPLAY_NAME_PREFIX + hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+    def _usable(self, entry: Optional[CacheEntry]) -> bool:
+        margin = min(_REFRESH_MARGIN_SEC, self.ttl_sec / 4)
+        return entry is not None and entry[1] - self._clock() > margin
+
+    def _refresh(self, model: str, text: str, entry: Optional[CacheEntry]) -> CacheEntry:
+        """Extend an entry close to expiry, else reuse another run's live entry, else create one."""
+        if entry is not None:
+            try:
+                entry = self.backend.extend(entry[0], self.ttl_sec)
+                self._count("extended")
+                return entry
+            except Exception:  # pylint: disable=broad-exception-caught
+                pass  # Expired or deleted meanwhile: fall through and create a new one
+        display_name = self.display_name(text)
+        found = self.backend.find(model, display_name)
+        if found is not None:
+            self._count("reused")
+            return found if self._usable(found) else self.backend.extend(found[0], self.ttl_sec)
+        self._count("created")
+        return self.backend.create(model, text, self.ttl_sec, display_name)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _cached(self, key: Tuple[str, str]) -> Tuple[bool, Optional[CacheEntry]]:
+        """(done, entry): done when the key is unavailable or has a usable entry (lock held)."""
+        if key in self._unavailable:
+            return True, None
+        entry = self._entries.get(key)
+        return self._usable(entry), entry
+
+    def resolve(self, model: str, text: str) -> Optional[str]:
+        """
+        Cache name to send as cached_content for requests starting with text.
+
+        Returns:
+            the entry's name, or None when caching is unavailable for this
+            model and template (the caller inlines the template instead)
+        """
+        key = (model, hashlib.sha256(text.encode("utf-8")).hexdigest())
+        with self._lock:
+            done, entry = self._cached(key)
+            if done:
+                return entry[0] if entry is not None else None
+            min_tokens = self.min_tokens if self.min_tokens is not None else min_cache_tokens(model)
+            tokens = estimate_text_tokens(text)
+            if tokens < min_tokens:
+                self._unavailable[key] = (
+                    f"template ≈{tokens} tokens, "
+                    f"below the minimum cacheable size ({min_tokens} tokens)"
+                )
+                return None
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                # Another worker may have refreshed the entry while this one waited.
+                done, entry = self._cached(key)
+            if done:
+                return entry[0] if entry is not None else None
+            try:
+                entry = self._refresh(model, text, entry)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                with self._lock:
+                    self._entries.pop(key, None)
+                    self._unavailable[key] = str(e)
+                return None
+            with self._lock:
+                if key in self._unavailable:
+                    return None  # Discarded (discard_on_error) during the refresh
+                self._entries[key] = entry
+            return entry[0]
+
+    def discard_on_error(self, err: BaseException) -> bool:
+        """
+        Stop using the cache after a request failed because of its cached content.
+
+        Returns:
+            True if entries were in use (retrying the request now inlines the template)
+        """
+        if not is_cache_error(err):
+            return False
+        with self._lock:
+            if not self._entries:
+                return False
+            for key in self._entries:
+                self._unavailable[key] = str(err)
+            self._entries.clear()
+            return True
+
+    def report(self) -> Dict[str, Any]:
+        """Snapshot for phase2/state.json."""
+        with self._lock:
+            return {
+                "entries": [name for name, _ in self._entries.values()],
+                "created": self.created,
+                "reused": self.reused,
+                "extended": self.extended,
+                "unavailable": list(self._unavailable.values()),
+            }
+
+    def summary(self) -> str:
+        """One-line summary for the Phase 2 run report."""
+        with self._lock:
+            if self._unavailable and not self._entries:
+                reason = next(iter(self._unavailable.values()))
+                return f"prompt_cache=off ({reason}; fallback: template inlined)"
+            return (
+                f"prompt_cache=on (created={self.created}, reused={self.reused}, "
+                f"extended={self.extended})"
+            )
+
+
+def prompt_cache_from_env() -> Optional[PromptCache]:
+    """
+    Build the Phase 2 prompt cache from the environment.
+
+    GEMINI_PROMPT_CACHE=0 disables it (default: on); GEMINI_PROMPT_CACHE_TTL
+    is the entry TTL in seconds (default 3600, extended while a run needs it);
+    GEMINI_PROMPT_CACHE_MIN_TOKENS overrides the model's minimum cacheable
+    size (see min_cache_tokens).
+    """
+    if os.getenv("GEMINI_PROMPT_CACHE", "1").strip().lower() in ("0", "false", "off", "no"):
+        return None
+    ttl_sec = float(os.getenv("GEMINI_PROMPT_CACHE_TTL", str(DEFAULT_TTL_SEC)))
+    min_tokens = os.getenv("GEMINI_PROMPT_CACHE_MIN_TOKENS", "").strip()
+    return PromptCache(
+        GeminiPromptCacheBackend(), ttl_sec, min_tokens=int(min_tokens) if min_tokens else None
+    )
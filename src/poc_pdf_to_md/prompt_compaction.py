@@ -0,0 +1,73 @@
+"""Compact serialization of the per-page JSON appended to Phase 2 prompts.
+
+Each mode builds on the previous one:
+
+- "full": everything, indented (the original format)
+- "compact": the same data without indentation or spaces after separators
+- "dedup": also drops what is repeated elsewhere in the JSON: the page_image
+  block (its path is page_image_path; its text-layer features only route
+  pages) and the image blocks (already in embedded_images_meta) of
+  page_parse_dict, per-block page_index, and null fields; bboxes are rounded
+  to 0.1 pt. page_parse_dict is left out when no block remains, so templates
+  must treat it as optional
+"""
+
+import json
+from typing import Any, Dict, List, Sequence
+
+PROMPT_JSON_MODES = ("full", "compact", "dedup")
+DEFAULT_PROMPT_JSON_MODE = "full"
+
+# Block types whose content page_image_path and embedded_images_meta already carry
+_DUPLICATED_BLOCK_TYPES = frozenset({"page_image", "image"})
+_BBOX_DECIMALS = 1
+
+
+def _round_bbox(bbox: Sequence[float]) -> List[float]:
+    return [round(float(v), _BBOX_DECIMALS) for v in bbox]
+
+
+def _dedup_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: v for k, v in entry.items() if v is not None and k != "page_index"}
+    if isinstance(out.get("bbox"), (list, tuple)):
+        out["bbox"] = _round_bbox(out["bbox"])
+    return out
+
+
+def page_reference(
+    *,
+    page_index: int,
+    page_image_rel: str,
+    embedded_images_meta: List[Dict[str, Any]],
+    page_parse_dict: Dict[str, Any],
+    mode: str = "full",
+) -> Dict[str, Any]:
+    """The JSON object appended to a page's prompt, reduced for mode."""
+    if mode not in PROMPT_JSON_MODES:
+        raise ValueError(
+            f"Unknown prompt JSON mode: {mode!r} (expected one of {', '.join(PROMPT_JSON_MODES)})"
+        )
+    reference: Dict[str, Any] = {"page_index": page_index, "page_image_path": page_image_rel}
+
+    if mode in ("full", "compact"):
+        reference["embedded_images_meta"] = embedded_images_meta
+        reference["page_parse_dict"] = page_parse_dict
+        return reference
+
+    if embedded_images_meta:
+        reference["embedded_images_meta"] = [_dedup_entry(meta) for meta in embedded_images_meta]
+    blocks = [
+        _dedup_entry(block)
+        for block in page_parse_dict.get("blocks", [])
+        if block.get("type") not in _DUPLICATED_BLOCK_TYPES
+    ]
+    if blocks:
+        reference["page_parse_dict"] = {"blocks": blocks}
+    return reference
+
+
+def dumps_reference(value: Any, mode: str = "full") -> str:
+    """Serialize page references for a prompt (indented only in "full" mode)."""
+    if mode == "full":
+        return json.dumps(value, ensure_ascii=False, indent=2)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,241 @@
+"""Host-wide RPM/TPM token buckets for Gemini requests, shared through SQLite.
+
+Every poc-pdf-to-md process on a host opens the same SQLite file and takes
+a request token and an estimated number of input tokens from the buckets
+(refilled continuously at RPM/60 and TPM/60 per second) before each
+request, in one IMMEDIATE transaction. After the response arrives, the token
+bucket is corrected by the difference between the estimate and the
+prompt_token_count reported in usage_metadata; a failed request gets its
+tokens back. The asyncio engine runs these blocking SQLite calls in worker
+threads so a contended lock never stalls the event loop.
+"""
+
+import asyncio
+import math
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Optional, Tuple
+
+DEFAULT_DB_PATH = Path(tempfile.gettempdir()) / "poc_pdf_to_md_rate_limit.sqlite3"
+
+# Longest single sleep while waiting for budget (re-checked after each sleep).
+_MAX_WAIT_SEC = 5.0
+_SQLITE_TIMEOUT_SEC = 30.0
+
+# Gemini image cost: small images are one 258-token unit; larger ones are
+# cut into 768x768 tiles of 258 tokens each.
+_IMAGE_TILE_TOKENS = 258
+_IMAGE_TILE_PX = 768
+_IMAGE_SMALL_PX = 384
+# Used when the image header cannot be read.
+_IMAGE_FALLBACK_TOKENS = 4 * _IMAGE_TILE_TOKENS
+
+
+def _image_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from a PNG, JPEG or WebP header, or None."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8X":
+            return (
+                int.from_bytes(data[24:27], "little") + 1,
+                int.from_bytes(data[27:30], "little") + 1,
+            )
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return ((bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return (width & 0x3FFF, height & 0x3FFF)
+    if data[:2] == b"\xff\xd8":
+        pos = 2
+        while pos + 9 < len(data):
+            if data[pos] != 0xFF:
+                pos += 1
+                continue
+            marker = data[pos + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                pos += 2
+                continue
+            length = struct.unpack(">H", data[pos + 2 : pos + 4])[0]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[pos + 5 : pos + 9])
+                return (width, height)
+            pos += 2 + length
+    return None
+
+
+def estimate_image_tokens(data: bytes) -> int:
+    """Estimated input tokens for one image part."""
+    dims = _image_dimensions(data)
+    if dims is None:
+        return _IMAGE_FALLBACK_TOKENS
+    width, height = dims
+    if width <= _IMAGE_SMALL_PX and height <= _IMAGE_SMALL_PX:
+        return _IMAGE_TILE_TOKENS
+    tiles = math.ceil(width / _IMAGE_TILE_PX) * math.ceil(height / _IMAGE_TILE_PX)
+    return tiles * _IMAGE_TILE_TOKENS
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Estimated tokens for prompt text: ~4 ASCII chars per token, one per other (CJK) char."""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+def estimate_tokens(texts: Iterable[str], images: Iterable[bytes]) -> int:
+    """Estimated input tokens for a request."""
+    text_tokens = sum(estimate_text_tokens(t) for t in texts)
+    return text_tokens + sum(estimate_image_tokens(d) for d in images)
+
+
+@dataclass
+class Reservation:
+    """Budget taken for one request (see SharedRateLimiter.settle)."""
+
+    scope: str
+    tokens: int
+    waited_sec: float
+
+
+class SharedRateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets in a SQLite file shared by processes."""
+
+    def __init__(self, db_path: Path, rpm: int = 0, tpm: int = 0) -> None:
+        self.db_path = Path(db_path)
+        self.rpm = max(rpm, 0)
+        self.tpm = max(tpm, 0)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=_SQLITE_TIMEOUT_SEC, isolation_level=None)
+
+    def _buckets(self, scope: str) -> Iterable[Tuple[str, int]]:
+        """(bucket name, per-minute capacity) for the enabled buckets."""
+        if self.rpm:
+            yield f"rpm:{scope}", self.rpm
+        if self.tpm:
+            yield f"tpm:{scope}", self.tpm
+
+    def try_acquire(self, scope: str, tokens: int) -> float:
+        """Take one request and `tokens` tokens if both are available.
+
+        Returns:
+            0.0 when taken, else the seconds to wait before trying again
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            levels = {}
+            wait = 0.0
+            for name, capacity in self._buckets(scope):
+                row = conn.execute(
+                    "SELECT level, updated FROM buckets WHERE name = ?", (name,)
+                ).fetchone()
+                level = float(capacity) if row is None else row[0]
+                if row is not None:
+                    level = min(float(capacity), level + (now - row[1]) * capacity / 60.0)
+                levels[name] = level
+                # A request larger than the whole budget waits for a full bucket.
+                cost = 1 if name.startswith("rpm:") else min(tokens, capacity)
+                if level < cost:
+                    wait = max(wait, (cost - level) * 60.0 / capacity)
+            if wait == 0.0:
+                for name, level in levels.items():
+                    level -= 1 if name.startswith("rpm:") else tokens
+                    conn.execute(
+                        "INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                        (name, level, now),
+                    )
+            conn.execute("COMMIT")
+        except BaseException:
+            # Not when BEGIN itself failed (e.g. locked): ROLLBACK would replace that error
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return wait
+
+    def acquire(self, scope: str, tokens: int) -> Reservation:
+        """Block until the request fits both budgets, then take it."""
+        t0 = time.monotonic()
+        while True:
+            wait = self.try_acquire(scope, tokens)
+            if wait == 0.0:
+                return Reservation(scope, tokens, time.monotonic() - t0)
+            time.sleep(min(wait, _MAX_WAIT_SEC))
+
+    async def acquire_async(self, scope: str, tokens: int) -> Reservation:
+        """acquire() for the asyncio engine (SQLite in a thread; sleeps don't block the loop)."""
+        t0 = time.monotonic()
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, scope, tokens)
+            if wait == 0.0:
+                return Reservation(scope, tokens, time.monotonic() - t0)
+            await asyncio.sleep(min(wait, _MAX_WAIT_SEC))
+
+    def settle(self, reservation: Reservation, actual_tokens: Optional[int]) -> None:
+        """Correct the token bucket with the request's reported input tokens (0: refund)."""
+        if not self.tpm or actual_tokens is None or actual_tokens == reservation.tokens:
+            return
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE buckets SET level = MIN(level + ?, ?) WHERE name = ?",
+                (reservation.tokens - actual_tokens, float(self.tpm), f"tpm:{reservation.scope}"),
+            )
+        finally:
+            conn.close()
+
+    def levels(self, scope: str) -> dict[str, float]:
+        """Current bucket levels (for diagnostics)."""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT name, level FROM buckets WHERE name IN (?, ?)",
+                (f"rpm:{scope}", f"tpm:{scope}"),
+            ).fetchall()
+        finally:
+            conn.close()
+        return {name.split(":", 1)[0]: level for name, level in rows}
+
+
+_LIMITER_LOCK = threading.Lock()
+_LIMITER: Optional[SharedRateLimiter] = None
+_LIMITER_KEY: Optional[Tuple[Any, ...]] = None
+
+
+def rate_limiter_from_env() -> Optional[SharedRateLimiter]:
+    """
+    Return the process-wide limiter configured by the environment, or None.
+
+    GEMINI_RPM / GEMINI_TPM set the per-minute budgets (unset or 0: no limit);
+    GEMINI_RATE_LIMIT_DB is the shared SQLite file (default: in the system
+    temp directory, so every process on the host shares it).
+    """
+    global _LIMITER, _LIMITER_KEY  # pylint: disable=global-statement
+    rpm = int(os.getenv("GEMINI_RPM", "0") or 0)
+    tpm = int(os.getenv("GEMINI_TPM", "0") or 0)
+    if rpm <= 0 and tpm <= 0:
+        return None
+    db_path = Path(os.getenv("GEMINI_RATE_LIMIT_DB") or DEFAULT_DB_PATH)
+    key = (db_path, rpm, tpm)
+    with _LIMITER_LOCK:
+        if _LIMITER is None or _LIMITER_KEY != key:
+            _LIMITER = SharedRateLimiter(db_path, rpm, tpm)
+            _LIMITER_KEY = key
+        return _LIMITER
@@ -0,0 +1,270 @@
+"""Persistent, content-addressed cache of Gemini responses, shared through SQLite.
+
+A response is keyed by the SHA-256 of the model, the generation settings,
+a JSON description of the request (the caller's choice; Phase 2 uses the
+template hash and each page's reference data without document-position
+fields, so a page's key does not depend on the other pages) and the bytes
+of every image sent. The cache file is shared by
+every run and output directory, so converting the same PDF again (or a
+new revision with unchanged pages) reuses earlier responses. Entries older
+than the maximum age are dropped, and the least recently used entries are
+evicted once the total size exceeds the limit. Identical lookups in flight
+at the same time in one process are collapsed into one request
+(single-flight).
+
+Each process tracks a running total of the bytes it has stored; the table
+is only summed (and aged entries dropped) on the first put, every
+_MAINTENANCE_EVERY puts (to pick up other processes' writes) and when the
+running total crosses the limit, in which case entries are evicted down to
+_LOW_WATER of it. The asyncio engine reaches SQLite through worker threads.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+DEFAULT_DB_PATH = (
+    Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "poc_pdf_to_md"
+    / "response_cache.sqlite3"
+)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE_SEC = 90 * 24 * 3600.0
+
+_SQLITE_TIMEOUT_SEC = 30.0
+_MAINTENANCE_EVERY = 100
+# Size eviction frees space down to this fraction of the limit, so it does not run on every put
+_LOW_WATER = 0.9
+
+
+def response_key(
+    *, model: str, config: Dict[str, Any], request: Dict[str, Any], images: Sequence[bytes]
+) -> str:
+    """Content address of one request: SHA-256 over model, config, request and image hashes."""
+    payload = {
+        "model": model,
+        "config": config,
+        "request": request,
+        "image_sha256": [hashlib.sha256(data).hexdigest() for data in images],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite response cache with size- and age-based LRU eviction and single-flight lookups."""
+
+    def __init__(
+        self,
+        db_path: Path,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age_sec: float = DEFAULT_MAX_AGE_SEC,
+    ) -> None:
+        self.db_path = Path(db_path)
+        self.max_bytes = max(max_bytes, 0)
+        self.max_age_sec = max(max_age_sec, 0.0)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL, "
+                "size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._puts = 0
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.evicted = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=_SQLITE_TIMEOUT_SEC, isolation_level=None)
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached response for key (marking it recently used), or None."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.max_age_sec and row[1] < now - self.max_age_sec:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            return row[0]
+        finally:
+            conn.close()
+
+    def put(self, key: str, model: str, response: str) -> None:
+        """Store a response, then evict old and least recently used entries when due."""
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            with self._lock:
+                self._puts += 1
+                self._total_bytes += size
+                due = self._puts % _MAINTENANCE_EVERY == 1 or (
+                    self.max_bytes and self._total_bytes > self.max_bytes
+                )
+            if due:
+                self._evict(conn, now)
+        finally:
+            conn.close()
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        if self.max_age_sec:
+            self.evicted += conn.execute(
+                "DELETE FROM responses WHERE created < ?", (now - self.max_age_sec,)
+            ).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if self.max_bytes and total > self.max_bytes:
+            target = int(self.max_bytes * _LOW_WATER)
+            victims = []
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                if total <= target:
+                    break
+                victims.append((key,))
+                total -= size
+            conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+            self.evicted += len(victims)
+        with self._lock:
+            self._total_bytes = total
+
+    def _join_or_lead(self, key: str) -> Tuple[Future, bool]:
+        """The in-flight future for key, and whether the caller must compute it."""
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.collapsed += 1
+                return fut, False
+            fut = self._inflight[key] = Future()
+            return fut, True
+
+    def _finish(self, key: str) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def get_or_compute(self, key: str, model: str, compute: Callable[[], str]) -> str:
+        """Cached response for key, else compute() once for all concurrent callers and store it."""
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        fut, leader = self._join_or_lead(key)
+        if not leader:
+            return fut.result()
+        try:
+            # Re-checked: a leader for the same key may have finished since the first lookup.
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                fut.set_result(value)
+                return value
+            self.misses += 1
+            value = compute()
+            self.put(key, model, value)
+            fut.set_result(value)
+            return value
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            self._finish(key)
+
+    async def get_or_compute_async(
+        self, key: str, model: str, compute: Callable[[], Awaitable[str]]
+    ) -> str:
+        """get_or_compute() for the asyncio engine (SQLite calls in worker threads)."""
+        cached = await asyncio.to_thread(self.get, key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        fut, leader = self._join_or_lead(key)
+        if not leader:
+            return await asyncio.wrap_future(fut)
+        try:
+            # Re-checked: a leader for the same key may have finished since the first lookup.
+            value = await asyncio.to_thread(self.get, key)
+            if value is not None:
+                self.hits += 1
+                fut.set_result(value)
+                return value
+            self.misses += 1
+            value = await compute()
+            await asyncio.to_thread(self.put, key, model, value)
+            fut.set_result(value)
+            return value
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            self._finish(key)
+
+    def stats(self) -> Dict[str, int]:
+        """Entries and total response bytes stored in the cache file."""
+        conn = self._connect()
+        try:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        finally:
+            conn.close()
+        return {"entries": entries, "bytes": size}
+
+    def report(self) -> Dict[str, Any]:
+        """Snapshot for phase2/state.json."""
+        return {
+            "db_path": str(self.db_path),
+            "hits": self.hits,
+            "misses": self.misses,
+            "collapsed": self.collapsed,
+            "evicted": self.evicted,
+        }
+
+    def summary(self) -> str:
+        """One-line summary for the Phase 2 run report."""
+        return (
+            f"response_cache=(hits={self.hits}, misses={self.misses}, "
+            f"collapsed={self.collapsed}, evicted={self.evicted})"
+        )
+
+
+def response_cache_from_env() -> Optional[ResponseCache]:
+    """
+    Build the Phase 2 response cache from the environment.
+
+    GEMINI_RESPONSE_CACHE=0 disables it (default: on); GEMINI_RESPONSE_CACHE_DB
+    is the SQLite file (default: ~/.cache/poc_pdf_to_md/response_cache.sqlite3);
+    GEMINI_RESPONSE_CACHE_MAX_MB (default 512) and
+    GEMINI_RESPONSE_CACHE_MAX_AGE_DAYS (default 90, 0 = no limit) bound it.
+    """
+    if os.getenv("GEMINI_RESPONSE_CACHE", "1").strip().lower() in ("0", "false", "off", "no"):
+        return None
+    db_path = Path(os.getenv("GEMINI_RESPONSE_CACHE_DB") or DEFAULT_DB_PATH)
+    max_mb = float(
+        os.getenv("GEMINI_RESPONSE_CACHE_MAX_MB", str(DEFAULT_MAX_BYTES // (1024 * 1024)))
+    )
+    max_age_days = float(
+        os.getenv("GEMINI_RESPONSE_CACHE_MAX_AGE_DAYS", str(DEFAULT_MAX_AGE_SEC / 86400))
+    )
+    return ResponseCache(db_path, int(max_mb * 1024 * 1024), max_age_days * 86400)
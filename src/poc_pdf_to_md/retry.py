@@ -0,0 +1,104 @@
+"""Retry policy for transient Gemini errors (429, 5xx, timeouts, dropped connections).
+
+Delays use exponential backoff with full jitter, unless the error carries a
+server-provided delay (HTTP Retry-After or a google.rpc.RetryInfo
+retryDelay in the error details), which is honored instead.
+"""
+
+import os
+import random
+import re
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import httpx
+
+from .concurrency import is_throttle_error
+
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+_DURATION_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)s\s*$")
+
+
+def _retry_after_header(err: BaseException) -> Optional[float]:
+    response = getattr(err, "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def _retry_info_delay(err: BaseException) -> Optional[float]:
+    details: Any = getattr(err, "details", None)
+    if isinstance(details, dict):
+        details = details.get("error", details).get("details")
+    if not isinstance(details, list):
+        return None
+    for item in details:
+        if isinstance(item, dict) and str(item.get("@type", "")).endswith("RetryInfo"):
+            match = _DURATION_RE.match(str(item.get("retryDelay", "")))
+            if match:
+                return float(match.group(1))
+    return None
+
+
+def retry_after(err: BaseException) -> Optional[float]:
+    """Server-requested delay in seconds, if the error carries one."""
+    delay = _retry_after_header(err)
+    return delay if delay is not None else _retry_info_delay(err)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How many times and how long to wait before retrying a failed request."""
+
+    max_attempts: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def is_retryable(self, err: BaseException) -> bool:
+        """Whether the error is transient (worth another attempt)."""
+        if getattr(err, "code", None) in RETRYABLE_STATUS_CODES:
+            return True
+        if isinstance(
+            err, (httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError)
+        ):
+            return True
+        return is_throttle_error(err)
+
+    def should_retry(self, err: BaseException, attempt: int) -> bool:
+        """Whether to retry after the given (1-based) failed attempt."""
+        return attempt < self.max_attempts and self.is_retryable(err)
+
+    def delay(self, attempt: int, err: Optional[BaseException] = None) -> float:
+        """Seconds to wait after the given (1-based) failed attempt."""
+        server_delay = retry_after(err) if err is not None else None
+        if server_delay is not None:
+            # Honor the server; a little jitter spreads the retries of parallel workers.
+            return server_delay + random.uniform(0, min(self.base_delay, server_delay * 0.1 + 0.1))
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def retry_policy_from_env() -> RetryPolicy:
+    """
+    Build the Phase 2 retry policy from the environment.
+
+    GEMINI_MAX_ATTEMPTS (default 5, 1 disables retries), GEMINI_RETRY_BASE_DELAY
+    and GEMINI_RETRY_MAX_DELAY (seconds, defaults 1 and 60).
+    """
+    return RetryPolicy(
+        max_attempts=max(int(os.getenv("GEMINI_MAX_ATTEMPTS", "5")), 1),
+        base_delay=max(float(os.getenv("GEMINI_RETRY_BASE_DELAY", "1.0")), 0.0),
+        max_delay=max(float(os.getenv("GEMINI_RETRY_MAX_DELAY", "60.0")), 0.0),
+    )
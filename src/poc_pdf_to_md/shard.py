@@ -0,0 +1,83 @@
+"""Page-range selection and N-way sharding."""
+
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+
+def parse_page_ranges(spec: str, total_pages: int) -> List[int]:
+    """
+    Parse a 1-based, inclusive page range spec into sorted 0-based page indices.
+
+    Examples (total_pages=10): "1-3,5" -> [0, 1, 2, 4]; "8-" -> [7, 8, 9]; "-2" -> [0, 1]
+    """
+    selected: set[int] = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                start_s, end_s = part.split("-", 1)
+                start = int(start_s) if start_s.strip() else 1
+                end = int(end_s) if end_s.strip() else total_pages
+            else:
+                start = end = int(part)
+        except ValueError as e:
+            raise ValueError(f"Invalid page range: {part!r}") from e
+        if start < 1 or end > total_pages or start > end:
+            raise ValueError(
+                f"Page range out of bounds: {part!r} (document has {total_pages} pages)"
+            )
+        selected.update(range(start - 1, end))
+    if not selected:
+        raise ValueError(f"Page range selects no pages: {spec!r}")
+    return sorted(selected)
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """Parse a shard spec "i/N" (0-based shard index i, N shards)."""
+    try:
+        index_s, count_s = spec.split("/", 1)
+        index, count = int(index_s), int(count_s)
+    except ValueError as e:
+        raise ValueError(f"Invalid shard spec: {spec!r} (expected i/N)") from e
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard spec: {spec!r} (need 0 <= i < N)")
+    return index, count
+
+
+def select_pages(
+    available_pages: Sequence[int],
+    pages_spec: Optional[str] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    total_pages: Optional[int] = None,
+) -> List[int]:
+    """
+    Apply an optional page range and shard to the available page indices.
+
+    The range filter is applied first; the remaining pages are then split into
+    N contiguous shards and shard i is returned (contiguous shards keep each
+    machine's pages together and make merging a simple concatenation).
+    """
+    pages = sorted(available_pages)
+    if pages_spec:
+        bound = total_pages if total_pages is not None else len(pages)
+        wanted = set(parse_page_ranges(pages_spec, bound))
+        pages = [p for p in pages if p in wanted]
+    if shard is not None:
+        index, count = shard
+        base, extra = divmod(len(pages), count)
+        start = index * base + min(index, extra)
+        end = start + base + (1 if index < extra else 0)
+        pages = pages[start:end]
+    return pages
+
+
+def find_parse_result(output_dir: Path) -> Path:
+    """Return the newest parse_result*.json in an output directory's parsed/."""
+    candidates = sorted(
+        (output_dir / "parsed").glob("parse_result*.json"), key=lambda p: p.stat().st_mtime
+    )
+    if not candidates:
+        raise FileNotFoundError(f"No parse_result*.json found in {output_dir / 'parsed'}")
+    return candidates[-1]
@@ -0,0 +1,224 @@
+"""Text-layer analysis and local Markdown conversion for born-digital pages.
+
+Phase 1 analyzes each page's text layer (page.get_text("dict")) while the
+page is loaded, records the features in the page_image block and saves a
+locally converted Markdown file. Phase 2 routes pages with a clean, simple
+text layer to that local result instead of the model (see route_page).
+"""
+
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+# Routing thresholds (Phase 2).
+_MIN_CHARS = 200
+_MAX_GARBLED_FRACTION = 0.01
+_MAX_TABULAR_LINES = 2
+_MAX_RULES = 5
+
+# Span font flag for bold text (PyMuPDF TEXT_FONT_BOLD).
+_BOLD_FLAG = 16
+# A gap wider than this many font sizes between spans of one line suggests columns.
+_COLUMN_GAP_EMS = 2.0
+# Vector shapes larger than this share of the page count as figures.
+_FIGURE_AREA_FRACTION = 0.02
+# Stroked/filled rectangles thinner than this (pt) count as rules (table borders).
+_RULE_THICKNESS = 2.0
+
+_BULLET_RE = re.compile(r"^\s*[•·▪●◦‣\-\*–]\s+")
+_PAGE_NUMBER_RE = re.compile(r"^[\s\-–—]*(page\s*)?\d+(\s*(/|of)\s*\d+)?[\s\-–—]*$", re.IGNORECASE)
+_CJK_RE = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def _line_text(line: Dict[str, Any]) -> str:
+    return "".join(span["text"] for span in line["spans"]).strip()
+
+
+def _line_size(line: Dict[str, Any]) -> float:
+    return max((span["size"] for span in line["spans"] if span["text"].strip()), default=0.0)
+
+
+def _line_bold(line: Dict[str, Any]) -> bool:
+    spans = [span for span in line["spans"] if span["text"].strip()]
+    return bool(spans) and all(span["flags"] & _BOLD_FLAG for span in spans)
+
+
+def _is_tabular_line(line: Dict[str, Any]) -> bool:
+    spans = [span for span in line["spans"] if span["text"].strip()]
+    gaps = 0
+    for prev, cur in zip(spans, spans[1:]):
+        if cur["bbox"][0] - prev["bbox"][2] > _COLUMN_GAP_EMS * max(prev["size"], 1.0):
+            gaps += 1
+    return gaps >= 2
+
+
+def _text_lines(text_dict: Dict[str, Any]) -> List[Tuple[int, Dict[str, Any]]]:
+    """(block number, line) for every non-empty text line, in reading order."""
+    lines = []
+    for block_no, block in enumerate(text_dict.get("blocks", [])):
+        if block.get("type") != 0:
+            continue
+        for line in block["lines"]:
+            if _line_text(line):
+                lines.append((block_no, line))
+    return lines
+
+
+def _body_size(lines: List[Tuple[int, Dict[str, Any]]]) -> float:
+    """Most common font size, weighted by characters."""
+    sizes: Counter = Counter()
+    for _, line in lines:
+        for span in line["spans"]:
+            sizes[round(span["size"] * 2) / 2] += len(span["text"].strip())
+    return sizes.most_common(1)[0][0] if sizes else 0.0
+
+
+def _heading_level(size: float, body_size: float, bold: bool, text: str) -> int:
+    if body_size <= 0 or len(text) > 120:
+        return 0
+    ratio = size / body_size
+    if ratio >= 1.6:
+        return 1
+    if ratio >= 1.3:
+        return 2
+    if ratio >= 1.15 or (bold and len(text) <= 80 and not text.endswith((".", "。", ":", "："))):
+        return 3
+    return 0
+
+
+def analyze_text_layer(page: fitz.Page, embedded_images: int = 0) -> Tuple[Dict[str, Any], str]:
+    """
+    Analyze a page's text layer and convert it to Markdown locally.
+
+    Args:
+        page: Loaded page
+        embedded_images: Number of embedded image placements kept for the page
+
+    Returns:
+        (features, markdown); features are stored as "text_layer" in the
+        page_image block and used by route_page()
+    """
+    text_dict = page.get_text("dict", sort=True)
+    lines = _text_lines(text_dict)
+    page_area = max(abs(page.rect), 1.0)
+
+    rules = shapes = 0
+    for drawing in page.get_cdrawings():
+        rect = fitz.Rect(drawing["rect"])
+        if min(rect.width, rect.height) <= _RULE_THICKNESS:
+            rules += 1
+        elif abs(rect) >= _FIGURE_AREA_FRACTION * page_area:
+            shapes += 1
+
+    text = "".join(_line_text(line) for _, line in lines)
+    features = {
+        "chars": len(text),
+        "lines": len(lines),
+        "body_size": _body_size(lines),
+        "headings": 0,
+        "tabular_lines": sum(1 for _, line in lines if _is_tabular_line(line)),
+        "rotated_lines": sum(1 for _, line in lines if tuple(line["dir"]) != (1.0, 0.0)),
+        "garbled_chars": sum(1 for ch in text if ch == "\ufffd" or "\ue000" <= ch <= "\uf8ff"),
+        "rules": rules,
+        "figures": embedded_images + shapes,
+    }
+    markdown, features["headings"] = _to_markdown(lines, features["body_size"])
+    return features, markdown
+
+
+def _join_lines(parts: List[str]) -> str:
+    out = ""
+    for part in parts:
+        if not out:
+            out = part
+        elif out.endswith("-") and part[:1].islower():
+            out = out[:-1] + part  # de-hyphenate
+        elif _CJK_RE.match(out[-1]) or _CJK_RE.match(part[0]):
+            out += part
+        else:
+            out += " " + part
+    return out
+
+
+def _to_markdown(lines: List[Tuple[int, Dict[str, Any]]], body_size: float) -> Tuple[str, int]:
+    """Headings by font size, paragraphs per text block, bullet lists; page numbers dropped."""
+    paragraphs: List[str] = []
+    headings = 0
+    current: List[str] = []
+    current_block: Optional[int] = None
+
+    def _flush() -> None:
+        if current:
+            paragraphs.append(_join_lines(current))
+            current.clear()
+
+    for block_no, line in lines:
+        text = _line_text(line)
+        if _PAGE_NUMBER_RE.match(text):
+            continue
+        level = _heading_level(_line_size(line), body_size, _line_bold(line), text)
+        if level:
+            _flush()
+            prefix = "#" * level + " "
+            if paragraphs and paragraphs[-1].startswith(prefix) and block_no == current_block:
+                paragraphs[-1] += " " + text  # heading wrapped onto a second line
+            else:
+                paragraphs.append(prefix + text)
+                headings += 1
+        elif _BULLET_RE.match(text):
+            _flush()
+            current.append("- " + _BULLET_RE.sub("", text))
+        else:
+            if block_no != current_block:
+                _flush()
+            current.append(text)
+        current_block = block_no
+    _flush()
+
+    # Consecutive list items form one list (single newline between them)
+    markdown = ""
+    for para in paragraphs:
+        if markdown:
+            in_list = para.startswith("- ") and markdown.rsplit("\n", 1)[-1].startswith("- ")
+            markdown += "\n" if in_list else "\n\n"
+        markdown += para
+    return markdown, headings
+
+
+def route_page(features: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+    """
+    Decide whether a page is converted locally or by the model.
+
+    Returns:
+        ("local" | "model", reason)
+    """
+    if not features:
+        return "model", "no_text_layer"
+    if features["chars"] < _MIN_CHARS:
+        return "model", "too_little_text"
+    if features["garbled_chars"] > _MAX_GARBLED_FRACTION * features["chars"]:
+        return "model", "garbled_text"
+    if features["rotated_lines"]:
+        return "model", "rotated_text"
+    if features["figures"]:
+        return "model", "figures"
+    if features["tabular_lines"] > _MAX_TABULAR_LINES or features["rules"] > _MAX_RULES:
+        return "model", "table_like"
+    return "local", "clean_text_layer"
+
+
+def generate_page_text_filename(page_number: int) -> str:
+    """Generate the local Markdown filename for a page."""
+    return f"page_{page_number:04d}.md"
+
+
+def save_page_text(markdown: str, output_dir: Path, page_index: int) -> Path:
+    """Save a page's locally converted Markdown under text/ and return the relative path."""
+    text_dir = output_dir / "text"
+    text_dir.mkdir(parents=True, exist_ok=True)
+    path = text_dir / generate_page_text_filename(page_index)
+    path.write_text(markdown + "\n" if markdown else "", encoding="utf-8")
+    return path.relative_to(output_dir)
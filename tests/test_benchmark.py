@@ -0,0 +1,56 @@
+"""Tests for benchmark helpers."""
+
+import os
+import tempfile
+from pathlib import Path
+
+import fitz
+
+from poc_pdf_to_md.benchmark import benchmark_client_setup, benchmark_page_formats
+
+
+class TestBenchmarkPageFormats:
+    """Test page image format benchmark."""
+
+    temp_dir: Path
+    pdf_path: Path
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.pdf_path = self.temp_dir / "doc.pdf"
+        doc = fitz.open()
+        for i in range(3):
+            doc.new_page().insert_text((72, 72), f"Page {i}", fontsize=20)
+        doc.save(str(self.pdf_path))
+        doc.close()
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        import shutil
+        if self.temp_dir.exists():
+            shutil.rmtree(self.temp_dir)
+
+    def test_benchmark_reports_each_format(self):
+        """Test that one row per format is reported with sizes and timings."""
+        rows = benchmark_page_formats(str(self.pdf_path), ["png", "jpeg"], max_pages=2)
+        assert [r["format"] for r in rows] == ["png", "jpeg"]
+        for row in rows:
+            assert row["pages"] == 2
+            assert row["bytes_per_page"] > 0
+            assert row["encode_ms_per_page"] >= 0
+
+    def test_benchmark_client_setup_reports_both_modes(self, monkeypatch):
+        """Test that per-page and pooled client setup are both timed."""
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+        rows = benchmark_client_setup(calls=2)
+        assert [r["mode"] for r in rows] == ["per_page", "pooled"]
+        assert all(r["calls"] == 2 and r["setup_ms_per_call"] >= 0 for r in rows)
+
+    def test_benchmark_client_setup_leaves_api_key_unset(self, monkeypatch):
+        """Test that the placeholder key is not written to the environment."""
+        monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+        monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+        monkeypatch.setattr("poc_pdf_to_md.gemini_client.load_dotenv", lambda: None)
+        benchmark_client_setup(calls=1)
+        assert "GEMINI_API_KEY" not in os.environ
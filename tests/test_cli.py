@@ -11,9 +11,11 @@ import pytest
 from poc_pdf_to_md.cli import (
     parse_args,
     get_model_name,
+    get_render_options,
     print_parse_output_path,
     print_success_message,
 )
+from poc_pdf_to_md.page_render import DEFAULT_BLANK_THRESHOLD
 
 
 class TestCLIParseArgs:
@@ -116,6 +118,40 @@ class TestCLIParseArgs:
                 assert mock_exit.called
                 assert mock_exit.call_args[0][0] == 1
 
+    def test_parse_args_stdin_input(self):
+        """Test that --input - skips the file check and reads stdin."""
+        import io
+        from poc_pdf_to_md.cli import get_pdf_source
+
+        with patch.object(sys, "argv", ["test_cli.py", "--input", "-", "--parse-only"]):
+            args = parse_args()
+        stdin = io.TextIOWrapper(io.BytesIO(b"%PDF-1.7 data"))
+        with patch.object(sys, "stdin", stdin):
+            assert get_pdf_source(args) == b"%PDF-1.7 data"
+
+    def test_parse_args_gc_image_store_without_input(self):
+        """Test that --gc-image-store does not require --input."""
+        test_args = ["--gc-image-store", self.temp_dir]
+        with patch.object(sys, "argv", ["test_cli.py"] + test_args):
+            args = parse_args()
+            assert args.gc_image_store == self.temp_dir
+            assert args.input is None
+
+    def test_image_filter_and_blank_detection_are_opt_in(self):
+        """Test that image filtering and blank detection are off unless requested."""
+        self.temp_pdf.write_bytes(b"%PDF-1.7")
+        base = ["test_cli.py", "--input", str(self.temp_pdf)]
+        with patch.object(sys, "argv", base):
+            options = get_render_options(parse_args())
+        assert options.image_filter is None
+        assert options.blank_threshold == 0.0
+
+        argv = base + ["--image-filter", "--image-min-area", "10", "--blank-threshold"]
+        with patch.object(sys, "argv", argv):
+            options = get_render_options(parse_args())
+        assert options.image_filter.min_area == 10
+        assert options.blank_threshold == DEFAULT_BLANK_THRESHOLD
+
 
 class TestGetModelName:
     """Test model name resolution."""
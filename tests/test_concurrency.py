@@ -0,0 +1,188 @@
+"""Tests for the adaptive (AIMD) Phase 2 concurrency limit."""
+
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+
+from poc_pdf_to_md.concurrency import (
+    AdaptiveLimit,
+    adaptive_limit_from_env,
+    is_throttle_error,
+    note_rate_limit_wait,
+)
+
+
+class _ApiError(Exception):
+    def __init__(self, code: int) -> None:
+        super().__init__(f"{code} error")
+        self.code = code
+
+
+def _run_requests(limit: AdaptiveLimit, count: int, error: Exception | None = None) -> None:
+    for _ in range(count):
+        try:
+            with limit.slot():
+                if error is not None:
+                    raise error
+        except type(error) if error is not None else ():  # type: ignore[misc]
+            pass
+
+
+# pylint: disable=protected-access
+def _finish(limit: AdaptiveLimit, latency: float) -> None:
+    """Complete one successful request with the given latency."""
+    with limit._cond:
+        limit._in_flight += 1
+        limit._on_done(time.monotonic(), latency, throttled=False, failed=False)
+
+
+def _finish_saturated(limit: AdaptiveLimit, count: int) -> None:
+    """Complete count successful requests, each finishing while every slot is taken."""
+    with limit._cond:
+        for _ in range(count):
+            limit._in_flight = limit.limit
+            limit._on_done(time.monotonic(), 0.01, throttled=False, failed=False)
+        limit._in_flight = 0
+# pylint: enable=protected-access
+
+
+class TestAdaptiveLimit:
+    """Test additive increase / multiplicative decrease."""
+
+    def test_successes_increase_limit_up_to_maximum(self):
+        """Test that healthy requests raise the limit by about one per window, capped at max."""
+        limit = AdaptiveLimit(2, minimum=1, maximum=4)
+        _finish_saturated(limit, 2)
+        assert limit.limit == 3
+        _finish_saturated(limit, 50)
+        assert limit.limit == 4
+        assert limit.report()["peak"] == 4
+
+    def test_unused_limit_does_not_grow(self):
+        """Test that successes with slots to spare leave the limit alone."""
+        limit = AdaptiveLimit(2, minimum=1, maximum=4)
+        _run_requests(limit, 50)  # One request at a time: never saturated
+        assert limit.limit == 2
+        assert limit.report()["increases"] == 0
+
+    def test_throttling_halves_limit_once_per_window(self):
+        """Test that a burst of 429s from requests in flight together counts once."""
+        limit = AdaptiveLimit(8, minimum=2, maximum=8)
+        barrier = threading.Barrier(4)
+
+        def _throttled_request() -> None:
+            try:
+                with limit.slot():
+                    barrier.wait()
+                    raise _ApiError(429)
+            except _ApiError:
+                pass
+
+        threads = [threading.Thread(target=_throttled_request) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert limit.limit == 4
+        assert limit.report()["throttled"] == 4
+
+        _run_requests(limit, 3, _ApiError(503))
+        assert limit.limit == 2  # never below the minimum
+
+    def test_latency_spike_decreases_limit(self):
+        """Test that a window of requests much slower than before decreases the limit."""
+        limit = AdaptiveLimit(6, maximum=6, latency_spike=2.0)
+        for latency in [0.01] * 20 + [0.05] * 4:
+            _finish(limit, latency)
+        assert limit.limit == 6
+        for _ in range(2):
+            _finish(limit, 0.05)
+        assert limit.limit == 3
+
+    def test_latency_outliers_do_not_decrease_limit(self):
+        """Test that single slow requests in a widely varying workload leave the limit alone."""
+        limit = AdaptiveLimit(10, maximum=10, latency_spike=2.0)
+        rng = random.Random(0)
+        for i in range(500):
+            _finish(limit, 0.5 if i % 7 == 0 else rng.uniform(0.0, 0.05))
+        assert limit.report()["decreases"] == 0
+
+    def test_rate_limit_wait_is_not_latency(self):
+        """Test that time waiting for the RPM/TPM budget is excluded from request latency."""
+        limit = AdaptiveLimit(6, maximum=6, latency_spike=2.0)
+        for _ in range(20):
+            with limit.slot():
+                time.sleep(0.01)
+        for _ in range(10):
+            with limit.slot():
+                time.sleep(0.04)
+                note_rate_limit_wait(0.03)
+        assert limit.limit == 6
+
+    def test_other_errors_do_not_change_limit(self):
+        """Test that non-throttling failures neither increase nor decrease the limit."""
+        limit = AdaptiveLimit(3, maximum=10)
+        _run_requests(limit, 5, ValueError("bad"))
+        assert limit.limit == 3
+
+    def test_slot_blocks_beyond_limit(self):
+        """Test that at most `limit` threads hold a slot at once."""
+        limit = AdaptiveLimit(2, maximum=2)
+        in_flight = peak = 0
+        lock = threading.Lock()
+
+        def _request() -> None:
+            nonlocal in_flight, peak
+            with limit.slot():
+                with lock:
+                    in_flight += 1
+                    peak = max(peak, in_flight)
+                time.sleep(0.01)
+                with lock:
+                    in_flight -= 1
+
+        threads = [threading.Thread(target=_request) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert peak == 2
+
+    def test_async_slot_bounds_tasks(self):
+        """Test that asyncio tasks share the same limit."""
+        limit = AdaptiveLimit(3, maximum=3)
+        in_flight = peak = 0
+
+        async def _request() -> None:
+            nonlocal in_flight, peak
+            async with limit.slot_async():
+                in_flight += 1
+                peak = max(peak, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+
+        async def _main() -> None:
+            await asyncio.gather(*(_request() for _ in range(20)))
+
+        asyncio.run(_main())
+        assert peak == 3
+
+    def test_limits_from_env(self, monkeypatch):
+        """Test that GEMINI_CONCURRENCY is the start and _MIN/_MAX are the bounds."""
+        monkeypatch.setenv("GEMINI_CONCURRENCY", "8")
+        monkeypatch.setenv("GEMINI_CONCURRENCY_MIN", "2")
+        monkeypatch.setenv("GEMINI_CONCURRENCY_MAX", "32")
+        limit = adaptive_limit_from_env()
+        assert (limit.limit, limit.minimum, limit.maximum) == (8, 2, 32)
+        monkeypatch.delenv("GEMINI_CONCURRENCY_MAX")
+        assert adaptive_limit_from_env().maximum == 32  # room to grow: 4x the start
+
+    def test_is_throttle_error(self):
+        """Test throttle classification by status code and message."""
+        assert is_throttle_error(_ApiError(429))
+        assert is_throttle_error(RuntimeError("503 UNAVAILABLE"))
+        assert is_throttle_error(RuntimeError("RESOURCE_EXHAUSTED: quota"))
+        assert not is_throttle_error(RuntimeError("FinishReason.RECITATION"))
@@ -107,7 +107,123 @@ class TestPhase1ParsePDF:
         assert len(timestamp) == 15  # YYYYMMDD_HHMMSS
         assert "_" in timestamp
 
+    def test_phase1_parse_pdf_from_stream_records_content_hash(self):
+        """Test that stream and path input produce the same content identity."""
+        import hashlib
+        import json
+        data = self.test_pdf.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+
+        stream_path = phase1_parse_pdf(data, self.temp_dir / "stream", overwrite=True)
+        path_path = phase1_parse_pdf(
+            str(self.test_pdf), self.temp_dir / "path", overwrite=True, use_mmap=True
+        )
+
+        from_stream = json.loads(stream_path.read_text())
+        from_path = json.loads(path_path.read_text())
+        assert from_stream["source_pdf"] == f"sha256:{digest}"
+        assert from_stream["source_sha256"] == from_path["source_sha256"] == digest
+        assert from_path["source_pdf"] == str(self.test_pdf)
+        assert len(from_stream["blocks"]) == len(from_path["blocks"])
+
     def test_phase1_parse_pdf_nonexistent_file(self):
         """Test error when PDF file does not exist."""
         with pytest.raises(RuntimeError):
             phase1_parse_pdf("nonexistent.pdf", self.temp_dir)
+
+
+class TestPhase1Manifest:
+    """Test incremental and resumable Phase 1 runs."""
+
+    temp_dir: Path
+    pdf_path: Path
+    out_dir: Path
+
+    def setup_method(self):
+        """Setup test environment."""
+        import fitz
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.pdf_path = self.temp_dir / "doc.pdf"
+        doc = fitz.open()
+        for i in range(4):
+            doc.new_page().insert_text((72, 72), f"Page {i}", fontsize=20)
+        doc.save(str(self.pdf_path))
+        doc.close()
+        self.out_dir = self.temp_dir / "out"
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        import shutil
+        if self.temp_dir.exists():
+            shutil.rmtree(self.temp_dir)
+
+    def _run_recording_pages(self, **kwargs):
+        from unittest.mock import patch
+        from poc_pdf_to_md import engine
+
+        rendered: list[int] = []
+        real = engine.process_pages_pipelined
+
+        def _recording(doc, page_indices, *args, **kw):
+            rendered.extend(page_indices)
+            return real(doc, page_indices, *args, **kw)
+
+        with patch("poc_pdf_to_md.engine.process_pages_pipelined", side_effect=_recording):
+            path = phase1_parse_pdf(str(self.pdf_path), self.out_dir, **kwargs)
+        return path, rendered
+
+    def test_unchanged_rerun_reuses_parse_result(self):
+        """Test that a second run renders nothing and returns the same file."""
+        first, rendered = self._run_recording_pages()
+        assert rendered == [0, 1, 2, 3]
+        second, rendered = self._run_recording_pages()
+        assert rendered == []
+        assert second == first
+        assert len(list((self.out_dir / "parsed").glob("parse_result*.json"))) == 1
+
+    def test_resume_renders_only_unfinished_pages(self):
+        """Test that a crashed run resumes at the first unfinished page."""
+        import json
+        self._run_recording_pages()
+        manifest_path = self.out_dir / "parsed" / "phase1_manifest.jsonl"
+        lines = manifest_path.read_text(encoding="utf-8").splitlines()
+        # Simulate a crash after page 1: header + two page lines + a torn line
+        manifest_path.write_text("\n".join(lines[:3]) + '\n{"page": {"page_ind', encoding="utf-8")
+
+        path, rendered = self._run_recording_pages()
+
+        assert rendered == [2, 3]
+        parse_result = json.loads(path.read_text(encoding="utf-8"))
+        page_images = [b for b in parse_result["blocks"] if b["type"] == "page_image"]
+        assert [b["page_index"] for b in page_images] == [0, 1, 2, 3]
+        assert [b["blockIndex"] for b in parse_result["blocks"]] == list(range(4))
+
+    def test_missing_output_file_is_rerendered(self):
+        """Test that a page whose image was deleted is processed again."""
+        self._run_recording_pages()
+        (self.out_dir / "images" / "page_0002.png").unlink()
+        _, rendered = self._run_recording_pages()
+        assert rendered == [2]
+        assert (self.out_dir / "images" / "page_0002.png").exists()
+
+    def test_changed_settings_or_pdf_invalidate_manifest(self):
+        """Test that the manifest only matches the same PDF bytes and settings."""
+        import fitz
+        from poc_pdf_to_md.page_render import RenderOptions
+
+        self._run_recording_pages()
+        _, rendered = self._run_recording_pages(render_options=RenderOptions(zoom=1.0))
+        assert rendered == [0, 1, 2, 3]
+
+        doc = fitz.open(str(self.pdf_path))
+        doc[0].insert_text((72, 144), "edited", fontsize=12)
+        doc.saveIncr()
+        doc.close()
+        _, rendered = self._run_recording_pages(render_options=RenderOptions(zoom=1.0))
+        assert rendered == [0, 1, 2, 3]
+
+    def test_page_selection_reuses_finished_pages(self):
+        """Test that a wider page range only renders the new pages."""
+        self._run_recording_pages(pages_spec="1-2")
+        _, rendered = self._run_recording_pages()
+        assert rendered == [2, 3]
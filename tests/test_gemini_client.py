@@ -0,0 +1,99 @@
+"""Tests for the Gemini client wrapper (no requests are sent)."""
+
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from poc_pdf_to_md import gemini_client
+
+
+class TestGeminiClientPool:
+    """Test the process-wide pooled client."""
+
+    def setup_method(self):
+        """Setup test environment."""
+        gemini_client.reset_client()
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        gemini_client.reset_client()
+
+    def test_client_is_shared_across_threads(self, monkeypatch):
+        """Test that every worker thread gets the same client instance."""
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            clients = list(executor.map(lambda _: gemini_client.get_client(), range(8)))
+        assert all(client is clients[0] for client in clients)
+
+    def test_client_is_rebuilt_when_pool_limits_change(self, monkeypatch):
+        """Test that changing the HTTP pool limits builds a new client."""
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+        monkeypatch.setenv("GEMINI_HTTP_MAX_CONNECTIONS", "4")
+        first = gemini_client.get_client()
+        monkeypatch.setenv("GEMINI_HTTP_MAX_CONNECTIONS", "8")
+        assert gemini_client.get_client() is not first
+
+    def test_pool_limits_default_to_concurrency(self, monkeypatch):
+        """Test that the connection pool is sized from the concurrency upper bound by default."""
+        monkeypatch.delenv("GEMINI_HTTP_MAX_CONNECTIONS", raising=False)
+        monkeypatch.delenv("GEMINI_HTTP_MAX_KEEPALIVE", raising=False)
+        monkeypatch.delenv("GEMINI_CONCURRENCY_MAX", raising=False)
+        monkeypatch.setenv("GEMINI_CONCURRENCY", "3")
+        assert gemini_client._http_pool_limits() == (12, 12)  # pylint: disable=protected-access
+        monkeypatch.setenv("GEMINI_CONCURRENCY_MAX", "6")
+        assert gemini_client._http_pool_limits() == (6, 6)  # pylint: disable=protected-access
+        monkeypatch.delenv("GEMINI_CONCURRENCY_MAX")
+        monkeypatch.setenv("GEMINI_HTTP_MAX_KEEPALIVE", "20")
+        assert gemini_client._http_pool_limits() == (12, 12)  # pylint: disable=protected-access
+
+    def test_missing_api_key_raises(self, monkeypatch):
+        """Test that a missing API key is reported before building a client."""
+        monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+        monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+        monkeypatch.setattr(gemini_client, "_DOTENV_LOADED", True)
+        with pytest.raises(RuntimeError, match="Missing API key"):
+            gemini_client.get_client()
+
+
+class TestGeminiStreaming:
+    """Test streamed responses (a fake client; no requests are sent)."""
+
+    def test_stream_passes_chunks_and_returns_full_text(self, monkeypatch):
+        """Test that each text chunk reaches on_chunk and the joined text is returned."""
+        chunks = [
+            SimpleNamespace(text="# Ti", usage_metadata=SimpleNamespace(candidates_token_count=2)),
+            SimpleNamespace(text=None, usage_metadata=None),
+            SimpleNamespace(text="tle\n", usage_metadata=SimpleNamespace(candidates_token_count=4)),
+        ]
+        calls: list[str] = []
+
+        def _stream(**kwargs):
+            calls.append(kwargs["model"])
+            return iter(chunks)
+
+        fake = SimpleNamespace(models=SimpleNamespace(generate_content_stream=_stream))
+        monkeypatch.setattr(gemini_client, "get_client", lambda: fake)
+        monkeypatch.delenv("GEMINI_RPM", raising=False)
+        monkeypatch.delenv("GEMINI_TPM", raising=False)
+        received: list[tuple] = []
+        text = gemini_client._generate_content(  # pylint: disable=protected-access
+            ["prompt"], "test-model", None, False, on_chunk=lambda t, n: received.append((t, n))
+        )
+        assert text == "# Title\n"
+        assert received == [("# Ti", 2), ("tle\n", 4)]
+        assert calls == ["test-model"]
+
+    def test_empty_stream_raises(self, monkeypatch):
+        """Test that a stream without text fails like an empty response."""
+        def _empty_stream(**_kwargs):
+            return iter([SimpleNamespace(text=None)])
+
+        fake = SimpleNamespace(models=SimpleNamespace(generate_content_stream=_empty_stream))
+        monkeypatch.setattr(gemini_client, "get_client", lambda: fake)
+        monkeypatch.delenv("GEMINI_RPM", raising=False)
+        monkeypatch.delenv("GEMINI_TPM", raising=False)
+        with pytest.raises(RuntimeError, match="empty response"):
+            gemini_client._generate_content(  # pylint: disable=protected-access
+                ["prompt"], "test-model", None, False, on_chunk=lambda t, n: None
+            )
@@ -0,0 +1,198 @@
+"""Tests for Phase 2 request hedging."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from poc_pdf_to_md.concurrency import AdaptiveLimit
+from poc_pdf_to_md.hedging import RequestHedger, hedger_from_env
+
+
+class TestRequestHedger:
+    """Test the hedging threshold, budget and first-response-wins behavior."""
+
+    def test_threshold_needs_min_samples(self):
+        """Test that hedging starts only after enough completed requests."""
+        hedger = RequestHedger(percentile=90, min_samples=3)
+        hedger.observe(1.0)
+        hedger.observe(2.0)
+        assert hedger.threshold() is None
+        for latency in (3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0):
+            hedger.observe(latency)
+        assert hedger.threshold() == 9.0
+
+    def test_fast_requests_are_not_hedged(self):
+        """Test that a request finishing before the threshold runs once."""
+        hedger = RequestHedger(min_samples=1, budget=1.0)
+        hedger.observe(1.0)
+        calls: list[int] = []
+        assert hedger.call(lambda: calls.append(1) or "ok") == "ok"
+        assert calls == [1] and hedger.hedged == 0
+
+    def test_slow_request_is_hedged_and_hedge_wins(self):
+        """Test that a duplicate is sent past the threshold; the first response wins (threads)."""
+        hedger = RequestHedger(min_samples=1, budget=1.0)
+        hedger.observe(0.01)
+        release = threading.Event()
+        calls: list[int] = []
+
+        def _request() -> str:
+            calls.append(1)
+            if len(calls) == 1:
+                release.wait(5)
+                return "slow"
+            return "fast"
+
+        assert hedger.call(_request) == "fast"
+        release.set()
+        assert len(calls) == 2
+        assert hedger.hedged == 1 and hedger.hedge_wins == 1
+
+    def test_thresholds_are_kept_per_kind(self):
+        """Test that batch latencies do not set the single-page threshold."""
+        hedger = RequestHedger(min_samples=2)
+        for latency in (10.0, 12.0):
+            hedger.observe(latency, "batch")
+        assert hedger.threshold("page") is None
+        hedger.observe(1.0)
+        hedger.observe(2.0)
+        assert (hedger.threshold("page"), hedger.threshold("batch")) == (2.0, 12.0)
+
+    def test_hedge_holds_a_slot_until_the_loser_finishes(self):
+        """Test that the duplicate takes a free slot and returns it once both requests are done."""
+        hedger = RequestHedger(min_samples=1, budget=1.0)
+        hedger.observe(0.01)
+        limiter = AdaptiveLimit(2)
+        release = threading.Event()
+        calls: list[int] = []
+
+        def _request() -> str:
+            calls.append(1)
+            if len(calls) == 1:
+                release.wait(5)
+                return "slow"
+            return "fast"
+
+        with limiter.slot():
+            assert hedger.call(_request, limiter) == "fast"
+            # The abandoned primary still runs on the reserved slot
+            assert not limiter.try_reserve()
+        release.set()
+        deadline = time.monotonic() + 5
+        while not limiter.try_reserve() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        limiter.release_reserved()
+        assert hedger.hedged == 1
+
+    def test_no_hedge_without_a_free_slot(self):
+        """Test that a request is not duplicated when the concurrency limit is full."""
+        hedger = RequestHedger(min_samples=1, budget=1.0)
+        hedger.observe(0.001)
+        limiter = AdaptiveLimit(1)
+        calls: list[int] = []
+
+        def _slow() -> str:
+            calls.append(1)
+            time.sleep(0.02)
+            return "ok"
+
+        with limiter.slot():
+            assert hedger.call(_slow, limiter) == "ok"
+        assert calls == [1] and hedger.hedged == 0
+
+    def test_pool_is_bounded(self):
+        """Test that requests run inline, unhedged, when every pool thread is busy."""
+        hedger = RequestHedger(min_samples=1, budget=1.0, max_threads=2)
+        hedger.observe(0.01)
+        release = threading.Event()
+        calls: list[str] = []
+
+        def _request() -> str:
+            calls.append(threading.current_thread().name)
+            if len(calls) <= 2:
+                release.wait(5)
+                return "slow"
+            return "fast"
+
+        waiter = threading.Thread(target=lambda: hedger.call(_request))
+        waiter.start()
+        deadline = time.monotonic() + 5
+        while len(calls) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert hedger.call(_request) == "fast"
+        release.set()
+        waiter.join(5)
+        assert calls[2] == threading.current_thread().name
+        assert all(name.startswith("gemini-hedge") for name in calls[:2])
+
+    def test_budget_caps_hedges(self):
+        """Test that hedges stay within the budget fraction of requests."""
+        hedger = RequestHedger(min_samples=1, budget=0.5)
+        for _ in range(100):
+            hedger.observe(0.001)
+
+        def _slow() -> str:
+            time.sleep(0.02)
+            return "ok"
+
+        for _ in range(4):
+            hedger.call(_slow)
+        assert hedger.requests == 4
+        assert hedger.hedged == 2
+
+    def test_both_failures_raise_the_primary_error(self):
+        """Test that the primary's error is raised when both requests fail."""
+        hedger = RequestHedger(min_samples=1, budget=1.0)
+        hedger.observe(0.001)
+        calls: list[int] = []
+
+        def _fail() -> str:
+            calls.append(1)
+            time.sleep(0.05 if len(calls) == 1 else 0.0)
+            raise RuntimeError(f"failure {len(calls)}")
+
+        with pytest.raises(RuntimeError, match="failure"):
+            hedger.call(_fail)
+        assert len(calls) == 2
+
+    def test_async_hedge_cancels_the_loser(self):
+        """Test that the asyncio variant cancels the slower request."""
+        hedger = RequestHedger(min_samples=1, budget=1.0)
+        hedger.observe(0.01)
+        cancelled: list[int] = []
+        calls: list[int] = []
+
+        async def _request() -> str:
+            calls.append(1)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(1)
+                    raise
+                return "slow"
+            return "fast"
+
+        limiter = AdaptiveLimit(1)
+
+        async def _main() -> str:
+            result = await hedger.call_async(_request, limiter)
+            await asyncio.sleep(0)
+            return result
+
+        assert asyncio.run(_main()) == "fast"
+        assert cancelled == [1]
+        assert limiter.try_reserve()  # The hedge's slot was returned
+        assert "hedged=1/1" in hedger.summary()
+
+    def test_hedger_from_env(self, monkeypatch):
+        """Test environment configuration."""
+        monkeypatch.setenv("GEMINI_HEDGE_PERCENTILE", "99")
+        monkeypatch.setenv("GEMINI_HEDGE_BUDGET", "0.1")
+        monkeypatch.setenv("GEMINI_HEDGE_MIN_SAMPLES", "20")
+        monkeypatch.setenv("GEMINI_HEDGE_MAX_THREADS", "8")
+        hedger = hedger_from_env()
+        settings = (hedger.percentile, hedger.budget, hedger.min_samples, hedger.max_threads)
+        assert settings == (99.0, 0.1, 20, 8)
@@ -3,11 +3,14 @@
 import tempfile
 import uuid
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 
 from poc_pdf_to_md.image_handler import (
+    generate_content_image_filename,
     generate_image_filename,
+    gc_image_store,
     save_image,
     update_parse_result_image_path,
 )
@@ -46,6 +49,26 @@ class TestGenerateImageFilename:
         assert jpg_filename.endswith(".jpg")
 
 
+class TestGenerateContentImageFilename:
+    """Test content-hash image filename generation."""
+
+    def test_same_content_same_name(self):
+        """Test that identical bytes map to the same filename."""
+        name = generate_content_image_filename(b"abc", "png")
+        assert generate_content_image_filename(b"abc", "png") == name
+
+    def test_different_content_different_name(self):
+        """Test that different bytes map to different filenames."""
+        name = generate_content_image_filename(b"abc", "png")
+        assert generate_content_image_filename(b"abd", "png") != name
+
+    def test_name_is_sha256_with_ext(self):
+        """Test filename format."""
+        filename = generate_content_image_filename(b"abc", "jpg")
+        assert filename.endswith(".jpg")
+        assert len(filename) == 64 + len(".jpg")
+
+
 class TestSaveImage:
     """Test image saving functionality."""
 
@@ -83,6 +106,15 @@ class TestSaveImage:
         assert str(image_path).startswith("images/")
 
 
+    def test_save_image_content_addressed_reuses_file(self):
+        """Test that content-addressed saves reuse the existing file."""
+        filename = generate_content_image_filename(self.test_image_bytes, "png")
+        first = save_image(self.test_image_bytes, self.temp_dir, filename, content_addressed=True)
+        second = save_image(self.test_image_bytes, self.temp_dir, filename, content_addressed=True)
+        assert first == second
+        assert list((self.temp_dir / "images").iterdir()) == [self.temp_dir / first]
+
+
 class TestUpdateParseResultImagePath:
     """Test parse result image path update."""
 
@@ -119,3 +151,69 @@ class TestUpdateParseResultImagePath:
         image_path = Path("images/test.png")
         # Should not raise error, just do nothing
         update_parse_result_image_path(self.parse_result, 999, image_path)
+
+
+class TestImageStore:
+    """Test cross-run content-addressed image store."""
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.store_dir = self.temp_dir / "store"
+        self.image_bytes = b"shared logo bytes"
+        self.filename = generate_content_image_filename(self.image_bytes, "png")
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        import shutil
+        if self.temp_dir.exists():
+            shutil.rmtree(self.temp_dir)
+
+    def _save(self, run: str) -> Path:
+        run_dir = self.temp_dir / run
+        rel = save_image(
+            self.image_bytes,
+            run_dir,
+            self.filename,
+            content_addressed=True,
+            store_dir=self.store_dir,
+        )
+        return run_dir / rel
+
+    def test_runs_share_one_blob_via_hardlinks(self):
+        """Test that each run's file is a hard link to a single store blob."""
+        first = self._save("run1")
+        second = self._save("run2")
+        blobs = [p for p in self.store_dir.rglob("*") if p.is_file()]
+        assert len(blobs) == 1
+        assert first.read_bytes() == self.image_bytes
+        assert first.stat().st_ino == second.stat().st_ino == blobs[0].stat().st_ino
+        assert blobs[0].stat().st_nlink == 3
+
+    def test_link_falls_back_to_copy(self):
+        """Test that a copy is made when hard links fail."""
+        with patch("poc_pdf_to_md.image_handler.os.link", side_effect=OSError("EXDEV")):
+            path = self._save("run1")
+        assert path.read_bytes() == self.image_bytes
+        assert path.stat().st_nlink == 1
+
+    def test_gc_removes_only_unreferenced_blobs(self):
+        """Test reference-count (hard-link count) based garbage collection."""
+        import shutil
+        self._save("run1")
+        self._save("run2")
+        shutil.rmtree(self.temp_dir / "run1")
+        assert gc_image_store(self.store_dir, min_age_sec=0)["removed"] == 0
+
+        shutil.rmtree(self.temp_dir / "run2")
+        stats = gc_image_store(self.store_dir, min_age_sec=0)
+        assert stats["removed"] == 1
+        assert stats["bytes_freed"] == len(self.image_bytes)
+        assert not [p for p in self.store_dir.rglob("*") if p.is_file()]
+
+    def test_gc_keeps_recent_blobs(self):
+        """Test that fresh blobs survive GC within the grace period."""
+        import shutil
+        self._save("run1")
+        shutil.rmtree(self.temp_dir / "run1")
+        assert gc_image_store(self.store_dir)["kept"] == 1
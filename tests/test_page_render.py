@@ -0,0 +1,297 @@
+"""Tests for Phase 1 per-page processing (pipelined and multi-process)."""
+
+import importlib.util
+import tempfile
+from pathlib import Path
+
+import fitz
+import pytest
+
+from poc_pdf_to_md.page_render import (
+    DEFAULT_BLANK_THRESHOLD,
+    PipelineStats,
+    RenderOptions,
+    process_pages_parallel,
+    process_pages_pipelined,
+    resolve_render_workers,
+    split_page_ranges,
+)
+from poc_pdf_to_md.pdf_parser import ImageFilter
+
+
+def _write_test_pdf(path: Path, pages: int) -> None:
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {i}", fontsize=20)
+    doc.save(str(path))
+    doc.close()
+
+
+class TestSplitPageRanges:
+    """Test contiguous page range splitting."""
+
+    def test_split_covers_all_pages_in_order(self):
+        """Test that ranges are contiguous and cover every page once."""
+        ranges = split_page_ranges(10, 3)
+        assert ranges == [(0, 4), (4, 7), (7, 10)]
+
+    def test_split_more_chunks_than_pages(self):
+        """Test that chunk count is capped at the page count."""
+        assert split_page_ranges(2, 8) == [(0, 1), (1, 2)]
+
+    def test_split_empty_document(self):
+        """Test that an empty document yields no ranges."""
+        assert not split_page_ranges(0, 4)
+
+    def test_resolve_render_workers_clamps_to_pages(self):
+        """Test worker count clamping."""
+        assert resolve_render_workers(8, 3) == 3
+        assert resolve_render_workers(1, 100) == 1
+        assert resolve_render_workers(0, 100) >= 1
+
+
+class TestRenderPagesPipelined:
+    """Test the render -> encode -> write pipeline."""
+
+    temp_dir: Path
+    pdf_path: Path
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.pdf_path = self.temp_dir / "doc.pdf"
+        _write_test_pdf(self.pdf_path, 4)
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        import shutil
+        if self.temp_dir.exists():
+            shutil.rmtree(self.temp_dir)
+
+    def test_pipeline_writes_pages_and_records_stats(self):
+        """Test that every page is written in order and stats are collected."""
+        out_dir = self.temp_dir / "out"
+        stats = PipelineStats(queue_size=2)
+        doc = fitz.open(str(self.pdf_path))
+        try:
+            results = process_pages_pipelined(
+                doc,
+                range(4),
+                out_dir,
+                stats=stats,
+                queue_size=2,
+                options=RenderOptions(text_layer=True),
+            )
+        finally:
+            doc.close()
+
+        blocks = [r["page_image"] for r in results]
+        assert [b["imagePath"] for b in blocks] == [f"images/page_{i:04d}.png" for i in range(4)]
+        for block in blocks:
+            assert (out_dir / block["imagePath"]).exists()
+        assert stats.items == {"render": 4, "encode": 4, "write": 4}
+        assert blocks[0]["text_layer"]["chars"] == len("Page 0")
+        assert blocks[0]["textPath"] is None  # "Page 0" reads as a page number: no local Markdown
+        assert blocks[0]["ink_coverage"] is None  # Blank detection is off
+        assert stats.bytes_written > 0
+        assert all(depth <= 2 for depth in stats.max_queue_depth.values())
+        assert "render=" in stats.summary()
+
+    def test_pipeline_extracts_embedded_images_in_same_pass(self):
+        """Test that embedded images are scanned, extracted and saved per page."""
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 20, 10), 0)
+        pix.clear_with(128)
+        doc = fitz.open(str(self.pdf_path))
+        doc[1].insert_image(fitz.Rect(100, 300, 200, 350), stream=pix.tobytes("png"))
+        out_dir = self.temp_dir / "out"
+        try:
+            results = process_pages_pipelined(doc, range(3), out_dir)
+        finally:
+            doc.close()
+
+        assert [len(r["images"]) for r in results] == [0, 1, 0]
+        block = results[1]["images"][0]
+        assert block["page_index"] == 1
+        assert block["type"] == "image"
+        assert block["bbox"] == [100.0, 300.0, 200.0, 350.0]
+        assert (block["width"], block["height"]) == (20, 10)
+        assert (out_dir / block["imagePath"]).exists()
+
+    def test_pipeline_deduplicates_embedded_images(self):
+        """Test that repeated xrefs and byte-identical images are stored once."""
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 20, 10), 0)
+        pix.clear_with(128)
+        logo = pix.tobytes("png")
+        doc = fitz.open()
+        for _ in range(3):
+            # Same xref on every page (PyMuPDF reuses the inserted image)
+            doc.new_page().insert_image(fitz.Rect(10, 10, 100, 60), stream=logo)
+        other = fitz.open()
+        other.new_page().insert_image(fitz.Rect(10, 10, 100, 60), stream=logo)
+        doc.insert_pdf(other)  # Same bytes under a different xref
+        other.close()
+        out_dir = self.temp_dir / "out"
+        try:
+            results = process_pages_pipelined(doc, range(4), out_dir)
+        finally:
+            doc.close()
+
+        blocks = [r["images"][0] for r in results]
+        assert len({b["xref"] for b in blocks}) == 2
+        assert len({b["imagePath"] for b in blocks}) == 1
+        embedded_files = [
+            p for p in (out_dir / "images").iterdir() if not p.name.startswith("page_")
+        ]
+        assert len(embedded_files) == 1
+
+    def test_pipeline_skips_filtered_images_without_extracting(self):
+        """Test that filtered placements are recorded but never extracted or saved."""
+        from unittest.mock import patch
+        from poc_pdf_to_md import page_render
+
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 20, 10), 0)
+        pix.clear_with(128)
+        doc = fitz.open(str(self.pdf_path))
+        doc[0].insert_image(fitz.Rect(100, 300, 200, 350), stream=pix.tobytes("png"))
+        doc[0].insert_image(fitz.Rect(72, 400, 74, 402), stream=pix.tobytes("jpeg"))  # bullet-sized
+        out_dir = self.temp_dir / "out"
+        real_extract = page_render.extract_image
+        try:
+            with patch(
+                "poc_pdf_to_md.page_render.extract_image", side_effect=real_extract
+            ) as extract:
+                results = process_pages_pipelined(
+                    doc, range(1), out_dir, options=RenderOptions(image_filter=ImageFilter())
+                )
+        finally:
+            doc.close()
+
+        assert extract.call_count == 1
+        assert len(results[0]["images"]) == 1
+        assert [b["skip_reason"] for b in results[0]["skipped"]] == ["small_area"]
+        assert "imagePath" not in results[0]["skipped"][0]
+        embedded_files = [
+            p for p in (out_dir / "images").iterdir() if not p.name.startswith("page_")
+        ]
+        assert len(embedded_files) == 1
+
+    def test_pipeline_marks_blank_pages(self):
+        """Test that blank pages are marked in the page_image block."""
+        doc = fitz.open(str(self.pdf_path))
+        doc.new_page()
+        out_dir = self.temp_dir / "out"
+        try:
+            results = process_pages_pipelined(
+                doc, [0, 4], out_dir, options=RenderOptions(blank_threshold=DEFAULT_BLANK_THRESHOLD)
+            )
+            disabled = process_pages_pipelined(doc, [4], out_dir)
+        finally:
+            doc.close()
+
+        blocks = [r["page_image"] for r in results]
+        assert [b["blank"] for b in blocks] == [False, True]
+        assert blocks[0]["ink_coverage"] > 0
+        assert blocks[1]["ink_coverage"] == 0.0
+        assert disabled[0]["page_image"]["blank"] is False
+
+    def test_pipeline_pixel_budget_records_zoom(self):
+        """Test that a pixel budget picks the zoom and records it per page."""
+        out_dir = self.temp_dir / "out"
+        options = RenderOptions(target_pixels=500_000)
+        doc = fitz.open(str(self.pdf_path))
+        try:
+            results = process_pages_pipelined(doc, range(2), out_dir, options=options)
+        finally:
+            doc.close()
+
+        blocks = [r["page_image"] for r in results]
+        for block in blocks:
+            assert block["zoom"] != 2.0
+            assert abs(block["width"] * block["height"] - 500_000) / 500_000 < 0.02
+
+    def test_pipeline_auto_color_mode_records_colorspace(self):
+        """Test that auto color mode stores the per-page colorspace decision."""
+        pytest.importorskip("PIL")
+        out_dir = self.temp_dir / "out"
+        doc = fitz.open(str(self.pdf_path))
+        doc[1].draw_rect(fitz.Rect(50, 50, 300, 300), color=None, fill=(0, 0, 1))
+        try:
+            results = process_pages_pipelined(
+                doc, range(2), out_dir, options=RenderOptions(color_mode="auto")
+            )
+        finally:
+            doc.close()
+
+        blocks = [r["page_image"] for r in results]
+        assert blocks[0]["colorspace"] in ("gray", "bitonal")
+        assert blocks[1]["colorspace"] == "rgb"
+
+    def test_render_options_reject_webp_without_pillow(self, monkeypatch):
+        """Test that WebP and 1-bit output fail upfront when Pillow is missing."""
+        monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+        with pytest.raises(RuntimeError, match="WebP page images require Pillow"):
+            RenderOptions(image_format="webp")
+        with pytest.raises(
+            RuntimeError, match=r"1-bit page images \(color mode auto\) require Pillow"
+        ):
+            RenderOptions(color_mode="auto")
+        RenderOptions(image_format="jpeg", color_mode="auto")
+
+    def test_pipeline_propagates_write_errors(self):
+        """Test that a failure in the writer thread is raised to the caller."""
+        blocker = self.temp_dir / "out"
+        blocker.mkdir()
+        (blocker / "images").write_text("not a directory")
+        doc = fitz.open(str(self.pdf_path))
+        try:
+            with pytest.raises(OSError):
+                process_pages_pipelined(doc, range(4), blocker)
+        finally:
+            doc.close()
+
+
+class TestRenderPagesParallel:
+    """Test multi-process page processing."""
+
+    temp_dir: Path
+    pdf_path: Path
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.pdf_path = self.temp_dir / "doc.pdf"
+        _write_test_pdf(self.pdf_path, 5)
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        import shutil
+        if self.temp_dir.exists():
+            shutil.rmtree(self.temp_dir)
+
+    def test_parallel_matches_serial(self):
+        """Test that parallel processing returns the same blocks and bytes as serial."""
+        serial_dir = self.temp_dir / "serial"
+        doc = fitz.open(str(self.pdf_path))
+        serial = process_pages_pipelined(doc, range(len(doc)), serial_dir)
+        doc.close()
+
+        parallel_dir = self.temp_dir / "parallel"
+        seen: list[int] = []
+        stats = PipelineStats()
+        parallel = process_pages_parallel(
+            str(self.pdf_path),
+            parallel_dir,
+            range(5),
+            2,
+            progress_cb=lambda cur, total: seen.append(cur),
+            stats=stats,
+        )
+
+        assert parallel == serial
+        assert [r["page_image"]["page_index"] for r in parallel] == list(range(5))
+        assert seen[-1] == 5
+        assert stats.items["write"] == 5
+        for result in serial:
+            rel = result["page_image"]["imagePath"]
+            assert (serial_dir / rel).read_bytes() == (parallel_dir / rel).read_bytes()
@@ -1,11 +1,27 @@
 """Tests for PDF parser."""
 
+import importlib.util
 from pathlib import Path
 
 import fitz
 import pytest
 
-from poc_pdf_to_md.pdf_parser import extract_image, open_pdf, parse_pdf
+from poc_pdf_to_md.pdf_parser import (
+    ImageFilter,
+    classify_page_color,
+    compute_page_zoom,
+    compute_pdf_sha256,
+    count_image_pages,
+    encode_pixmap,
+    extract_image,
+    is_blank_page,
+    map_pdf_file,
+    measure_ink_coverage,
+    open_pdf,
+    parse_pdf,
+    render_page_pixmap,
+    scan_page_images,
+)
 
 
 class TestOpenPDF:
@@ -33,6 +49,30 @@ class TestOpenPDF:
         with pytest.raises(RuntimeError, match="Failed to open PDF file"):
             open_pdf("nonexistent.pdf")
 
+    def test_open_pdf_from_bytes_and_mmap(self):
+        """Test opening the same PDF from bytes, a memory map and a path."""
+        data = self.test_pdf.read_bytes()
+        expected = open_pdf(str(self.test_pdf))
+        sources = ((data, False), (map_pdf_file(self.test_pdf), False), (str(self.test_pdf), True))
+        for source, use_mmap in sources:
+            doc = open_pdf(source, use_mmap=use_mmap)
+            assert doc.page_count == expected.page_count
+            assert doc[0].get_text() == expected[0].get_text()
+            doc.close()
+        expected.close()
+
+    def test_open_pdf_invalid_stream(self):
+        """Test error when the stream is not a PDF."""
+        with pytest.raises(RuntimeError, match="<stream, 7 bytes>"):
+            open_pdf(b"not pdf")
+
+    def test_compute_pdf_sha256_matches_for_path_and_bytes(self):
+        """Test that the content hash does not depend on the input kind."""
+        data = self.test_pdf.read_bytes()
+        digest = compute_pdf_sha256(str(self.test_pdf))
+        assert digest == compute_pdf_sha256(data)
+        assert digest == compute_pdf_sha256(map_pdf_file(self.test_pdf))
+
 
 class TestParsePDF:
     """Test PDF parsing functionality."""
@@ -143,3 +183,226 @@ class TestExtractImage:
         """Test error when xref is invalid."""
         with pytest.raises(RuntimeError, match="Failed to extract image"):
             extract_image(self.doc, 999999)  # Invalid xref
+
+
+class TestComputePageZoom:
+    """Test pixel-budget zoom selection."""
+
+    def test_zoom_hits_pixel_budget(self):
+        """Test that rendered pixels land close to the budget."""
+        rect = fitz.Rect(0, 0, 612, 792)  # Letter
+        zoom = compute_page_zoom(rect, 2_000_000)
+        pixels = rect.width * zoom * rect.height * zoom
+        assert abs(pixels - 2_000_000) / 2_000_000 < 0.01
+
+    def test_large_and_small_pages_get_different_zoom(self):
+        """Test that an A0 drawing is scaled down and a receipt is scaled up."""
+        a0 = compute_page_zoom(fitz.Rect(0, 0, 2384, 3370), 2_000_000)
+        receipt = compute_page_zoom(fitz.Rect(0, 0, 164, 400), 2_000_000)
+        assert a0 < 1.0
+        assert receipt > 2.0
+
+    def test_zoom_snaps_to_tile_size(self):
+        """Test that the longer side becomes a multiple of the tile size."""
+        rect = fitz.Rect(0, 0, 612, 792)
+        zoom = compute_page_zoom(rect, 2_000_000, tile_size=768)
+        assert round(792 * zoom) % 768 == 0
+
+    def test_zoom_is_clamped(self):
+        """Test zoom bounds for degenerate pages."""
+        assert compute_page_zoom(fitz.Rect(0, 0, 1, 1), 2_000_000) == 8.0
+
+
+class TestEncodePixmap:
+    """Test page image encoding formats."""
+
+    pix: fitz.Pixmap
+
+    def setup_method(self):
+        """Setup test environment."""
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text((72, 72), "hello", fontsize=20)
+        self.pix = page.get_pixmap()
+        doc.close()
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        return
+
+    def test_encode_png_default(self):
+        """Test that PNG stays the default encoding."""
+        image_bytes, meta = encode_pixmap(self.pix)
+        assert image_bytes.startswith(b"\x89PNG")
+        assert meta["ext"] == "png"
+
+    def test_encode_jpeg_quality(self):
+        """Test JPEG output and that quality changes the size."""
+        low, meta = encode_pixmap(self.pix, image_format="jpeg", quality=10)
+        high, _ = encode_pixmap(self.pix, image_format="jpeg", quality=95)
+        assert low.startswith(b"\xff\xd8")
+        assert meta["ext"] == "jpg"
+        assert len(low) < len(high)
+
+    def test_encode_webp(self):
+        """Test WebP output (requires Pillow)."""
+        pytest.importorskip("PIL")
+        image_bytes, meta = encode_pixmap(self.pix, image_format="webp")
+        assert image_bytes[8:12] == b"WEBP"
+        assert meta["ext"] == "webp"
+
+    def test_encode_bitonal_png(self):
+        """Test 1-bit PNG output for bitonal pages (requires Pillow)."""
+        pytest.importorskip("PIL")
+        gray = fitz.Pixmap(fitz.csGRAY, self.pix)
+        image_bytes, meta = encode_pixmap(gray, colorspace="bitonal")
+        assert meta["colorspace"] == "bitonal"
+        assert image_bytes[24] == 1  # IHDR bit depth
+
+    def test_encode_without_pillow_raises(self, monkeypatch):
+        """Test that WebP and 1-bit PNG output fail instead of degrading without Pillow."""
+        monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+        with pytest.raises(RuntimeError, match=r"WebP page images require Pillow.*\[images\]"):
+            encode_pixmap(self.pix, image_format="webp")
+        gray = fitz.Pixmap(fitz.csGRAY, self.pix)
+        with pytest.raises(RuntimeError, match="1-bit page images require Pillow"):
+            encode_pixmap(gray, colorspace="bitonal")
+
+    def test_encode_bitonal_jpeg_falls_back_to_gray(self):
+        """Test that non-PNG bitonal output is recorded as gray."""
+        gray = fitz.Pixmap(fitz.csGRAY, self.pix)
+        _, meta = encode_pixmap(gray, image_format="jpeg", colorspace="bitonal")
+        assert meta["colorspace"] == "gray"
+
+    def test_encode_unknown_format(self):
+        """Test error for unsupported formats."""
+        with pytest.raises(ValueError, match="Unsupported page image format"):
+            encode_pixmap(self.pix, image_format="gif")
+
+
+class TestClassifyPageColor:
+    """Test monochrome page detection."""
+
+    doc: fitz.Document
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.doc = fitz.open()
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        self.doc.close()
+
+    def test_text_page_is_bitonal(self):
+        """Test that a black-on-white text page is classified as bitonal."""
+        page = self.doc.new_page()
+        page.insert_text((72, 72), "Plain black text", fontsize=12)
+        assert classify_page_color(page) == "bitonal"
+
+    def test_gray_fill_page_is_gray(self):
+        """Test that large gray shading keeps gray tones."""
+        page = self.doc.new_page()
+        page.draw_rect(fitz.Rect(50, 50, 500, 500), color=None, fill=(0.5, 0.5, 0.5))
+        assert classify_page_color(page) == "gray"
+
+    def test_colored_page_is_rgb(self):
+        """Test that colored content is classified as rgb."""
+        page = self.doc.new_page()
+        page.draw_rect(fitz.Rect(50, 50, 300, 300), color=None, fill=(1, 0, 0))
+        assert classify_page_color(page) == "rgb"
+
+    def test_gray_render_is_single_channel(self):
+        """Test that gray rendering produces a 1-channel pixmap."""
+        page = self.doc.new_page()
+        assert render_page_pixmap(page, 1.0, "gray").n == 1
+        assert render_page_pixmap(page, 1.0, "rgb").n == 3
+
+
+class TestImageFilter:
+    """Test tiny/decorative embedded image filtering."""
+
+    def test_skip_reasons(self):
+        """Test each rule on synthetic get_images() entries and placements."""
+        image_filter = ImageFilter(
+            min_area=36.0, min_pixel_side=4, max_aspect=30.0, max_repeat_pages=2
+        )
+        img = (7, 0, 64, 48)
+        assert image_filter.skip_reason((7, 0, 1, 1), fitz.Rect(0, 0, 100, 100)) == "tiny_pixels"
+        assert image_filter.skip_reason(img, fitz.Rect(0, 0, 5, 5)) == "small_area"
+        assert image_filter.skip_reason(img, fitz.Rect(0, 0, 500, 1)) == "extreme_aspect"
+        assert image_filter.skip_reason(img, fitz.Rect(0, 0, 100, 80), {7: 3}) == "repeated"
+        assert image_filter.skip_reason(img, fitz.Rect(0, 0, 100, 80), {7: 2}) is None
+
+    def test_zero_disables_rules(self):
+        """Test that 0 turns every rule off."""
+        image_filter = ImageFilter(min_area=0, min_pixel_side=0, max_aspect=0, max_repeat_pages=0)
+        assert image_filter.skip_reason((7, 0, 1, 1), fitz.Rect(0, 0, 500, 1), {7: 99}) is None
+
+    def test_scan_records_skipped_placements(self):
+        """Test that rejected placements become skipped_image blocks with a reason."""
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 20, 10), 0)
+        pix.clear_with(128)
+        doc = fitz.open()
+        for _ in range(3):
+            page = doc.new_page()
+            page.insert_image(fitz.Rect(100, 100, 200, 150), stream=pix.tobytes("png"))
+            page.insert_image(
+                fitz.Rect(72, 300, 500, 301), stream=pix.tobytes("jpeg"), keep_proportion=False
+            )
+        image_pages = count_image_pages(doc)
+        assert sorted(image_pages.values()) == [3, 3]
+
+        blocks = scan_page_images(doc[0], 0, ImageFilter(), image_pages)
+        assert [b["type"] for b in blocks] == ["image", "skipped_image"]
+        assert blocks[1]["skip_reason"] == "extreme_aspect"
+        assert (blocks[1]["width"], blocks[1]["height"]) == (20, 10)
+
+        blocks = scan_page_images(doc[0], 0, ImageFilter(max_repeat_pages=2), image_pages)
+        assert [b.get("skip_reason") for b in blocks] == ["repeated", "extreme_aspect"]
+        assert all(b["type"] == "image" for b in scan_page_images(doc[0], 0))
+        doc.close()
+
+
+class TestBlankPageDetection:
+    """Test ink coverage measurement and blank page detection."""
+
+    doc: fitz.Document
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.doc = fitz.open()
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        self.doc.close()
+
+    def _coverage(self, page: fitz.Page) -> float:
+        return measure_ink_coverage(render_page_pixmap(page, 1.0))
+
+    def test_empty_page_is_blank(self):
+        """Test that an empty page has zero coverage and is blank."""
+        page = self.doc.new_page()
+        assert self._coverage(page) == 0.0
+        assert is_blank_page(page, 0.0, 0.0005)
+
+    def test_left_blank_notice_is_blank(self):
+        """Test that an "intentionally left blank" page with a page number is blank."""
+        page = self.doc.new_page()
+        page.insert_text((200, 400), "This page intentionally left blank.", fontsize=12)
+        page.insert_text((290, 800), "- 12 -", fontsize=10)
+        coverage = self._coverage(page)
+        assert 0.0005 < coverage < 0.01
+        assert is_blank_page(page, coverage, 0.0005)
+
+    def test_text_page_is_not_blank(self):
+        """Test that a page with real content is not blank."""
+        page = self.doc.new_page()
+        page.insert_text((72, 72), "Quarterly results", fontsize=12)
+        page.draw_rect(fitz.Rect(72, 100, 400, 300), color=None, fill=(0, 0, 0))
+        coverage = self._coverage(page)
+        assert coverage > 0.01
+        assert not is_blank_page(page, coverage, 0.0005)
+
+        short = self.doc.new_page()
+        short.insert_text((72, 72), "Notes", fontsize=12)
+        assert not is_blank_page(short, self._coverage(short), 0.0005)
@@ -1,13 +1,19 @@
 """Tests for Phase 2 conversion (parse_result -> Markdown)."""
 
+import asyncio
 import json
+import shutil
 import tempfile
 from pathlib import Path
 from unittest.mock import patch
 
 import pytest
 
-from poc_pdf_to_md.engine import convert_to_markdown
+from poc_pdf_to_md.engine import PartialConversionError, convert_to_markdown, split_batch_markdown
+from poc_pdf_to_md.hedging import RequestHedger
+from poc_pdf_to_md.parse_result import sort_and_index_blocks
+from poc_pdf_to_md.prompt_cache import LocalPromptCacheBackend, PromptCache
+from poc_pdf_to_md.response_cache import ResponseCache
 
 
 def _write_dummy_png(path: Path) -> None:
@@ -101,7 +107,9 @@ class TestPhase2ConvertToMarkdown:
     def test_phase2_generates_output_markdown_and_calls_ai_per_page(self):
         prompts: list[str] = []
 
-        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, generation_config=None):
+        def _mock_generate_page_markdown(
+            *, prompt_text, page_image_path, model, generation_config=None, **_kwargs
+        ):
             _ = generation_config
             assert page_image_path.exists()
             assert model == "test-model"
@@ -147,6 +155,686 @@ class TestPhase2ConvertToMarkdown:
         assert any(m["imagePath"] == "images/img_page0.png" for m in data0["embedded_images_meta"])
         assert all(m["imagePath"] != "images/img_page1.jpg" for m in data0["embedded_images_meta"])
 
+    def test_phase2_sends_mime_type_from_page_image_ext(self):
+        parse_result = json.loads(self.parse_file.read_text(encoding="utf-8"))
+        _write_dummy_png(self.temp_dir / "images" / "page_0001.jpg")
+        parse_result["blocks"][1]["imagePath"] = "images/page_0001.jpg"
+        parse_result["blocks"][1]["ext"] = "jpg"
+        self.parse_file.write_text(json.dumps(parse_result), encoding="utf-8")
+        mime_types: dict[str, str] = {}
+
+        def _mock_generate_page_markdown(
+            *, prompt_text, page_image_path, model, image_mime_type, **_kwargs
+        ):
+            _ = (prompt_text, model)
+            mime_types[page_image_path.name] = image_mime_type
+            return "ok"
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+            )
+
+        assert mime_types == {"page_0000.png": "image/png", "page_0001.jpg": "image/jpeg"}
+
+    def test_phase2_prompt_excludes_skipped_images(self):
+        parse_result = json.loads(self.parse_file.read_text(encoding="utf-8"))
+        parse_result["blocks"].append(
+            {
+                "blockIndex": 4,
+                "page_index": 0,
+                "type": "skipped_image",
+                "skip_reason": "small_area",
+                "bbox": [1, 2, 3, 4],
+                "xref": 999,
+                "width": 1,
+                "height": 1,
+            }
+        )
+        self.parse_file.write_text(json.dumps(parse_result), encoding="utf-8")
+        prompts: list[str] = []
+
+        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, **_kwargs):
+            _ = (page_image_path, model)
+            prompts.append(prompt_text)
+            return "ok"
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            convert_to_markdown(
+                str(self.parse_file), self.temp_dir, "test-model", str(self.prompt_file)
+            )
+
+        assert prompts and all("999" not in p and "skipped_image" not in p for p in prompts)
+
+    def test_phase2_blank_pages_skip_the_model(self):
+        parse_result = json.loads(self.parse_file.read_text(encoding="utf-8"))
+        parse_result["blocks"][1]["blank"] = True
+        self.parse_file.write_text(json.dumps(parse_result), encoding="utf-8")
+        calls: list[str] = []
+
+        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, **_kwargs):
+            _ = (prompt_text, model)
+            calls.append(page_image_path.name)
+            return "page 0"
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            out_path = convert_to_markdown(
+                str(self.parse_file), self.temp_dir, "test-model", str(self.prompt_file)
+            )
+
+        assert calls == ["page_0000.png"]
+        blank_page = self.temp_dir / "phase2" / "pages" / "page_0001.md"
+        assert blank_page.read_text(encoding="utf-8") == ""
+        state = json.loads((self.temp_dir / "phase2" / "state.json").read_text(encoding="utf-8"))
+        assert state["completed_pages"]["1"]["blank"] is True
+        assert out_path.read_text(encoding="utf-8") == "page 0\n"
+
+    def _mark_page1_clean_text_layer(self) -> None:
+        parse_result = json.loads(self.parse_file.read_text(encoding="utf-8"))
+        parse_result["blocks"][1]["text_layer"] = {
+            "chars": 1500,
+            "lines": 30,
+            "body_size": 11.0,
+            "headings": 1,
+            "tabular_lines": 0,
+            "rotated_lines": 0,
+            "garbled_chars": 0,
+            "rules": 0,
+            "figures": 0,
+        }
+        parse_result["blocks"][1]["textPath"] = "text/page_0001.md"
+        (self.temp_dir / "text").mkdir()
+        (self.temp_dir / "text" / "page_0001.md").write_text("# Local\n\nbody\n", encoding="utf-8")
+        self.parse_file.write_text(json.dumps(parse_result), encoding="utf-8")
+
+    def test_phase2_text_fast_path_converts_clean_pages_locally(self):
+        self._mark_page1_clean_text_layer()
+        calls: list[str] = []
+
+        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, **_kwargs):
+            _ = (prompt_text, model)
+            calls.append(page_image_path.name)
+            return "page 0"
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            out_path = convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                text_fast_path=True,
+            )
+
+        assert calls == ["page_0000.png"]
+        assert out_path.read_text(encoding="utf-8") == (
+            "page 0\n\n---\n\n# Local\n\nbody\n\nfrom images/page_0001.png\n"
+        )
+        state = json.loads((self.temp_dir / "phase2" / "state.json").read_text(encoding="utf-8"))
+        pages = state["completed_pages"]
+        assert (pages["0"]["route"], pages["0"]["route_reason"]) == ("model", "no_text_layer")
+        assert (pages["1"]["route"], pages["1"]["route_reason"]) == ("local", "clean_text_layer")
+
+    def test_phase2_text_fast_path_is_opt_in(self):
+        self._mark_page1_clean_text_layer()
+        calls: list[str] = []
+
+        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, **_kwargs):
+            _ = (prompt_text, model)
+            calls.append(page_image_path.name)
+            return "ok"
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            convert_to_markdown(
+                str(self.parse_file), self.temp_dir, "test-model", str(self.prompt_file)
+            )
+
+        assert sorted(calls) == ["page_0000.png", "page_0001.png"]
+
+    def test_phase2_pages_spec_converts_only_selected_pages(self):
+        calls: list[str] = []
+
+        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, **_kwargs):
+            _ = (prompt_text, model)
+            calls.append(page_image_path.name)
+            return f"page for {page_image_path.name}"
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            out_path = convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                pages_spec="2",
+            )
+
+        assert calls == ["page_0001.png"]
+        assert not (self.temp_dir / "phase2" / "pages" / "page_0000.md").exists()
+        assert out_path.read_text(encoding="utf-8") == "page for page_0001.png\n"
+
+    def test_phase2_batch_pages_splits_one_response_per_page(self):
+        requests: list[list[int]] = []
+
+        def _mock_generate_pages_markdown(*, prompt_text, page_images, model, **_kwargs):
+            _ = model
+            assert "<!-- page_index: 0 -->" in prompt_text
+            requests.append([page_index for page_index, _path, _mime in page_images])
+            return "<!-- page_index: 0 -->\n## first\n\n<!-- page_index: 1 -->\n## second\n"
+
+        with patch(
+            "poc_pdf_to_md.engine.generate_pages_markdown",
+            side_effect=_mock_generate_pages_markdown,
+        ), patch("poc_pdf_to_md.engine.generate_page_markdown") as mock_single:
+            out_path = convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                batch_pages=4,
+            )
+
+        assert requests == [[0, 1]]
+        assert mock_single.call_count == 0
+        pages_dir = self.temp_dir / "phase2" / "pages"
+        assert (pages_dir / "page_0000.md").read_text(encoding="utf-8") == "## first\n"
+        assert (pages_dir / "page_0001.md").read_text(encoding="utf-8") == "## second\n"
+        assert out_path.read_text(encoding="utf-8") == "## first\n\n---\n\n## second\n"
+        state = json.loads((self.temp_dir / "phase2" / "state.json").read_text(encoding="utf-8"))
+        assert state["completed_pages"]["1"]["batch"] == [0, 1]
+
+    def test_phase2_batch_pages_falls_back_to_single_pages(self):
+        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, **_kwargs):
+            _ = (prompt_text, model)
+            return f"single {page_image_path.name}"
+
+        with patch(
+            "poc_pdf_to_md.engine.generate_pages_markdown", return_value="## no delimiters"
+        ), patch(
+            "poc_pdf_to_md.engine.generate_page_markdown",
+            side_effect=_mock_generate_page_markdown,
+        ) as mock_single:
+            out_path = convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                batch_pages=2,
+            )
+
+        assert mock_single.call_count == 2
+        assert out_path.read_text(encoding="utf-8") == (
+            "single page_0000.png\n\n---\n\nsingle page_0001.png\n"
+        )
+
+    def test_phase2_batch_error_fails_pages_without_fallback(self, monkeypatch):
+        monkeypatch.setenv("GEMINI_MAX_ATTEMPTS", "1")
+
+        for engine in ("threads", "asyncio"):
+            with patch(
+                "poc_pdf_to_md.engine.generate_pages_markdown",
+                side_effect=RuntimeError("429 RESOURCE_EXHAUSTED"),
+            ), patch(
+                "poc_pdf_to_md.engine.generate_pages_markdown_async",
+                side_effect=RuntimeError("429 RESOURCE_EXHAUSTED"),
+            ), patch("poc_pdf_to_md.engine.generate_page_markdown") as mock_single, patch(
+                "poc_pdf_to_md.engine.generate_page_markdown_async"
+            ) as mock_single_async:
+                with pytest.raises(PartialConversionError) as excinfo:
+                    convert_to_markdown(
+                        str(self.parse_file),
+                        self.temp_dir,
+                        "test-model",
+                        str(self.prompt_file),
+                        batch_pages=2,
+                        engine=engine,
+                        on_error="continue",
+                    )
+            assert mock_single.call_count == 0 and mock_single_async.call_count == 0
+            assert sorted(excinfo.value.failed_pages) == [0, 1]
+            assert "RESOURCE_EXHAUSTED" in excinfo.value.failed_pages[0]
+
+    def test_phase2_asyncio_engine_matches_thread_engine(self):
+        calls: list[str] = []
+
+        async def _mock_generate_page_markdown_async(
+            *, prompt_text, page_image_path, model, **_kwargs
+        ):
+            _ = (prompt_text, model)
+            calls.append(page_image_path.name)
+            return f"page for {page_image_path.name}"
+
+        with patch(
+            "poc_pdf_to_md.engine.generate_page_markdown_async",
+            side_effect=_mock_generate_page_markdown_async,
+        ), patch("poc_pdf_to_md.engine.generate_page_markdown") as mock_sync:
+            out_path = convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                engine="asyncio",
+            )
+
+        assert mock_sync.call_count == 0
+        assert sorted(calls) == ["page_0000.png", "page_0001.png"]
+        assert out_path.read_text(encoding="utf-8") == (
+            "page for page_0000.png\n\n---\n\npage for page_0001.png\n"
+        )
+        state = json.loads((self.temp_dir / "phase2" / "state.json").read_text(encoding="utf-8"))
+        assert state["completed_pages"]["0"]["route"] == "model"
+        assert state["concurrency"]["limit"] >= 1
+
+        # Resume: completed pages are cache hits on the asyncio engine too
+        with patch("poc_pdf_to_md.engine.generate_page_markdown_async") as mock_async:
+            convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                engine="asyncio",
+            )
+        assert mock_async.call_count == 0
+
+    def test_phase2_asyncio_engine_retries_recitation_and_reports_errors(self):
+        prompts: list[str] = []
+
+        async def _mock_generate_page_markdown_async(
+            *, prompt_text, page_image_path, model, **_kwargs
+        ):
+            _ = (page_image_path, model)
+            prompts.append(prompt_text)
+            if "安全模式" in prompt_text:
+                raise RuntimeError("still blocked")
+            raise RuntimeError("FinishReason.RECITATION")
+
+        with patch(
+            "poc_pdf_to_md.engine.generate_page_markdown_async",
+            side_effect=_mock_generate_page_markdown_async,
+        ):
+            with pytest.raises(RuntimeError, match="Phase 2 failed while converting a page"):
+                convert_to_markdown(
+                    str(self.parse_file),
+                    self.temp_dir,
+                    "test-model",
+                    str(self.prompt_file),
+                    pages_spec="1",
+                    engine="asyncio",
+                )
+
+        assert len(prompts) == 2 and "安全模式" in prompts[1]
+
+    def test_phase2_unknown_engine_raises(self):
+        with pytest.raises(ValueError, match="Unknown Phase 2 engine"):
+            convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                engine="fibers",
+            )
+
+    def test_phase2_retries_transient_errors(self, monkeypatch):
+        monkeypatch.setenv("GEMINI_RETRY_BASE_DELAY", "0")
+        attempts: list[str] = []
+
+        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, **_kwargs):
+            _ = (prompt_text, model)
+            attempts.append(page_image_path.name)
+            if attempts.count(page_image_path.name) < 3:
+                raise RuntimeError("429 RESOURCE_EXHAUSTED")
+            return "ok"
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            convert_to_markdown(
+                str(self.parse_file), self.temp_dir, "test-model", str(self.prompt_file)
+            )
+
+        assert sorted(attempts) == ["page_0000.png"] * 3 + ["page_0001.png"] * 3
+
+    def test_phase2_fail_fast_cancels_pending_pages(self, monkeypatch):
+        monkeypatch.setenv("GEMINI_CONCURRENCY", "1")
+        monkeypatch.setenv("GEMINI_CONCURRENCY_MAX", "1")  # One worker: pages start in order
+        calls: list[str] = []
+
+        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, **_kwargs):
+            _ = (prompt_text, model)
+            calls.append(page_image_path.name)
+            raise RuntimeError("400 INVALID_ARGUMENT")
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            with pytest.raises(RuntimeError, match="Phase 2 failed while converting a page"):
+                convert_to_markdown(
+                    str(self.parse_file), self.temp_dir, "test-model", str(self.prompt_file)
+                )
+
+        assert calls == ["page_0000.png"]
+
+    def test_phase2_continue_records_failures_and_writes_partial_output(self):
+        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, **_kwargs):
+            _ = (prompt_text, model)
+            if page_image_path.name == "page_0000.png":
+                raise RuntimeError("400 INVALID_ARGUMENT")
+            return "page 1"
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            with pytest.raises(PartialConversionError) as excinfo:
+                convert_to_markdown(
+                    str(self.parse_file),
+                    self.temp_dir,
+                    "test-model",
+                    str(self.prompt_file),
+                    on_error="continue",
+                )
+
+        assert list(excinfo.value.failed_pages) == [0]
+        assert excinfo.value.output_path.read_text(encoding="utf-8") == (
+            "<!-- page_index: 0 conversion failed -->\n\n---\n\npage 1\n"
+        )
+        state = json.loads((self.temp_dir / "phase2" / "state.json").read_text(encoding="utf-8"))
+        assert "INVALID_ARGUMENT" in state["failed_pages"]["0"]["error"]
+
+        # Rerun converts only the failed page
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", return_value="page 0") as mock_ai:
+            out_path = convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                on_error="continue",
+            )
+        assert mock_ai.call_count == 1
+        assert out_path.read_text(encoding="utf-8") == "page 0\n\n---\n\npage 1\n"
+
+    def test_phase2_prompt_cache_sends_template_once(self):
+        backend = LocalPromptCacheBackend()
+        requests: list[dict] = []
+
+        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, **kwargs):
+            _ = (page_image_path, model)
+            requests.append(
+                {"prompt_text": prompt_text, "cached_content": kwargs.get("cached_content")}
+            )
+            return "ok"
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                prompt_cache=PromptCache(backend, min_tokens=0),
+            )
+
+        assert backend.calls["create"] == 1
+        names = {r["cached_content"] for r in requests}
+        assert len(requests) == 2 and len(names) == 1
+        assert backend.text(names.pop()) == "請把本頁轉成 Markdown。"
+        for r in requests:
+            assert "請把本頁轉成 Markdown" not in r["prompt_text"]
+            assert r["prompt_text"].startswith("## 參考資料（程式自動附加）")
+        state = json.loads((self.temp_dir / "phase2" / "state.json").read_text(encoding="utf-8"))
+        assert state["prompt_cache"]["created"] == 1
+
+    def test_phase2_prompt_cache_falls_back_to_inline_template(self):
+        backend = LocalPromptCacheBackend()
+        prompts: list[str] = []
+
+        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, **kwargs):
+            _ = (page_image_path, model)
+            if kwargs.get("cached_content"):
+                raise RuntimeError("404 NOT_FOUND. CachedContent not found")
+            prompts.append(prompt_text)
+            return "ok"
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                prompt_cache=PromptCache(backend, min_tokens=0),
+            )
+
+        assert len(prompts) == 2
+        assert all(p.startswith("請把本頁轉成 Markdown。") for p in prompts)
+
+    def test_phase2_response_cache_is_shared_across_output_dirs(self):
+        cache = ResponseCache(self.temp_dir / "responses.sqlite3")
+        with patch(
+            "poc_pdf_to_md.engine.generate_page_markdown", return_value="cached md"
+        ) as mock_ai:
+            convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                response_cache=cache,
+            )
+        assert mock_ai.call_count == 2
+
+        # Same pages converted into a fresh output directory: no new requests
+        shutil.rmtree(self.temp_dir / "phase2")
+        with patch("poc_pdf_to_md.engine.generate_page_markdown") as mock_ai:
+            out_path = convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                response_cache=cache,
+            )
+        assert mock_ai.call_count == 0
+        assert out_path.read_text(encoding="utf-8") == "cached md\n\n---\n\ncached md\n"
+        assert cache.hits == 2
+
+        # A different model misses
+        shutil.rmtree(self.temp_dir / "phase2")
+        with patch(
+            "poc_pdf_to_md.engine.generate_page_markdown", return_value="other md"
+        ) as mock_ai:
+            convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "other-model",
+                str(self.prompt_file),
+                response_cache=cache,
+            )
+        assert mock_ai.call_count == 2
+
+    def test_phase2_response_cache_survives_edits_to_other_pages(self):
+        cache = ResponseCache(self.temp_dir / "responses.sqlite3")
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", return_value="cached md"):
+            convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                response_cache=cache,
+            )
+
+        # Page 0 gains an image: page 1's blockIndex and the embedded xrefs are renumbered
+        parse_result = json.loads(self.parse_file.read_text(encoding="utf-8"))
+        (self.temp_dir / "images" / "img_page0_new.png").write_bytes(b"img0 new")
+        parse_result["blocks"].append(
+            {
+                "page_index": 0,
+                "type": "image",
+                "imagePath": "images/img_page0_new.png",
+                "bbox": [1, 9, 3, 12],
+            }
+        )
+        for block in parse_result["blocks"]:
+            if block.get("xref"):
+                block["xref"] += 1000
+        parse_result["blocks"] = sort_and_index_blocks(parse_result["blocks"])
+        self.parse_file.write_text(json.dumps(parse_result, ensure_ascii=False), encoding="utf-8")
+        assert [b["blockIndex"] for b in parse_result["blocks"] if b["page_index"] == 1] == [1, 4]
+
+        shutil.rmtree(self.temp_dir / "phase2")
+        prompts: list[str] = []
+
+        def _mock_generate_page_markdown(*, prompt_text, **_kwargs):
+            prompts.append(prompt_text)
+            return "new md"
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            out_path = convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                response_cache=cache,
+            )
+        assert len(prompts) == 1
+        assert '"page_index": 0' in prompts[0]
+        assert out_path.read_text(encoding="utf-8") == "new md\n\n---\n\ncached md\n"
+
+    def test_phase2_stream_writes_partial_file_then_promotes_it(self):
+        pages_dir = self.temp_dir / "phase2" / "pages"
+        seen_partials: list[str] = []
+
+        def _mock_generate_page_markdown(
+            *, prompt_text, page_image_path, model, on_chunk=None, **_kwargs
+        ):
+            _ = (prompt_text, model)
+            assert on_chunk is not None
+            name = page_image_path.stem + ".md"
+            on_chunk("# Title\n", 3)
+            seen_partials.append((pages_dir / (name + ".partial")).read_text(encoding="utf-8"))
+            assert not (pages_dir / name).exists()
+            on_chunk("body\n", None)
+            return "# Title\nbody\n"
+
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+            out_path = convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                stream=True,
+            )
+
+        assert seen_partials == ["# Title\n", "# Title\n"]
+        assert (pages_dir / "page_0000.md").read_text(encoding="utf-8") == "# Title\nbody\n"
+        assert not list(pages_dir.glob("*.partial"))
+        assert out_path.read_text(encoding="utf-8") == "# Title\nbody\n\n---\n\n# Title\nbody\n"
+        state = json.loads((self.temp_dir / "phase2" / "state.json").read_text(encoding="utf-8"))
+        assert state["completed_pages"]["0"]["ttft_sec"] >= 0
+
+    def test_phase2_stream_retry_restarts_partial_file(self, monkeypatch):
+        monkeypatch.setenv("GEMINI_RETRY_BASE_DELAY", "0")
+        attempts: list[str] = []
+
+        async def _mock_generate_page_markdown_async(
+            *, prompt_text, page_image_path, model, on_chunk, **_kwargs
+        ):
+            _ = (prompt_text, model)
+            attempts.append(page_image_path.name)
+            on_chunk(f"attempt {attempts.count(page_image_path.name)}", None)
+            if attempts.count(page_image_path.name) == 1:
+                raise TimeoutError("read timed out")
+            return "done"
+
+        with patch(
+            "poc_pdf_to_md.engine.generate_page_markdown_async",
+            side_effect=_mock_generate_page_markdown_async,
+        ):
+            convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                engine="asyncio",
+                stream=True,
+            )
+
+        assert len(attempts) == 4
+        pages_dir = self.temp_dir / "phase2" / "pages"
+        assert (pages_dir / "page_0001.md").read_text(encoding="utf-8") == "done\n"
+        assert not list(pages_dir.glob("*.partial"))
+
+    def test_phase2_asyncio_hedges_slow_requests(self):
+        hedger = RequestHedger(min_samples=1, budget=1.0)
+        hedger.observe(0.01)
+        calls: list[str] = []
+
+        async def _mock_generate_page_markdown_async(
+            *, prompt_text, page_image_path, model, **_kwargs
+        ):
+            _ = (prompt_text, model)
+            calls.append(page_image_path.name)
+            if calls.count(page_image_path.name) == 1:
+                await asyncio.sleep(5)
+            return f"page for {page_image_path.name}"
+
+        with patch(
+            "poc_pdf_to_md.engine.generate_page_markdown_async",
+            side_effect=_mock_generate_page_markdown_async,
+        ):
+            convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                engine="asyncio",
+                hedger=hedger,
+            )
+
+        assert sorted(calls) == ["page_0000.png"] * 2 + ["page_0001.png"] * 2
+        state = json.loads((self.temp_dir / "phase2" / "state.json").read_text(encoding="utf-8"))
+        assert state["hedging"]["hedged"] == 2
+        assert state["hedging"]["hedge_wins"] == 2
+
+    def test_phase2_prompt_json_mode_and_token_accounting(self):
+        prompts: list[str] = []
+
+        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, **_kwargs):
+            _ = model
+            prompts.append(prompt_text)
+            return f"page for {page_image_path.name}"
+
+        totals = {}
+        for mode in ("full", "dedup"):
+            shutil.rmtree(self.temp_dir / "phase2", ignore_errors=True)
+            with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_generate_page_markdown):
+                convert_to_markdown(
+                    str(self.parse_file),
+                    self.temp_dir,
+                    "test-model",
+                    str(self.prompt_file),
+                    prompt_json=mode,
+                )
+            state_path = self.temp_dir / "phase2" / "state.json"
+            state = json.loads(state_path.read_text(encoding="utf-8"))
+            assert all(page["prompt_tokens_est"] > 0 for page in state["completed_pages"].values())
+            assert state["prompt_tokens"]["requests"] == 2
+            assert state["prompt_tokens"]["prompt_json"] == mode
+            assert state["identity"]["prompt_json"] == mode
+            totals[mode] = state["prompt_tokens"]["total_est"]
+
+        assert totals["dedup"] < totals["full"]
+        data = json.loads(prompts[-1][prompts[-1].index("{") :])
+        assert "page_parse_dict" not in data
+        assert "\n" not in prompts[-1][prompts[-1].index("{") :].strip()
+
+        with pytest.raises(ValueError, match="Unknown prompt JSON mode"):
+            convert_to_markdown(
+                str(self.parse_file),
+                self.temp_dir,
+                "test-model",
+                str(self.prompt_file),
+                prompt_json="x",
+            )
+
+    def test_split_batch_markdown_requires_delimiters_in_order(self):
+        in_order = "<!-- page_index: 3 -->\na\n<!--page_index:4-->\nb"
+        swapped = "<!-- page_index: 4 -->\nb\n<!-- page_index: 3 -->\na"
+        assert split_batch_markdown(in_order, [3, 4]) == {3: "a", 4: "b"}
+        assert split_batch_markdown(swapped, [3, 4]) is None
+        assert split_batch_markdown("<!-- page_index: 3 -->\na", [3, 4]) is None
+        assert split_batch_markdown("intro\n<!-- page_index: 3 -->\na", [3]) is None
+
     def test_phase2_missing_prompt_file_raises(self):
         with pytest.raises(FileNotFoundError):
             convert_to_markdown(
@@ -168,7 +856,9 @@ class TestPhase2ConvertToMarkdown:
             )
 
     def test_phase2_ai_error_includes_page_context(self):
-        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, generation_config=None):
+        def _mock_generate_page_markdown(
+            *, prompt_text, page_image_path, model, generation_config=None, **_kwargs
+        ):
             _ = (prompt_text, page_image_path, model, generation_config)
             raise RuntimeError("Gemini returned an empty response (missing response.text).")
 
@@ -187,7 +877,9 @@ class TestPhase2ConvertToMarkdown:
 
     def test_phase2_resume_skips_completed_pages(self):
         # First run populates cache
-        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, generation_config=None):
+        def _mock_generate_page_markdown(
+            *, prompt_text, page_image_path, model, generation_config=None, **_kwargs
+        ):
             _ = (prompt_text, page_image_path, model, generation_config)
             return f"page for {page_image_path.name}"
 
@@ -212,7 +904,9 @@ class TestPhase2ConvertToMarkdown:
 
     def test_phase2_resume_survives_prompt_change_via_disk_cache(self):
         # First run creates per-page files
-        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, generation_config=None):
+        def _mock_generate_page_markdown(
+            *, prompt_text, page_image_path, model, generation_config=None, **_kwargs
+        ):
             _ = (prompt_text, model, generation_config)
             return f"page for {page_image_path.name}"
 
@@ -240,7 +934,9 @@ class TestPhase2ConvertToMarkdown:
     def test_phase2_recitation_retries_with_safe_prompt(self):
         calls: list[str] = []
 
-        def _mock_generate_page_markdown(*, prompt_text, page_image_path, model, generation_config=None):
+        def _mock_generate_page_markdown(
+            *, prompt_text, page_image_path, model, generation_config=None, **_kwargs
+        ):
             _ = (page_image_path, model, generation_config)
             calls.append(prompt_text)
             if len(calls) == 1:
@@ -272,6 +968,12 @@ class TestPhase2ConvertToMarkdown:
             assert len(calls) >= 2
             # Parallel execution order is not guaranteed, so check if any call contains safe prompt
             assert any("安全模式" in c for c in calls)
+            # The safe-mode retry is a request of its own in the token accounting
+            state = json.loads((tmp / "phase2" / "state.json").read_text(encoding="utf-8"))
+            assert state["prompt_tokens"]["requests"] == 3
+            assert sum(page["prompt_tokens_est"] for page in state["completed_pages"].values()) == (
+                state["prompt_tokens"]["total_est"]
+            )
         finally:
             import shutil
             shutil.rmtree(tmp)
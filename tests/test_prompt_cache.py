@@ -0,0 +1,139 @@
+"""Tests for the Phase 2 prompt-template cache (local stand-in backend)."""
+
+import threading
+from pathlib import Path
+
+from poc_pdf_to_md.prompt_cache import (
+    LocalPromptCacheBackend,
+    PromptCache,
+    min_cache_tokens,
+    prompt_cache_from_env,
+)
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestPromptCache:
+    """Test cache entry creation, TTL handling and fallback."""
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.clock = _Clock()
+        self.backend = LocalPromptCacheBackend(clock=self.clock)
+        self.cache = PromptCache(self.backend, ttl_sec=3600, clock=self.clock, min_tokens=0)
+
+    def test_one_entry_per_model_and_template(self):
+        """Test that repeated lookups reuse one entry holding the template."""
+        name = self.cache.resolve("model-a", "template")
+        assert name is not None
+        assert self.cache.resolve("model-a", "template") == name
+        assert self.backend.text(name) == "template"
+        assert self.cache.resolve("model-b", "template") != name
+        assert self.cache.resolve("model-a", "other template") != name
+        assert self.backend.calls["create"] == 3
+
+    def test_entry_is_extended_before_it_expires(self):
+        """Test that an entry near expiry gets its TTL extended instead of being recreated."""
+        name = self.cache.resolve("model", "template")
+        self.clock.now += 3600 - 60
+        assert self.cache.resolve("model", "template") == name
+        assert self.backend.calls == {"create": 1, "find": 1, "extend": 1}
+        self.clock.now += 3000
+        assert self.cache.resolve("model", "template") == name
+        assert self.backend.calls["extend"] == 1
+
+    def test_expired_entry_is_recreated(self):
+        """Test that an entry that expired between lookups is replaced."""
+        name = self.cache.resolve("model", "template")
+        self.clock.now += 7200
+        new_name = self.cache.resolve("model", "template")
+        assert new_name is not None and new_name != name
+        assert self.backend.text(new_name) == "template"
+
+    def test_entry_is_reused_across_runs(self):
+        """Test that another run finds the live entry by its template-hash display name."""
+        name = self.cache.resolve("model", "template")
+        other_run = PromptCache(self.backend, ttl_sec=3600, clock=self.clock, min_tokens=0)
+        assert other_run.resolve("model", "template") == name
+        assert other_run.reused == 1
+        assert self.backend.calls["create"] == 1
+
+    def test_unavailable_cache_falls_back_once(self):
+        """Test that a failed create disables caching for that template without retrying it."""
+
+        def _fail(*_args):
+            raise RuntimeError("400 INVALID_ARGUMENT: Cached content is too small")
+
+        self.backend.create = _fail
+        assert self.cache.resolve("model", "template") is None
+        assert self.cache.resolve("model", "template") is None
+        assert self.backend.calls["find"] == 1
+        assert self.cache.summary().startswith("prompt_cache=off")
+
+    def test_small_template_skips_the_api(self):
+        """Test that a template below the model's minimum cacheable size skips the API."""
+        cache = PromptCache(self.backend, clock=self.clock)
+        assert min_cache_tokens("gemini-2.5-flash") == 1024
+        assert min_cache_tokens("gemini-3-pro-preview") == 4096
+        assert cache.resolve("gemini-2.5-flash", "template") is None
+        assert cache.resolve("gemini-2.5-flash", "x" * 4096) is not None
+        assert self.backend.calls == {"create": 1, "find": 1, "extend": 0}
+
+    def test_shipped_template_is_below_every_minimum(self):
+        """Test that the default template is inlined and the summary says why."""
+        template_path = Path(__file__).parent.parent / "prompts" / "phase2_page_to_md.md"
+        template = template_path.read_text(encoding="utf-8")
+        cache = PromptCache(self.backend, clock=self.clock)
+        assert cache.resolve("gemini-2.5-flash", template) is None
+        assert cache.resolve("gemini-3-pro-preview", template) is None
+        assert self.backend.calls == {"create": 0, "find": 0, "extend": 0}
+        assert "below the minimum cacheable size (1024 tokens)" in cache.summary()
+
+    def test_lookup_does_not_block_on_other_templates(self):
+        """Test that a slow backend call for one template does not hold up the others."""
+        started, release = threading.Event(), threading.Event()
+        create = self.backend.create
+
+        def _slow_create(model, text, ttl_sec, display_name):
+            if text == "slow":
+                started.set()
+                release.wait(5)
+            return create(model, text, ttl_sec, display_name)
+
+        self.backend.create = _slow_create
+        worker = threading.Thread(target=lambda: self.cache.resolve("model", "slow"))
+        worker.start()
+        assert started.wait(5)
+        assert self.cache.resolve("model", "fast") is not None
+        self.cache.report()
+        release.set()
+        worker.join(5)
+        assert self.cache.resolve("model", "slow") is not None
+        assert self.cache.created == 2
+
+    def test_discard_on_cache_error(self):
+        """Test that a request failing on its cached content stops further cache use."""
+        assert self.cache.resolve("model", "template") is not None
+        assert not self.cache.discard_on_error(RuntimeError("429 RESOURCE_EXHAUSTED"))
+        assert self.cache.discard_on_error(
+            RuntimeError("403 PERMISSION_DENIED. CachedContent not found")
+        )
+        assert self.cache.resolve("model", "template") is None
+        assert not self.cache.discard_on_error(RuntimeError("CachedContent not found"))
+
+    def test_cache_from_env(self, monkeypatch):
+        """Test environment configuration."""
+        monkeypatch.setenv("GEMINI_PROMPT_CACHE", "0")
+        assert prompt_cache_from_env() is None
+        monkeypatch.setenv("GEMINI_PROMPT_CACHE", "1")
+        monkeypatch.setenv("GEMINI_PROMPT_CACHE_TTL", "600")
+        cache = prompt_cache_from_env()
+        assert cache is not None and cache.ttl_sec == 600 and cache.min_tokens is None
+        monkeypatch.setenv("GEMINI_PROMPT_CACHE_MIN_TOKENS", "0")
+        assert prompt_cache_from_env().min_tokens == 0
@@ -0,0 +1,104 @@
+"""Tests for the compact Phase 2 prompt JSON serializer."""
+
+import json
+
+import pytest
+
+from poc_pdf_to_md.prompt_compaction import PROMPT_JSON_MODES, dumps_reference, page_reference
+from poc_pdf_to_md.rate_limit import estimate_text_tokens
+
+
+class TestPageReference:
+    """Test what each prompt JSON mode keeps and how it is serialized."""
+
+    def setup_method(self):
+        """Setup test environment."""
+        page_image = {
+            "blockIndex": 0,
+            "page_index": 3,
+            "type": "page_image",
+            "imagePath": "images/page_0003.png",
+            "ext": "png",
+            "width": 1224,
+            "height": 1584,
+            "zoom": 2.0,
+            "blank": False,
+            "text_layer": {"chars": 1200, "lines": 40},
+            "textPath": "text/page_0003.md",
+        }
+        image = {
+            "blockIndex": 1,
+            "page_index": 3,
+            "type": "image",
+            "bbox": [61.20000076293945, 79.19999694824219, 306.0, 396.0],
+            "xref": 12,
+            "imagePath": "images/abc.png",
+            "ext": "png",
+            "width": 640,
+            "height": 480,
+        }
+        self.kwargs = {
+            "page_index": 3,
+            "page_image_rel": "images/page_0003.png",
+            "embedded_images_meta": [
+                {
+                    key: image.get(key)
+                    for key in ("imagePath", "bbox", "xref", "ext", "width", "height")
+                }
+            ],
+            "page_parse_dict": {"page_index": 3, "blocks": [page_image, image]},
+        }
+
+    def test_full_and_compact_keep_everything(self):
+        """Test that full and compact carry the same data, compact without whitespace."""
+        full = dumps_reference(page_reference(**self.kwargs, mode="full"), "full")
+        compact = dumps_reference(page_reference(**self.kwargs, mode="compact"), "compact")
+        assert json.loads(full) == json.loads(compact)
+        assert "\n" in full
+        assert "\n" not in compact and ": " not in compact
+        assert len(compact) < len(full)
+
+    def test_dedup_drops_repeated_blocks_and_rounds_bboxes(self):
+        """Test that dedup keeps embedded images once, with rounded bboxes."""
+        ref = page_reference(**self.kwargs, mode="dedup")
+        assert "page_parse_dict" not in ref
+        assert ref["embedded_images_meta"] == [
+            {
+                "imagePath": "images/abc.png",
+                "bbox": [61.2, 79.2, 306.0, 396.0],
+                "xref": 12,
+                "ext": "png",
+                "width": 640,
+                "height": 480,
+            }
+        ]
+
+    def test_dedup_keeps_other_block_types(self):
+        """Test that blocks not repeated elsewhere stay in page_parse_dict."""
+        self.kwargs["page_parse_dict"]["blocks"].append(
+            {
+                "page_index": 3,
+                "type": "text",
+                "bbox": [1.234, 2.0, 3.0, 4.0],
+                "text": "x",
+                "font": None,
+            }
+        )
+        ref = page_reference(**self.kwargs, mode="dedup")
+        assert ref["page_parse_dict"] == {
+            "blocks": [{"type": "text", "bbox": [1.2, 2.0, 3.0, 4.0], "text": "x"}]
+        }
+
+    def test_modes_shrink_estimated_tokens(self):
+        """Test that each mode costs no more tokens than the previous one."""
+        tokens = [
+            estimate_text_tokens(dumps_reference(page_reference(**self.kwargs, mode=mode), mode))
+            for mode in PROMPT_JSON_MODES
+        ]
+        assert tokens == sorted(tokens, reverse=True)
+        assert tokens[-1] < tokens[0] / 4
+
+    def test_unknown_mode_raises(self):
+        """Test that an unknown mode is rejected."""
+        with pytest.raises(ValueError, match="Unknown prompt JSON mode"):
+            page_reference(**self.kwargs, mode="tiny")
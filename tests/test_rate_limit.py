@@ -0,0 +1,125 @@
+"""Tests for the host-wide SQLite RPM/TPM rate limiter."""
+
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import fitz
+import pytest
+
+from poc_pdf_to_md import gemini_client
+from poc_pdf_to_md.rate_limit import SharedRateLimiter, estimate_image_tokens, estimate_text_tokens
+
+
+def _try_acquire_in_process(db_path: str, attempts: int) -> int:
+    limiter = SharedRateLimiter(Path(db_path), rpm=5)
+    return sum(1 for _ in range(attempts) if limiter.try_acquire("model", 1) == 0.0)
+
+
+class TestSharedRateLimiter:
+    """Test token buckets shared through SQLite."""
+
+    temp_dir: Path
+    db_path: Path
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.db_path = self.temp_dir / "rate.sqlite3"
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        import shutil
+        if self.temp_dir.exists():
+            shutil.rmtree(self.temp_dir)
+
+    def test_rpm_bucket_blocks_after_budget(self):
+        """Test that requests beyond the RPM budget must wait about 60/RPM seconds."""
+        limiter = SharedRateLimiter(self.db_path, rpm=2)
+        assert limiter.try_acquire("m", 0) == 0.0
+        assert limiter.try_acquire("m", 0) == 0.0
+        wait = limiter.try_acquire("m", 0)
+        assert 29.0 < wait <= 30.0
+        assert limiter.try_acquire("other-model", 0) == 0.0
+
+    def test_budget_is_shared_across_processes(self):
+        """Test that processes using the same file share one RPM budget."""
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            taken = list(executor.map(_try_acquire_in_process, [str(self.db_path)] * 2, [4, 4]))
+        assert sum(taken) == 5
+
+    def test_tpm_bucket_is_corrected_from_usage(self):
+        """Test that settle() refunds an over-estimate to the token bucket."""
+        limiter = SharedRateLimiter(self.db_path, tpm=1000)
+        reservation = limiter.acquire("m", 800)
+        assert limiter.try_acquire("m", 800) > 0
+        limiter.settle(reservation, 300)
+        assert 700 <= limiter.levels("m")["tpm"] < 710
+        assert limiter.try_acquire("m", 600) == 0.0
+
+    def test_request_larger_than_budget_waits_for_full_bucket(self):
+        """Test that an oversized request is admitted once the bucket is full."""
+        limiter = SharedRateLimiter(self.db_path, tpm=100)
+        assert limiter.try_acquire("m", 500) == 0.0
+        assert limiter.try_acquire("m", 500) > 0
+
+    def test_generate_content_reserves_and_settles(self, monkeypatch):
+        """Test that Gemini requests go through the limiter configured by the environment."""
+        monkeypatch.setenv("GEMINI_TPM", "100000")
+        monkeypatch.setenv("GEMINI_RATE_LIMIT_DB", str(self.db_path))
+        resp = SimpleNamespace(text="ok", usage_metadata=SimpleNamespace(prompt_token_count=1234))
+        client = SimpleNamespace(models=SimpleNamespace(generate_content=lambda **_kwargs: resp))
+        with patch("poc_pdf_to_md.gemini_client.get_client", return_value=client):
+            # pylint: disable-next=protected-access
+            assert gemini_client._generate_content(["prompt"], "m", None, False) == "ok"
+        limiter = SharedRateLimiter(self.db_path, tpm=100000)
+        assert 100000 - 1234 <= limiter.levels("m")["tpm"] < 100000 - 1200
+
+    def test_failed_request_is_refunded(self, monkeypatch):
+        """Test that a request that raises gives its reserved tokens back."""
+        monkeypatch.setenv("GEMINI_TPM", "1000")
+        monkeypatch.setenv("GEMINI_RATE_LIMIT_DB", str(self.db_path))
+
+        def _fail(**_kwargs):
+            raise RuntimeError("503 UNAVAILABLE")
+
+        client = SimpleNamespace(models=SimpleNamespace(generate_content=_fail))
+        with patch("poc_pdf_to_md.gemini_client.get_client", return_value=client):
+            with pytest.raises(RuntimeError, match="503"):
+                # pylint: disable-next=protected-access
+                gemini_client._generate_content(["x" * 2000], "m", None, False)
+        assert SharedRateLimiter(self.db_path, tpm=1000).levels("m")["tpm"] > 990
+
+    def test_lock_timeout_error_is_not_masked(self, monkeypatch):
+        """Test that a failed BEGIN surfaces its own error, not a ROLLBACK error."""
+        monkeypatch.setattr("poc_pdf_to_md.rate_limit._SQLITE_TIMEOUT_SEC", 0.05)
+        limiter = SharedRateLimiter(self.db_path, rpm=10)
+        holder = sqlite3.connect(self.db_path, isolation_level=None)
+        holder.execute("BEGIN IMMEDIATE")
+        try:
+            with pytest.raises(sqlite3.OperationalError, match="locked"):
+                limiter.try_acquire("m", 0)
+        finally:
+            holder.execute("ROLLBACK")
+            holder.close()
+
+
+class TestTokenEstimates:
+    """Test request token estimates."""
+
+    def test_image_tokens_from_dimensions(self):
+        """Test tile-based image estimates for PNG and JPEG headers."""
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 1000, 800), 0)
+        pix.clear_with(255)
+        assert estimate_image_tokens(pix.tobytes("png")) == 4 * 258
+        assert estimate_image_tokens(pix.tobytes("jpeg")) == 4 * 258
+        small = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 100, 100), 0)
+        assert estimate_image_tokens(small.tobytes("png")) == 258
+
+    def test_text_tokens_count_cjk_per_char(self):
+        """Test that ASCII is ~4 chars/token and CJK one token per char."""
+        assert estimate_text_tokens("abcdefgh") == 2
+        assert estimate_text_tokens("請把本頁") == 4
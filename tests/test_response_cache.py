@@ -0,0 +1,156 @@
+"""Tests for the persistent Phase 2 response cache."""
+
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from poc_pdf_to_md.response_cache import ResponseCache, response_cache_from_env, response_key
+
+
+class TestResponseCache:
+    """Test keys, eviction and single-flight lookups."""
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.db_path = self.temp_dir / "responses.sqlite3"
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_key_covers_model_config_request_and_images(self):
+        """Test that every request input changes the key."""
+        base = {
+            "model": "m",
+            "config": {"thinking_enabled": False},
+            "request": {"page": 1},
+            "images": [b"img"],
+        }
+        key = response_key(**base)
+        assert response_key(**base) == key
+        assert response_key(**{**base, "model": "m2"}) != key
+        assert response_key(**{**base, "config": {"thinking_enabled": True}}) != key
+        assert response_key(**{**base, "request": {"page": 2}}) != key
+        assert response_key(**{**base, "images": [b"img2"]}) != key
+
+    def test_responses_are_shared_across_instances(self):
+        """Test that a response stored by one run is found by another."""
+        ResponseCache(self.db_path).put("k", "m", "markdown")
+        cache = ResponseCache(self.db_path)
+        assert cache.get_or_compute("k", "m", lambda: "recomputed") == "markdown"
+        assert cache.hits == 1 and cache.misses == 0
+
+    def test_size_limit_evicts_least_recently_used(self):
+        """Test LRU eviction once the total size exceeds the limit."""
+        cache = ResponseCache(self.db_path, max_bytes=25)
+        cache.put("a", "m", "a" * 10)
+        time.sleep(0.01)
+        cache.put("b", "m", "b" * 10)
+        time.sleep(0.01)
+        assert cache.get("a") == "a" * 10  # a is now more recently used than b
+        time.sleep(0.01)
+        cache.put("c", "m", "c" * 10)
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None
+        assert cache.evicted == 1
+        assert cache.stats() == {"entries": 2, "bytes": 20}
+
+    def test_table_is_summed_only_when_eviction_is_due(self, monkeypatch):
+        """Test that puts under the limit do not scan the table for its total size."""
+        cache = ResponseCache(self.db_path, max_bytes=1000)
+        statements: list[str] = []
+        connect = cache._connect  # pylint: disable=protected-access
+
+        def _traced_connect():
+            conn = connect()
+            conn.set_trace_callback(statements.append)
+            return conn
+
+        monkeypatch.setattr(cache, "_connect", _traced_connect)
+        for i in range(10):
+            cache.put(f"k{i}", "m", "x" * 50)
+        assert sum("SUM(size)" in sql for sql in statements) == 1  # first put only
+        for i in range(10, 21):
+            cache.put(f"k{i}", "m", "x" * 50)
+        assert sum("SUM(size)" in sql for sql in statements) == 2  # crossed the limit once
+        assert cache.stats()["bytes"] <= 900
+
+    def test_old_entries_expire(self):
+        """Test that entries older than the maximum age are dropped."""
+        cache = ResponseCache(self.db_path, max_age_sec=0.05)
+        cache.put("k", "m", "markdown")
+        assert cache.get("k") == "markdown"
+        time.sleep(0.1)
+        assert cache.get("k") is None
+
+    def test_concurrent_identical_lookups_compute_once(self):
+        """Test that identical lookups in flight are collapsed into one computation (threads)."""
+        cache = ResponseCache(self.db_path)
+        release = threading.Event()
+        calls: list[int] = []
+
+        def _compute() -> str:
+            calls.append(1)
+            release.wait(5)
+            return "markdown"
+
+        results: list[str] = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(cache.get_or_compute("k", "m", _compute))
+            )
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        while cache.collapsed < 3:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+        assert calls == [1]
+        assert results == ["markdown"] * 4
+
+    def test_concurrent_identical_lookups_compute_once_async(self):
+        """Test single-flight on the asyncio engine, including a shared failure."""
+        cache = ResponseCache(self.db_path)
+        calls: list[int] = []
+
+        async def _compute() -> str:
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "markdown"
+
+        async def _fail() -> str:
+            await asyncio.sleep(0.05)
+            raise RuntimeError("boom")
+
+        async def _main():
+            ok = await asyncio.gather(
+                *(cache.get_or_compute_async("k", "m", _compute) for _ in range(5))
+            )
+            failed = await asyncio.gather(
+                *(cache.get_or_compute_async("bad", "m", _fail) for _ in range(3)),
+                return_exceptions=True,
+            )
+            return ok, failed
+
+        ok, failed = asyncio.run(_main())
+        assert ok == ["markdown"] * 5 and calls == [1]
+        assert all(isinstance(e, RuntimeError) for e in failed)
+        assert cache.get("bad") is None
+
+    def test_cache_from_env(self, monkeypatch):
+        """Test environment configuration."""
+        monkeypatch.setenv("GEMINI_RESPONSE_CACHE", "0")
+        assert response_cache_from_env() is None
+        monkeypatch.setenv("GEMINI_RESPONSE_CACHE", "1")
+        monkeypatch.setenv("GEMINI_RESPONSE_CACHE_DB", str(self.db_path))
+        monkeypatch.setenv("GEMINI_RESPONSE_CACHE_MAX_MB", "1")
+        cache = response_cache_from_env()
+        assert cache is not None
+        assert cache.db_path == self.db_path and cache.max_bytes == 1024 * 1024
@@ -0,0 +1,70 @@
+"""Tests for the Phase 2 retry policy."""
+
+from types import SimpleNamespace
+
+import httpx
+
+from poc_pdf_to_md.retry import RetryPolicy, retry_after, retry_policy_from_env
+
+
+class _ApiError(Exception):
+    def __init__(self, code: int, headers=None, details=None) -> None:
+        super().__init__(f"{code} error")
+        self.code = code
+        self.response = SimpleNamespace(headers=headers or {})
+        self.details = details
+
+
+class TestRetryPolicy:
+    """Test retry classification and backoff delays."""
+
+    def test_transient_errors_are_retryable(self):
+        """Test that 429/5xx, timeouts and dropped connections are retried."""
+        policy = RetryPolicy()
+        assert policy.is_retryable(_ApiError(429))
+        assert policy.is_retryable(_ApiError(503))
+        assert policy.is_retryable(httpx.ReadTimeout("timed out"))
+        assert policy.is_retryable(httpx.ConnectError("reset"))
+        assert not policy.is_retryable(_ApiError(400))
+        assert not policy.is_retryable(RuntimeError("FinishReason.RECITATION"))
+
+    def test_should_retry_stops_at_max_attempts(self):
+        """Test that the attempt budget is respected."""
+        policy = RetryPolicy(max_attempts=3)
+        assert policy.should_retry(_ApiError(429), 2)
+        assert not policy.should_retry(_ApiError(429), 3)
+
+    def test_backoff_is_exponential_with_full_jitter(self):
+        """Test that delays stay within base * 2^(attempt-1), capped at max_delay."""
+        policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+        for _ in range(50):
+            assert 0 <= policy.delay(1) <= 1.0
+            assert 0 <= policy.delay(3) <= 4.0
+            assert 0 <= policy.delay(10) <= 5.0
+
+    def test_retry_after_header_is_honored(self):
+        """Test that a Retry-After header overrides the backoff."""
+        err = _ApiError(429, headers={"retry-after": "7"})
+        assert retry_after(err) == 7.0
+        assert 7.0 <= RetryPolicy(max_delay=1.0).delay(1, err) <= 8.0
+
+    def test_retry_info_delay_is_honored(self):
+        """Test that a google.rpc.RetryInfo retryDelay in the error details is used."""
+        details = {
+            "error": {
+                "code": 429,
+                "details": [
+                    {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "12s"}
+                ],
+            }
+        }
+        assert retry_after(_ApiError(429, details=details)) == 12.0
+        assert retry_after(_ApiError(429)) is None
+
+    def test_policy_from_env(self, monkeypatch):
+        """Test environment configuration."""
+        monkeypatch.setenv("GEMINI_MAX_ATTEMPTS", "2")
+        monkeypatch.setenv("GEMINI_RETRY_BASE_DELAY", "0.5")
+        monkeypatch.setenv("GEMINI_RETRY_MAX_DELAY", "10")
+        expected = RetryPolicy(max_attempts=2, base_delay=0.5, max_delay=10.0)
+        assert retry_policy_from_env() == expected
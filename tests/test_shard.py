@@ -0,0 +1,162 @@
+"""Tests for page-range selection, sharding and shard merging."""
+
+import json
+import tempfile
+from pathlib import Path
+
+from unittest.mock import patch
+
+import fitz
+import pytest
+
+from poc_pdf_to_md.engine import convert_to_markdown, merge_shards, phase1_parse_pdf
+from poc_pdf_to_md.shard import parse_page_ranges, parse_shard, select_pages
+
+
+def _mock_page_markdown(*, page_image_path, **_kwargs):
+    return f"md {int(page_image_path.stem.rsplit('_', 1)[1])}"
+
+
+class TestParsePageRanges:
+    """Test page range parsing."""
+
+    def test_ranges_and_single_pages(self):
+        """Test mixed ranges, single pages and open ends."""
+        assert parse_page_ranges("1-3,5", 10) == [0, 1, 2, 4]
+        assert parse_page_ranges("8-", 10) == [7, 8, 9]
+        assert parse_page_ranges("-2", 10) == [0, 1]
+        assert parse_page_ranges("3,1-2,3", 10) == [0, 1, 2]
+
+    def test_out_of_bounds_raises(self):
+        """Test that ranges outside the document raise."""
+        with pytest.raises(ValueError, match="out of bounds"):
+            parse_page_ranges("5-12", 10)
+        with pytest.raises(ValueError, match="out of bounds"):
+            parse_page_ranges("0", 10)
+
+    def test_invalid_spec_raises(self):
+        """Test that malformed specs raise."""
+        with pytest.raises(ValueError, match="Invalid page range"):
+            parse_page_ranges("a-b", 10)
+
+
+class TestShardSelection:
+    """Test shard spec parsing and page selection."""
+
+    def test_parse_shard(self):
+        """Test i/N parsing and validation."""
+        assert parse_shard("0/4") == (0, 4)
+        with pytest.raises(ValueError):
+            parse_shard("4/4")
+        with pytest.raises(ValueError):
+            parse_shard("1")
+
+    def test_shards_are_contiguous_and_cover_all_pages(self):
+        """Test that N shards partition the pages into contiguous runs."""
+        shards = [select_pages(range(10), shard=(i, 3)) for i in range(3)]
+        assert shards == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+
+    def test_range_then_shard(self):
+        """Test that the range filter is applied before sharding."""
+        assert select_pages(range(10), "1-4", (1, 2), 10) == [2, 3]
+
+    def test_range_respects_available_pages(self):
+        """Test selection against a partial parse result."""
+        assert select_pages([4, 5, 6], "1-5", None, 10) == [4]
+
+
+class TestMergeShards:
+    """Test Phase 1 sharding and merging shard outputs."""
+
+    temp_dir: Path
+    pdf_path: Path
+    prompt_file: Path
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.pdf_path = self.temp_dir / "doc.pdf"
+        pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 20, 10), 0)
+        pix.clear_with(128)
+        doc = fitz.open()
+        for i in range(5):
+            page = doc.new_page()
+            page.insert_text((72, 72), f"Page {i}", fontsize=20)
+            page.insert_image(
+                fitz.Rect(100, 100 + i * 10, 200, 150 + i * 10), stream=pix.tobytes("png")
+            )
+        doc.save(str(self.pdf_path))
+        doc.close()
+        self.prompt_file = self.temp_dir / "prompt.md"
+        self.prompt_file.write_text("Convert this page to Markdown.", encoding="utf-8")
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        import shutil
+        if self.temp_dir.exists():
+            shutil.rmtree(self.temp_dir)
+
+    def _run_shard(self, index: int) -> Path:
+        """Run both phases of the README workflow with --shard index/2."""
+        shard_dir = self.temp_dir / f"shard_{index}"
+        parse_path = phase1_parse_pdf(
+            str(self.pdf_path), shard_dir, overwrite=True, shard=(index, 2)
+        )
+        with patch("poc_pdf_to_md.engine.generate_page_markdown", side_effect=_mock_page_markdown):
+            convert_to_markdown(
+                str(parse_path), shard_dir, "test-model", str(self.prompt_file), shard=(index, 2)
+            )
+        return shard_dir
+
+    def test_phase2_shard_matches_phase1_shard(self):
+        """Test that Phase 2 with the same shard converts every page of the Phase 1 shard."""
+        for index, expected in ((0, [0, 1, 2]), (1, [3, 4])):
+            shard_dir = self._run_shard(index)
+            pages = sorted(p.name for p in (shard_dir / "phase2" / "pages").glob("page_*.md"))
+            assert pages == [f"page_{i:04d}.md" for i in expected]
+
+    def test_phase1_shard_records_page_indices(self):
+        """Test that a shard only processes and records its own pages."""
+        shard_dir = self.temp_dir / "shard"
+        parse_path = phase1_parse_pdf(
+            str(self.pdf_path), shard_dir, overwrite=True, pages_spec="2-4", shard=(1, 2)
+        )
+        parse_result = json.loads(parse_path.read_text(encoding="utf-8"))
+        assert parse_result["total_pages"] == 5
+        assert parse_result["page_indices"] == [3]
+        assert {b["page_index"] for b in parse_result["blocks"]} == {3}
+
+    def test_merge_renumbers_blocks_and_combines_markdown(self):
+        """Test that merged output equals a full run with renumbered blocks."""
+        shard_dirs = [self._run_shard(0), self._run_shard(1)]
+        out_dir = self.temp_dir / "merged"
+
+        merged = merge_shards(shard_dirs, out_dir, overwrite=True)
+
+        parse_result = json.loads(merged["parse_result_path"].read_text(encoding="utf-8"))
+        assert "page_indices" not in parse_result  # merged result covers every page
+        assert [b["blockIndex"] for b in parse_result["blocks"]] == list(range(10))
+        page_images = [b for b in parse_result["blocks"] if b["type"] == "page_image"]
+        assert [b["page_index"] for b in page_images] == list(range(5))
+        for block in parse_result["blocks"]:
+            assert (out_dir / block["imagePath"]).exists()
+
+        assert merged["missing_pages"] == []
+        content = merged["output_md_path"].read_text(encoding="utf-8")
+        assert content == "\n\n---\n\n".join(f"md {i}" for i in range(5)) + "\n"
+
+    def test_merge_reports_missing_phase2_pages(self):
+        """Test that missing Phase 2 pages prevent the final Markdown."""
+        shard_dirs = [self._run_shard(0), self._run_shard(1)]
+        (shard_dirs[1] / "phase2" / "pages" / "page_0004.md").unlink()
+
+        merged = merge_shards(shard_dirs, self.temp_dir / "merged", overwrite=True)
+
+        assert merged["missing_pages"] == [4]
+        assert merged["output_md_path"] is None
+
+    def test_merge_rejects_overlapping_shards(self):
+        """Test that the same page in two shards is an error."""
+        shard_dir = self._run_shard(0)
+        with pytest.raises(ValueError, match="appears in both"):
+            merge_shards([shard_dir, shard_dir], self.temp_dir / "merged", overwrite=True)
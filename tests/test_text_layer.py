@@ -0,0 +1,76 @@
+"""Tests for text-layer analysis, local Markdown conversion and routing."""
+
+import fitz
+
+from poc_pdf_to_md.text_layer import analyze_text_layer, route_page
+
+_BODY = (
+    "Born-digital documents carry a text layer that can be converted without a model. "
+    "This paragraph is long enough to make the page qualify for the local fast path."
+)
+
+
+def _text_page(doc: fitz.Document) -> fitz.Page:
+    page = doc.new_page()
+    page.insert_text((72, 72), "Annual Report", fontsize=24)
+    page.insert_text((72, 110), "Overview", fontsize=15)
+    page.insert_textbox(fitz.Rect(72, 130, 520, 260), _BODY, fontsize=11)
+    page.insert_textbox(fitz.Rect(72, 270, 520, 330), "- first point\n- second point", fontsize=11)
+    page.insert_text((290, 800), "3", fontsize=9)
+    return page
+
+
+class TestAnalyzeTextLayer:
+    """Test feature extraction and local Markdown conversion."""
+
+    doc: fitz.Document
+
+    def setup_method(self):
+        """Setup test environment."""
+        self.doc = fitz.open()
+
+    def teardown_method(self):
+        """Cleanup test environment."""
+        self.doc.close()
+
+    def test_plain_text_page_converts_locally(self):
+        """Test headings by font size, joined paragraph lines, lists and dropped page numbers."""
+        features, markdown = analyze_text_layer(_text_page(self.doc))
+
+        assert features["body_size"] == 11.0
+        assert features["headings"] == 2
+        assert features["figures"] == 0
+        blocks = markdown.split("\n\n")
+        assert blocks[0] == "# Annual Report"
+        assert blocks[1] == "## Overview"
+        assert blocks[2] == _BODY
+        assert blocks[3] == "- first point\n- second point"
+        assert len(blocks) == 4
+        assert route_page(features) == ("local", "clean_text_layer")
+
+    def test_table_like_page_goes_to_model(self):
+        """Test that ruled grids are routed to the model."""
+        page = _text_page(self.doc)
+        for i in range(8):
+            page.draw_line((72, 400 + i * 20), (520, 400 + i * 20))
+        features, _ = analyze_text_layer(page)
+        assert route_page(features) == ("model", "table_like")
+
+    def test_figures_and_sparse_pages_go_to_model(self):
+        """Test that embedded images, large shapes and short pages are routed to the model."""
+        features, _ = analyze_text_layer(_text_page(self.doc), embedded_images=1)
+        assert route_page(features) == ("model", "figures")
+
+        page = _text_page(self.doc)
+        page.draw_rect(fitz.Rect(72, 400, 400, 700), color=(0, 0, 0), fill=(0.8, 0.8, 1))
+        features, _ = analyze_text_layer(page)
+        assert route_page(features) == ("model", "figures")
+
+        page = self.doc.new_page()
+        page.insert_text((72, 72), "Short note", fontsize=11)
+        features, _ = analyze_text_layer(page)
+        assert route_page(features) == ("model", "too_little_text")
+
+    def test_missing_text_layer_goes_to_model(self):
+        """Test routing for parse results without text-layer features."""
+        assert route_page(None) == ("model", "no_text_layer")